@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк чтения DBF: построчный dbfread + RelaxedFieldParser против колоночного ColumnarDBF.
+
+Читаются только колонки, настроенные для формы в config.yaml (item/value/bank/ap).
+Без --file генерируется синтетический файл 0409101 (NUL-паддинг в IITG).
+
+Примеры:
+    python benchmarks/bench_dbf_reader.py --file archive/012024B1.DBF
+    python benchmarks/bench_dbf_reader.py --banks 350 --items 1500
+"""
+import argparse
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from dbfread import DBF  # noqa: E402
+from src.db import load_config  # noqa: E402
+from src.dbf_reader import ColumnarDBF, RelaxedFieldParser  # noqa: E402
+from src.import_dbf import _to_float  # noqa: E402
+
+
+def write_synthetic_101(path, banks, items, seed=42):
+    """Пишет DBF в раскладке 0409101: REGN, PLAN, NUM_SC, A_P, IITG (NUL-паддинг)."""
+    rnd = random.Random(seed)
+    fields = [("REGN", "N", 4, 0), ("PLAN", "C", 1, 0), ("NUM_SC", "C", 5, 0), ("A_P", "C", 1, 0), ("IITG", "N", 16, 2)]
+    reclen = 1 + sum(f[2] for f in fields)
+    headerlen = 32 + 32 * len(fields) + 1
+    with open(path, "wb") as f:
+        f.write(struct.pack("<BBBBLHH20x", 3, 124, 1, 1, banks * items, headerlen, reclen))
+        for name, typ, length, dec in fields:
+            f.write(struct.pack("<11scLBB14x", name.encode("ascii"), typ.encode("ascii"), 0, length, dec))
+        f.write(b"\r")
+        codes = [f"{20000 + i * 7:05d}"[:5] for i in range(items)]
+        for b in range(banks):
+            regn = f"{1000 + b:4d}".encode()
+            for code in codes:
+                value = f"{rnd.uniform(-1e9, 1e9):.2f}".encode().ljust(16, b"\x00")
+                f.write(b" " + regn + b"A" + code.encode() + rnd.choice(b"12").to_bytes(1, "little") + value)
+        f.write(b"\x1a")
+
+
+def read_rowwise(path, conf):
+    enc = conf.get("encoding", "cp866")
+    out = []
+    for rec in DBF(path, encoding=enc, char_decode_errors="ignore", parserclass=RelaxedFieldParser):
+        out.append((rec.get(conf["bank_field"]), rec.get(conf["item_field"]), rec.get(conf.get("ap_field")),
+                    _to_float(rec.get(conf["value_field"]), enc)))
+    return out
+
+
+def read_columnar(path, conf):
+    enc = conf.get("encoding", "cp866")
+    with ColumnarDBF(path, encoding=enc, char_decode_errors="ignore") as t:
+        values, present = t.floats(conf["value_field"], lambda v: _to_float(v, enc))
+        banks = t.values(conf["bank_field"])
+        items = t.values(conf["item_field"])
+        aps = t.values(conf["ap_field"]) if conf.get("ap_field") else [None] * len(t)
+        return [(b, i, a, float(v) if ok else None)
+                for b, i, a, v, ok in zip(banks.tolist(), items.tolist(), list(aps), values.tolist(), present.tolist())]
+
+
+def _timed(fn, *args, repeat=3):
+    best, result = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, result
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Бенчмарк чтения DBF")
+    ap.add_argument("--file", help="DBF для замера (по умолчанию — синтетический 0409101)")
+    ap.add_argument("--form", default="0409101", help="Код формы из config.yaml")
+    ap.add_argument("--banks", type=int, default=350)
+    ap.add_argument("--items", type=int, default=1000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    conf = (load_config().get("forms") or {})[args.form]
+    tmp = None
+    path = args.file
+    if not path:
+        fd, tmp = tempfile.mkstemp(suffix=".dbf", prefix="bench_101_")
+        os.close(fd)
+        write_synthetic_101(tmp, args.banks, args.items)
+        path = tmp
+    try:
+        size_mb = os.path.getsize(path) / 1e6
+        t_row, rows_a = _timed(read_rowwise, path, conf, repeat=args.repeat)
+        t_col, rows_b = _timed(read_columnar, path, conf, repeat=args.repeat)
+        n = len(rows_a)
+        print(f"Файл: {path} ({size_mb:.1f} МБ, записей: {n})")
+        print(f"dbfread построчно: {t_row:.3f} с ({n / t_row:,.0f} записей/с)")
+        print(f"ColumnarDBF:       {t_col:.3f} с ({n / t_col:,.0f} записей/с)")
+        print(f"Ускорение: x{t_row / t_col:.1f}; результаты совпадают: {rows_a == rows_b}")
+    finally:
+        if tmp:
+            os.remove(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк формул indicators.yaml: _eval_formula (ast.parse + _SafeEvaluator
+на каждое вычисление) против скомпилированных вычислителей (compile_formula_code)
+и матричного расчёта по всем наборам сразу (_FormulaMatrix).
+
+Наборы переменных строятся из имён, встречающихся в формулах (часть имён
+пропускается, часть значений — нули, чтобы проверить деление на ноль).
+Результаты сверяются с _SafeEvaluator с относительным допуском: линейные
+формулы после исключения общих подвыражений суммируются в другом порядке. Отдельно замеряется подготовка набора
+формул: компиляция без кэша и загрузка из дискового кэша.
+
+Пример:
+    python benchmarks/bench_formulas.py --pairs 2000
+"""
+import argparse
+import ast
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from src import indicators  # noqa: E402
+from src.indicators import (FormulaVariables, _eval_formula, _compile_indicators_file,  # noqa: E402
+                            _compile_formula_matrix, _read_indicators_yaml)
+
+INDICATORS_PATH = os.path.join(indicators.CFG_DIR, "indicators.yaml")
+
+
+def _variable_sets(formulas, pairs, seed=42):
+    names = sorted({n.id for expr in formulas.values() for n in ast.walk(ast.parse(expr, mode="eval"))
+                    if isinstance(n, ast.Name) and n.id not in formulas})
+    rnd = random.Random(seed)
+    sets = []
+    for _ in range(pairs):
+        values = {}
+        for name in names:
+            r = rnd.random()
+            if r < 0.1:
+                continue
+            values[name] = 0.0 if r < 0.15 else round(rnd.uniform(-1e9, 1e9), 2)
+        sets.append(values)
+    return sets
+
+
+def _same(a, b, rel=0.0):
+    if a is None or b is None:
+        return a is None and b is None
+    return a == b or abs(a - b) <= rel * max(abs(a), abs(b))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Микробенчмарк вычисления формул indicators.yaml")
+    ap.add_argument("--pairs", type=int, default=2000, help="Наборов переменных (пар банк×период)")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    formulas = _read_indicators_yaml(INDICATORS_PATH)
+    sets = _variable_sets(formulas, args.pairs)
+
+    # Подготовка набора: компиляция (пустой кэш) и повторная загрузка из кэша
+    indicators.FORMULA_CACHE_DIR = tempfile.mkdtemp(prefix="finstat_formulas_")
+    t0 = time.perf_counter()
+    compiled = _compile_indicators_file(INDICATORS_PATH)
+    t_compile = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    compiled = _compile_indicators_file(INDICATORS_PATH)
+    t_cached = time.perf_counter() - t0
+    matrix_formulas = _compile_formula_matrix(INDICATORS_PATH)
+
+    # Ссылки на индикаторы и частичные суммы: значения кладутся в переменные в порядке вычисления
+    ids = list(formulas)
+    order = list(compiled)
+
+    def run_interpreted():
+        out = []
+        for values in sets:
+            variables = dict(values)
+            for ind_id in order:
+                if ind_id in formulas:
+                    variables[ind_id] = _eval_formula(formulas[ind_id], variables)
+            out.append([variables[ind_id] for ind_id in ids])
+        return out
+
+    def run_compiled():
+        out = []
+        for values in sets:
+            variables = FormulaVariables(values)
+            for ind_id, evaluate in compiled.items():
+                variables[ind_id] = evaluate(variables)
+            out.append([variables[ind_id] for ind_id in ids])
+        return out
+
+    def run_matrix():
+        columns = matrix_formulas.columns
+        matrix = np.array([[values.get(name, 0.0) for name in columns] for values in sets]).reshape(len(sets), len(columns))
+        values = matrix_formulas.evaluate(matrix)
+        return np.where(np.isnan(values), None, values).tolist()
+
+    timings = {}
+    results = {}
+    for name, fn in (("_SafeEvaluator", run_interpreted), ("compiled", run_compiled), ("matrix", run_matrix)):
+        best = None
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            results[name] = fn()
+            dt = time.perf_counter() - t0
+            best = dt if best is None else min(best, dt)
+        timings[name] = best
+
+    mismatches = sum(not _same(a, b, rel=1e-9) for ra, rb in zip(results["_SafeEvaluator"], results["compiled"])
+                     for a, b in zip(ra, rb))
+    mismatches += sum(not _same(a, b, rel=1e-9) for ra, rb in zip(results["_SafeEvaluator"], results["matrix"])
+                      for a, b in zip(ra, rb))
+    evals = len(sets) * len(formulas)
+    print(f"Формул: {len(formulas)}, наборов: {len(sets)}, вычислений: {evals:,}")
+    print(f"  компиляция набора      {t_compile * 1e3:8.2f} мс; из дискового кэша {t_cached * 1e3:.2f} мс")
+    for name, seconds in timings.items():
+        print(f"  {name:<22} {seconds:8.3f} с ({seconds / evals * 1e6:.2f} мкс на формулу)")
+    print(f"  ускорение              x{timings['_SafeEvaluator'] / timings['compiled']:.1f} (compiled), "
+          f"x{timings['_SafeEvaluator'] / timings['matrix']:.1f} (matrix)")
+    print(f"  расхождений            {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
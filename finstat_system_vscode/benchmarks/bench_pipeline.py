@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Сквозной бенчмарк конвейера на синтетических данных (benchmarks/synth_dataset.py).
+
+Во временном каталоге генерируется набор ZIP/DBF, создаётся отдельная БД и по
+очереди замеряются этапы: import_all_dbf, calculate_indicators,
+calculate_indicator_changes, classify_all, make_report и llm_analyze_all.
+LLM подменяется локальным mock-провайдером (ответ — детерминированный JSON,
+задержка --llm-latency), сеть и ключи не нужны. Рабочие файлы проекта
+(input/, archive/, data/) не затрагиваются.
+
+Результат пишется в JSON (коммит, масштаб, время этапов, объёмы таблиц);
+--compare сравнивает с прошлым прогоном и печатает изменение по этапам;
+--backend duckdb прогоняет тот же конвейер на встроенной DuckDB.
+
+Примеры:
+    python benchmarks/bench_pipeline.py --banks 100 --periods 12 --items 300
+    python benchmarks/bench_pipeline.py --backend duckdb
+    python benchmarks/bench_pipeline.py --compare benchmarks/results/pipeline_abc1234_20240101_120000.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from benchmarks.synth_dataset import generate_dataset  # noqa: E402
+from src import import_dbf, llm_module  # noqa: E402
+from src.db import init_db, connect  # noqa: E402
+from src.indicators import calculate_indicators, calculate_indicator_changes  # noqa: E402
+from src.report_xls import make_report  # noqa: E402
+from src.rules_engine import classify_all  # noqa: E402
+
+RESULTS_DIR = os.path.join(BASE_DIR, "benchmarks", "results")
+STATUSES = ("Green", "Yellow", "Red")
+
+
+class _MockResponses:
+    """Замена client.responses: возвращает JSON-ответ в формате, который ждёт llm_module."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def create(self, model, input, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        digest = hashlib.md5(input.encode("utf-8")).digest()
+        answer = {"status": STATUSES[digest[0] % len(STATUSES)],
+                  "summary": "Синтетический ответ для бенчмарка", "risks": [], "recommendations": []}
+        return SimpleNamespace(output_text=json.dumps(answer, ensure_ascii=False))
+
+
+def _mock_llm(latency, logs_dir):
+    """Подменяет провайдера LLM на mock; возвращает (mock, функция восстановления)."""
+    responses = _MockResponses(latency)
+    saved = {k: getattr(llm_module, k) for k in ("load_config", "init_provider", "preflight", "LLM_LOGS_DIR")}
+
+    def _config():
+        cfg = dict(saved["load_config"]() or {})
+        cfg["llm"] = {**(cfg.get("llm") or {}), "provider": "openai", "model": "mock",
+                      "bank_limit": 0, "max_banks": 0, "dry_run": False, "strict_cache": False}
+        return cfg
+
+    llm_module.load_config = _config
+    llm_module.init_provider = lambda provider, llm_cfg, model, timeout_sec: (
+        SimpleNamespace(responses=responses), None, model)
+    llm_module.preflight = lambda *args, **kwargs: (True, "mock")
+    llm_module.LLM_LOGS_DIR = logs_dir
+
+    def restore():
+        for k, v in saved.items():
+            setattr(llm_module, k, v)
+    return responses, restore
+
+
+def _git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BASE_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except Exception:
+        return "unknown"
+
+
+def _table_counts(conn):
+    counts = {}
+    for table in ("raw_values", "indicator_values", "algo_classifications", "llm_classifications", "banks"):
+        try:
+            counts[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        except Exception:
+            counts[table] = None
+    return counts
+
+
+def run_pipeline(workdir, banks, periods, items, seed=42, workers=None, llm_latency=0.0, layout="zip", profile=None,
+                 backend="sqlite"):
+    """Генерирует набор в workdir и прогоняет конвейер. Возвращает словарь результата."""
+    input_dir = os.path.join(workdir, "input")
+    archive_dir = os.path.join(workdir, "archive")
+    os.makedirs(archive_dir, exist_ok=True)
+
+    t0 = time.perf_counter()
+    files = generate_dataset(input_dir, banks=banks, periods=periods, items=items, seed=seed, layout=layout)
+    t_generate = time.perf_counter() - t0
+    input_mb = sum(os.path.getsize(p) for p in files) / 1e6
+
+    # Пути абсолютные: os.path.join(BASE_DIR, ...) в import_dbf их не меняет
+    saved_folders = {k: import_dbf.CFG.get(k) for k in ("input_folder", "archive_folder")}
+    import_dbf.CFG["input_folder"], import_dbf.CFG["archive_folder"] = input_dir, archive_dir
+    responses, restore_llm = _mock_llm(llm_latency, os.path.join(workdir, "llm_logs"))
+    db_file = os.path.join(workdir, "finstat.duckdb" if backend == "duckdb" else "finstat.db")
+    conn = connect(f"{backend}:///{db_file}", profile)
+    stages = [
+        ("import_all_dbf", lambda: import_dbf.import_all_dbf(conn, workers=workers)),
+        ("calculate_indicators", lambda: calculate_indicators(conn)),
+        ("calculate_indicator_changes", lambda: calculate_indicator_changes(conn)),
+        ("classify_all", lambda: classify_all(conn)),
+        ("make_report", lambda: make_report(conn, period="latest", outfile=os.path.join(workdir, "report.xlsx"))),
+        ("llm_analyze_all", lambda: llm_module.llm_analyze_all(conn, period="latest")),
+    ]
+    timings = {}
+    try:
+        init_db(conn)
+        for name, stage in stages:
+            t0 = time.perf_counter()
+            stage()
+            timings[name] = round(time.perf_counter() - t0, 4)
+        counts = _table_counts(conn)
+    finally:
+        conn.close()
+        restore_llm()
+        import_dbf.CFG.update(saved_folders)
+
+    return {
+        "commit": _git_commit(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": {"banks": banks, "periods": periods, "items": items, "seed": seed,
+                  "workers": workers, "layout": layout, "llm_latency_s": llm_latency, "profile": profile,
+                  "backend": backend},
+        "input": {"files": len(files), "size_mb": round(input_mb, 2), "generate_s": round(t_generate, 4)},
+        "timings_s": timings,
+        "total_s": round(sum(timings.values()), 4),
+        "rows": counts,
+        "llm_calls": responses.calls,
+    }
+
+
+def compare(current, baseline):
+    """Печатает изменение времени по этапам относительно прошлого прогона."""
+    print(f"Сравнение с {baseline.get('commit')} ({baseline.get('started_at')}):")
+    if baseline.get("scale") != current.get("scale"):
+        print("  внимание: масштаб прогонов различается")
+    for stage, t_new in list(current["timings_s"].items()) + [("total", current["total_s"])]:
+        t_old = baseline.get("total_s") if stage == "total" else (baseline.get("timings_s") or {}).get(stage)
+        if not t_old:
+            print(f"  {stage:<28} {t_new:9.3f} с (нет в базовом прогоне)")
+            continue
+        delta = (t_new - t_old) / t_old * 100.0
+        print(f"  {stage:<28} {t_old:9.3f} → {t_new:9.3f} с ({delta:+.1f}%)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Сквозной бенчмарк конвейера на синтетических данных")
+    ap.add_argument("--banks", type=int, default=50)
+    ap.add_argument("--periods", type=int, default=12)
+    ap.add_argument("--items", type=int, default=200, help="Дополнительных статей на форму сверх словаря")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--layout", choices=("zip", "dbf"), default="zip")
+    ap.add_argument("--workers", type=int, default=None, help="Процессов импорта (по умолчанию import.workers)")
+    ap.add_argument("--profile", default=None, help="Профиль соединения из storage.profiles (по умолчанию без PRAGMA)")
+    ap.add_argument("--backend", choices=("sqlite", "duckdb"), default="sqlite", help="Хранилище БД (как схема db_url)")
+    ap.add_argument("--llm-latency", type=float, default=0.0, help="Задержка mock-ответа LLM, с")
+    ap.add_argument("--out", default=None, help="JSON с результатом (по умолчанию benchmarks/results/pipeline_<коммит>_<время>.json)")
+    ap.add_argument("--compare", default=None, help="JSON прошлого прогона для сравнения")
+    ap.add_argument("--keep", action="store_true", help="Не удалять временный каталог")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="finstat_bench_")
+    try:
+        result = run_pipeline(workdir, args.banks, args.periods, args.items, args.seed,
+                              args.workers, args.llm_latency, args.layout, args.profile, args.backend)
+    finally:
+        if args.keep:
+            print(f"Рабочий каталог: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    out = args.out
+    if not out:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        out = os.path.join(RESULTS_DIR, f"pipeline_{result['commit']}_{stamp}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    print(f"Масштаб: банков {args.banks}, периодов {args.periods}, статей +{args.items}; "
+          f"входных файлов {result['input']['files']} ({result['input']['size_mb']} МБ)")
+    for stage, seconds in result["timings_s"].items():
+        print(f"  {stage:<28} {seconds:9.3f} с")
+    print(f"  {'итого':<28} {result['total_s']:9.3f} с")
+    print(f"Результат: {out}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
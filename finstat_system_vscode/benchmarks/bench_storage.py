@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк раскладки хранения: прежние таблицы с TEXT-ключами против измерений
+с целочисленными ключами и фактов WITHOUT ROWID (raw_facts/indicator_facts).
+
+Синтетическая БД прежнего формата (банки × периоды × формы × статьи и
+индикаторы) заполняется напрямую, затем копия переводится migrate_db.
+Для обеих БД (после VACUUM) замеряются размер файла и время типовых
+выборок через raw_values/indicator_values (в новой раскладке — представления).
+
+Пример:
+    python benchmarks/bench_storage.py --banks 350 --periods 24 --items 600
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from src.db import migrate_db  # noqa: E402
+
+# Схема до перехода на целочисленные ключи (только таблицы, которые переносит migrate_db)
+LEGACY_SCHEMA_SQL = r"""
+CREATE TABLE banks (bank_id TEXT PRIMARY KEY, bank_name TEXT);
+CREATE TABLE forms (form_code TEXT PRIMARY KEY, form_name TEXT);
+CREATE TABLE raw_values (
+  bank_id TEXT NOT NULL, form_code TEXT NOT NULL, period TEXT NOT NULL,
+  item_code TEXT NOT NULL, value REAL,
+  PRIMARY KEY (bank_id, form_code, period, item_code),
+  FOREIGN KEY (bank_id) REFERENCES banks(bank_id) ON DELETE CASCADE
+);
+CREATE TABLE indicators (indicator_id TEXT PRIMARY KEY, name TEXT, formula TEXT, description TEXT);
+CREATE TABLE indicator_values (
+  bank_id TEXT NOT NULL, indicator_id TEXT NOT NULL, period TEXT NOT NULL, value REAL,
+  PRIMARY KEY (bank_id, indicator_id, period)
+);
+"""
+
+FORMS = ("0409101", "0409102", "0409802", "0409123")
+
+
+def build_legacy_db(path, banks, periods, items, indicators, seed=42):
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA_SQL)
+    bank_ids = [str(1000 + 7 * b) for b in range(banks)]
+    period_ids = [f"{2020 + m // 12:04d}-{m % 12 + 1:02d}-01" for m in range(periods)]
+    item_codes = [f"{10000 + 13 * k}{'AP'[k % 2]}" for k in range(items)]
+    conn.executemany("INSERT INTO banks VALUES(?,?)", [(b, f"Банк {b}") for b in bank_ids])
+    conn.executemany("INSERT INTO forms VALUES(?,NULL)", [(f,) for f in FORMS])
+    for period in period_ids:
+        conn.executemany("INSERT INTO raw_values VALUES(?,?,?,?,?)",
+                         ((b, f, period, i, round(rnd.uniform(-1e9, 1e9), 2))
+                          for b in bank_ids for f in FORMS for i in item_codes))
+    ind_ids = [f"QN{k}" for k in range(indicators)]
+    conn.executemany("INSERT INTO indicator_values VALUES(?,?,?,?)",
+                     ((b, d, p, rnd.uniform(-100, 100)) for b in bank_ids for d in ind_ids for p in period_ids))
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    return bank_ids, period_ids, ind_ids
+
+
+def _best(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return round(best, 4)
+
+
+def measure(path, bank_ids, period_ids, ind_ids, repeat=3, seed=7):
+    rnd = random.Random(seed)
+    pairs = [(rnd.choice(bank_ids), rnd.choice(period_ids)) for _ in range(200)]
+    conn = sqlite3.connect(path)
+    q = conn.execute
+    placeholders = ",".join("?" * min(9, len(ind_ids)))
+    queries = {
+        "full_scan": lambda: q("SELECT COUNT(*), SUM(value) FROM raw_values").fetchall(),
+        "group_by_pair": lambda: q("SELECT bank_id, period, COUNT(*) FROM raw_values GROUP BY bank_id, period").fetchall(),
+        "pair_lookup_x200": lambda: [q("SELECT form_code, item_code, value FROM raw_values WHERE bank_id=? AND period=?",
+                                       p).fetchall() for p in pairs],
+        "period_slice": lambda: q("SELECT * FROM raw_values WHERE period=?", (period_ids[-1],)).fetchall(),
+        "indicator_series": lambda: q(f"SELECT bank_id, indicator_id, period, value FROM indicator_values "
+                                      f"WHERE indicator_id IN ({placeholders})", ind_ids[:9]).fetchall(),
+    }
+    result = {"size_mb": round(os.path.getsize(path) / 1e6, 2),
+              "timings_s": {name: _best(fn, repeat) for name, fn in queries.items()}}
+    conn.close()
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Бенчмарк раскладки хранения raw_values/indicator_values")
+    ap.add_argument("--banks", type=int, default=100)
+    ap.add_argument("--periods", type=int, default=12)
+    ap.add_argument("--items", type=int, default=300, help="Статей на форму")
+    ap.add_argument("--indicators", type=int, default=40)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--out", default=None, help="Записать результат в JSON")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="finstat_storage_")
+    try:
+        legacy = os.path.join(workdir, "legacy.db")
+        keyed = os.path.join(workdir, "keyed.db")
+        t0 = time.perf_counter()
+        bank_ids, period_ids, ind_ids = build_legacy_db(legacy, args.banks, args.periods, args.items, args.indicators)
+        t_build = time.perf_counter() - t0
+        shutil.copy(legacy, keyed)
+        conn = sqlite3.connect(keyed)
+        t0 = time.perf_counter()
+        migrate_db(conn)
+        t_migrate = time.perf_counter() - t0
+        conn.close()
+        rows = args.banks * args.periods * args.items * len(FORMS)
+        result = {
+            "scale": {"banks": args.banks, "periods": args.periods, "items": args.items,
+                      "forms": len(FORMS), "indicators": args.indicators, "raw_rows": rows},
+            "build_s": round(t_build, 3),
+            "migrate_s": round(t_migrate, 3),
+            "legacy": measure(legacy, bank_ids, period_ids, ind_ids, args.repeat),
+            "keyed": measure(keyed, bank_ids, period_ids, ind_ids, args.repeat),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    old, new = result["legacy"], result["keyed"]
+    print(f"Строк raw_values: {rows:,}; миграция {result['migrate_s']:.2f} с")
+    print(f"  {'размер БД, МБ':<20} {old['size_mb']:10.2f} -> {new['size_mb']:10.2f}")
+    for name, t_old in old["timings_s"].items():
+        t_new = new["timings_s"][name]
+        print(f"  {name:<20} {t_old:10.4f} -> {t_new:10.4f} с (x{t_old / t_new if t_new else float('inf'):.2f})")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
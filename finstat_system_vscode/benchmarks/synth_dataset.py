@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Генератор синтетического набора данных ЦБ РФ для бенчмарков.
+
+Для каждой формы из config.yaml (0409101, 0409102, 0409802/0409803 с META,
+0409805, 0409123, 0409135_3) пишутся DBF в раскладке реальных файлов: имена
+по filename_patterns, поля item/value/bank/ap из секции forms, кодировка cp866,
+NUL-паддинг в IITG. Коды статей берутся из data_dictionary.csv (суффикс A/P
+переходит в A_P или в F802META/F803META) и дополняются «шумовыми» статьями.
+Значения — случайное блуждание по периодам вокруг масштаба банка, так что
+изменения за 1–6 месяцев и классификация получают правдоподобные данные.
+
+Раскладка --layout zip (по умолчанию): архив на форму и период
+(<форма>-<YYYYMM01>.zip), в архивах 0409802/0409803 — META, в архиве
+0409101 — справочник NAMES.DBF (REGN, NAME_B). --layout dbf — отдельные DBF.
+
+Пример:
+    python benchmarks/synth_dataset.py --out /tmp/synth --banks 100 --periods 12 --items 300
+"""
+import argparse
+import datetime
+import os
+import random
+import re
+import struct
+import sys
+import zipfile
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from src.db import load_config, load_data_dictionary  # noqa: E402
+from src.import_dbf import _detect_form_period  # noqa: E402
+
+FORMS = ("0409101", "0409102", "0409802", "0409803", "0409805", "0409123", "0409135_3")
+
+# Имя файла формы по году/месяцу (должно совпадать с filename_patterns в config.yaml)
+FILE_NAMES = {
+    "0409101": "{mm}{yyyy}B1.DBF",
+    "0409102": "{mm}{yyyy}_P1.DBF",
+    "0409802": "PK802{yy}{mm}.DBF",
+    "0409803": "PK803{yy}{mm}.DBF",
+    "0409805": "PN805{yy}{mm}.DBF",
+    "0409123": "{mm}{yyyy}_123D.DBF",
+    "0409135_3": "{mm}{yyyy}_135_3.DBF",
+}
+
+# Нормативы 0409805/0409135_3: (код, нижняя и верхняя граница значения, %)
+NORMATIVES = [("Н1.0", 9.0, 25.0), ("Н1.1", 6.0, 20.0), ("Н1.2", 7.0, 22.0), ("Н2", 40.0, 150.0),
+              ("Н3", 60.0, 200.0), ("Н4", 20.0, 110.0), ("Н6", 5.0, 24.0), ("Н7", 100.0, 700.0)]
+
+
+def write_dbf(fields, records, encoding="cp866", nul_pad=()):
+    """Собирает DBF (dBase III) в памяти. fields — [(имя, тип, длина, знаков)],
+    records — кортежи значений; None пишется пробелами."""
+    header_len = 32 + 32 * len(fields) + 1
+    record_len = 1 + sum(f[2] for f in fields)
+    today = datetime.date.today()
+    parts = [struct.pack("<BBBBLHH20x", 3, today.year - 1900, today.month, today.day,
+                         len(records), header_len, record_len)]
+    for name, typ, length, dec in fields:
+        parts.append(struct.pack("<11scLBB14x", name.encode("ascii"), typ.encode("ascii"), 0, length, dec))
+    parts.append(b"\r")
+    formats = []
+    for name, typ, length, dec in fields:
+        if typ == "N":
+            pad = (lambda s, n=length: s.ljust(n, b"\x00")[:n]) if name in nul_pad else (lambda s, n=length: s.rjust(n)[:n])
+            fmt = (lambda v, d=dec: f"{v:.{d}f}".encode("ascii")) if dec else (lambda v: str(int(v)).encode("ascii"))
+            formats.append((fmt, pad, length))
+        else:
+            formats.append((lambda v: v.encode(encoding), lambda s, n=length: s.ljust(n)[:n], length))
+    for rec in records:
+        parts.append(b" ")
+        for (fmt, pad, length), val in zip(formats, rec):
+            parts.append(b" " * length if val is None else pad(fmt(val)))
+    parts.append(b"\x1a")
+    return b"".join(parts)
+
+
+def _month_periods(start, count):
+    year, month = (int(x) for x in start.split("-")[:2])
+    out = []
+    for _ in range(count):
+        out.append((year, month))
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+    return out
+
+
+def _dictionary_items(dictionary, form_code):
+    """Коды статей формы из словаря без шаблонов вида 1XXXXA: [(код, 'A'|'P'|'')]."""
+    seen = {}
+    for (fcode, item), _ in dictionary.items():
+        if fcode != form_code or "X" in item.upper():
+            continue
+        m = re.match(r"^(.*\d)([AP])$", item)
+        code, ap = (m.group(1), m.group(2)) if m else (item, "")
+        if code and len(code) <= 10:
+            # Повтор кода с другим признаком (активно-пассивный счёт) — остаётся первый
+            seen.setdefault(code, ap)
+    return list(seen.items())
+
+
+class _Walk:
+    """Детерминированное случайное блуждание значений по (банк, статья) между периодами."""
+
+    def __init__(self, rnd):
+        self.rnd = rnd
+        self.state = {}
+
+    def next(self, key, base):
+        prev = self.state.get(key)
+        value = base * self.rnd.uniform(0.5, 1.5) if prev is None else prev * (1.0 + self.rnd.gauss(0.01, 0.05))
+        self.state[key] = value
+        return value
+
+
+class SyntheticDataset:
+    """Синтетический набор: банки, статьи по формам и генерация DBF за период."""
+
+    def __init__(self, banks=50, periods=12, items=200, start="2023-01", seed=42, missing=0.02):
+        self.cfg = load_config() or {}
+        self.forms_cfg = self.cfg.get("forms") or {}
+        self.rnd = random.Random(seed)
+        self.missing = missing
+        self.periods = _month_periods(start, periods)
+        self.banks = [1000 + 7 * b for b in range(banks)]
+        # Масштаб баланса банка — логнормальный (несколько крупных, много мелких)
+        self.scale = {b: self.rnd.lognormvariate(22.0, 1.5) for b in self.banks}
+        dictionary = load_data_dictionary()
+        self.items = {}
+        for form in ("0409101", "0409102", "0409802", "0409803", "0409123"):
+            known = _dictionary_items(dictionary, form)
+            if form == "0409803":
+                # В словаре нет кодов 0409803: берём часть строк 0409802
+                known = _dictionary_items(dictionary, "0409802")[:60]
+            filler = [(f"{90000 + k:05d}", "AP"[k % 2]) if form == "0409101" else (f"9{k:04d}", "A" if k % 2 else "P")
+                      for k in range(items)]
+            self.items[form] = known + filler
+        self.walk = _Walk(self.rnd)
+
+    def _value(self, form, bank, item, weight=1e-3):
+        if self.rnd.random() < self.missing:
+            return None
+        return round(self.walk.next((form, bank, item), self.scale[bank] * weight * self.rnd.uniform(0.1, 1.0)), 2)
+
+    def _ratio(self, bank, code, low, high):
+        return round(min(max(self.walk.next(("N", bank, code), self.rnd.uniform(low, high)), 0.0), high * 2), 2)
+
+    def form_files(self, year, month):
+        """{форма: [(имя файла, bytes)]} за период (включая META и NAMES.DBF)."""
+        names = {f: FILE_NAMES[f].format(yyyy=f"{year:04d}", yy=f"{year % 100:02d}", mm=f"{month:02d}") for f in FORMS}
+        out = {}
+        ap_code = {"A": "1", "P": "2", "": "3"}
+
+        recs = [(b, "A", code, ap_code[ap], self._value("0409101", b, code))
+                for b in self.banks for code, ap in self.items["0409101"]]
+        out["0409101"] = [(names["0409101"], write_dbf(
+            [("REGN", "N", 5, 0), ("PLAN", "C", 1, 0), ("NUM_SC", "C", 10, 0), ("A_P", "C", 1, 0), ("IITG", "N", 16, 2)],
+            recs, nul_pad=("IITG",)))]
+        out["0409101"].append(("NAMES.DBF", write_dbf(
+            [("REGN", "N", 5, 0), ("NAME_B", "C", 60, 0)],
+            [(b, f'АО "Синтетический банк N{b}"') for b in self.banks])))
+
+        recs = [(b, code, self._value("0409102", b, code, 1e-4)) for b in self.banks for code, _ in self.items["0409102"]]
+        out["0409102"] = [(names["0409102"], write_dbf(
+            [("REGN", "N", 5, 0), ("CODE", "C", 10, 0), ("SIM_ITOGO", "N", 16, 2)], recs))]
+
+        for form, meta_name in (("0409802", f"F802META_{year % 100:02d}{month:02d}.DBF"),
+                                ("0409803", f"F803META_{year % 100:02d}{month:02d}.DBF")):
+            items = self.items[form]
+            recs = [(b, code, self._value(form, b, code)) for b in self.banks for code, _ in items]
+            meta = [("АКТИВЫ" if ap == "A" else "ПАССИВЫ", code) for code, ap in items if ap]
+            out[form] = [(names[form], write_dbf(
+                [("REGN_GKO", "N", 5, 0), ("STR", "C", 10, 0), ("VSEGO", "N", 16, 2)], recs)),
+                (meta_name, write_dbf([("FSECTION", "C", 20, 0), ("FSTR", "C", 10, 0)], meta))]
+
+        recs = [(b, code, self._ratio(b, code, low, high)) for b in self.banks for code, low, high in NORMATIVES]
+        out["0409805"] = [(names["0409805"], write_dbf(
+            [("REGN_GKO", "N", 5, 0), ("NAME_NORM", "C", 10, 0), ("FAKT_ZN", "N", 10, 2)], recs))]
+
+        recs = [(b, code, self._value("0409123", b, code)) for b in self.banks for code, _ in self.items["0409123"]]
+        out["0409123"] = [(names["0409123"], write_dbf(
+            [("REGN", "N", 5, 0), ("C1", "C", 10, 0), ("C3", "N", 16, 2)], recs))]
+
+        recs = [(b, code, self._ratio(b, code, low, high)) for b in self.banks for code, low, high in NORMATIVES[:3]]
+        out["0409135_3"] = [(names["0409135_3"], write_dbf(
+            [("REGN", "N", 5, 0), ("C1_3", "C", 10, 0), ("C2_3", "N", 10, 2)], recs))]
+
+        # Имена должны распознаваться импортом как (форма, период)
+        for form, files in out.items():
+            detected = _detect_form_period(files[0][0], self.forms_cfg, "")
+            if detected[1:] != (form, f"{year:04d}-{month:02d}-01"):
+                raise RuntimeError(f"Имя {files[0][0]} не совпадает с filename_patterns формы {form}")
+        return out
+
+    def write(self, out_dir, layout="zip"):
+        """Пишет набор в out_dir. Возвращает список путей созданных файлов."""
+        os.makedirs(out_dir, exist_ok=True)
+        written = []
+        for year, month in self.periods:
+            for form, files in self.form_files(year, month).items():
+                if layout == "zip":
+                    path = os.path.join(out_dir, f"{form}-{year:04d}{month:02d}01.zip")
+                    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+                        for name, data in files:
+                            zf.writestr(name, data)
+                    written.append(path)
+                else:
+                    # Без архива META/NAMES не применяются: пишем только файлы форм
+                    name, data = files[0]
+                    path = os.path.join(out_dir, name)
+                    with open(path, "wb") as f:
+                        f.write(data)
+                    written.append(path)
+        return written
+
+
+def generate_dataset(out_dir, banks=50, periods=12, items=200, start="2023-01", seed=42, layout="zip"):
+    """Генерирует набор данных в out_dir; возвращает список созданных файлов."""
+    return SyntheticDataset(banks, periods, items, start, seed).write(out_dir, layout)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Генератор синтетических DBF/ZIP ЦБ РФ")
+    ap.add_argument("--out", required=True, help="Каталог для файлов (например, input/)")
+    ap.add_argument("--banks", type=int, default=50)
+    ap.add_argument("--periods", type=int, default=12, help="Число месяцев подряд")
+    ap.add_argument("--items", type=int, default=200, help="Дополнительных статей на форму сверх словаря")
+    ap.add_argument("--start", default="2023-01", help="Первый период YYYY-MM")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--layout", choices=("zip", "dbf"), default="zip")
+    args = ap.parse_args()
+    files = generate_dataset(args.out, args.banks, args.periods, args.items, args.start, args.seed, args.layout)
+    size_mb = sum(os.path.getsize(p) for p in files) / 1e6
+    print(f"Создано файлов: {len(files)} ({size_mb:.1f} МБ) в {args.out}")
+
+
+if __name__ == "__main__":
+    main()
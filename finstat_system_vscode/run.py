@@ -1,13 +1,15 @@
 import argparse
 import os
 from dotenv import load_dotenv
-from src.db import get_conn, init_db
-from src.import_dbf import import_all_dbf
-from src.indicators import calculate_indicators, calculate_indicator_changes
+from src.db import get_conn, init_db, migrate_db, finalize_bulk_load, check_query_plans, DB_PATH, DB_BACKEND
+from src.import_dbf import import_all_dbf, rehydrate_form, PROJECTION_MODES
+from src.indicators import update_indicators, formula_plan_report
+from src.indicator_cube import refresh_cube
 from src.rules_engine import classify_all
 from src.llm_module import llm_analyze_all
 from src.report_xls import make_report
 from src.data_viewer import main as data_viewer_main
+from src.watch import watch
 
 def main():
     # Подхватываем переменные окружения из .env (если есть)
@@ -23,9 +25,27 @@ def main():
     parser = argparse.ArgumentParser(description="Финансовая система анализа")
     sub = parser.add_subparsers(dest="cmd", required=True)
     sub.add_parser("init-db", help="Инициализировать БД")
+    p_migrate = sub.add_parser("migrate-db", help="Перевести существующую БД на целочисленные ключи (raw_facts/indicator_facts)")
+    p_migrate.add_argument("--no-vacuum", action="store_true", help="Не выполнять VACUUM после миграции")
+    p_plans = sub.add_parser("check-plans", help="Проверить планы типовых запросов (нет полного сканирования фактов)")
+    p_plans.add_argument("--db", action="store_true", help="Проверять рабочую БД (по умолчанию — пустую схему в памяти)")
     p_import = sub.add_parser("import", help="Импорт DBF из input/")
     p_import.add_argument("--all", action="store_true", help="Импортировать все новые файлы")
-    sub.add_parser("calc-indicators", help="Рассчитать индикаторы")
+    p_import.add_argument("--workers", type=int, default=None, help="Число процессов для распаковки/разбора DBF (по умолчанию import.workers из config.yaml)")
+    p_import.add_argument("--projection", choices=PROJECTION_MODES, default=None, help="Проекция по data_dictionary.csv: none | drop | side_store (по умолчанию import.projection)")
+    p_rehydrate = sub.add_parser("rehydrate", help="Повторно загрузить форму из archive/ (после расширения словаря)")
+    p_rehydrate.add_argument("--form", required=True, help="Код формы, например 0409101")
+    p_rehydrate.add_argument("--period", default=None, help="Только период YYYY-MM-DD")
+    p_rehydrate.add_argument("--projection", choices=PROJECTION_MODES, default=None, help="Режим проекции (по умолчанию import.projection)")
+    p_watch = sub.add_parser("watch", help="Следить за input/: импорт новых файлов и пересчёт затронутых пар")
+    p_watch.add_argument("--interval", type=float, default=None, help="Период опроса папки, с (по умолчанию watch.interval)")
+    p_watch.add_argument("--settle-polls", type=int, default=None, help="Сколько опросов подряд файл должен быть неизменным")
+    p_watch.add_argument("--workers", type=int, default=None, help="Число процессов импорта (как у import)")
+    p_watch.add_argument("--once", action="store_true", help="Завершиться после первого пакета")
+    p_calc = sub.add_parser("calc-indicators", help="Рассчитать индикаторы (только новые пары и изменённые формулы)")
+    p_calc.add_argument("--full", action="store_true", help="Пересчитать все индикаторы по всем парам банк×период")
+    p_calc.add_argument("--workers", type=int, default=1, help="Число процессов расчёта (банки делятся на шарды; только SQLite)")
+    sub.add_parser("formula-plan", help="Показать общие подвыражения формул indicators.yaml и экономию слагаемых")
     sub.add_parser("classify", help="Алгоритмическая классификация")
     p_llm = sub.add_parser("llm-analyze", help="LLM-анализ (кэширование промптов)")
     p_llm.add_argument("--period", default="latest", help="Дата YYYY-MM-DD или 'latest' (берется ближайший доступный период ≤ даты)")
@@ -41,17 +61,45 @@ def main():
     args = parser.parse_args()
 
     if args.cmd == "init-db":
-        conn = get_conn(); init_db(conn); print("БД инициализирована.")
+        conn = get_conn("bulk_load"); init_db(conn); print("БД инициализирована.")
+    elif args.cmd == "migrate-db":
+        size_before = os.path.getsize(DB_PATH) if os.path.exists(DB_PATH) else 0
+        conn = get_conn("bulk_load")
+        converted, applied = migrate_db(conn, vacuum=not args.no_vacuum)
+        conn.close()
+        if converted:
+            print(f"БД переведена на целочисленные ключи: {size_before / 1e6:.1f} МБ -> {os.path.getsize(DB_PATH) / 1e6:.1f} МБ")
+        if applied:
+            print(f"Применены миграции схемы: {', '.join(map(str, applied))}")
+        elif not converted:
+            print("Миграция не требуется: схема БД актуальна.")
+    elif args.cmd == "check-plans":
+        if args.db and DB_BACKEND != "sqlite":
+            raise SystemExit(f"check-plans --db поддерживается только для SQLite (db_url: {DB_BACKEND})")
+        failures = check_query_plans(get_conn("read_mostly") if args.db else None)
+        for name, plan in failures.items():
+            print(f"{name}: полное сканирование таблицы фактов")
+            for line in plan:
+                print(f"    {line}")
+        if failures:
+            raise SystemExit(1)
+        print("Планы типовых запросов в порядке.")
     elif args.cmd == "import":
-        conn = get_conn(); import_all_dbf(conn)
+        conn = get_conn("bulk_load"); import_all_dbf(conn, workers=args.workers, projection=args.projection); finalize_bulk_load(conn)
+    elif args.cmd == "rehydrate":
+        conn = get_conn("bulk_load"); rehydrate_form(conn, args.form, period=args.period, projection=args.projection); finalize_bulk_load(conn)
+    elif args.cmd == "watch":
+        conn = get_conn("concurrent"); watch(conn, interval=args.interval, settle_polls=args.settle_polls, workers=args.workers, once=args.once)
     elif args.cmd == "calc-indicators":
-        conn = get_conn(); calculate_indicators(conn); calculate_indicator_changes(conn)
+        conn = get_conn("bulk_load"); update_indicators(conn, full=args.full, workers=args.workers); refresh_cube(conn); finalize_bulk_load(conn)
+    elif args.cmd == "formula-plan":
+        print("\n".join(formula_plan_report()))
     elif args.cmd == "classify":
-        conn = get_conn(); classify_all(conn)
+        conn = get_conn("bulk_load"); classify_all(conn)
     elif args.cmd == "llm-analyze":
-        conn = get_conn(); llm_analyze_all(conn, period=args.period)
+        conn = get_conn("read_mostly"); llm_analyze_all(conn, period=args.period)
     elif args.cmd == "report":
-        conn = get_conn(); make_report(conn, period=args.period, outfile=args.outfile); print(f"Отчет сохранен: {args.outfile}")
+        conn = get_conn("read_mostly"); make_report(conn, period=args.period, outfile=args.outfile); print(f"Отчет сохранен: {args.outfile}")
     elif args.cmd == "view":
         import sys
         sys.argv = ["data_viewer", args.command]
@@ -7,7 +7,7 @@ import tempfile
 import shutil
 import subprocess
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, List, Optional, Tuple
 
 def _extract_rar(archive_path: str, extract_to: str) -> List[str]:
     """Извлечение RAR архива с помощью unar (macOS) или unrar (Linux)"""
@@ -110,6 +110,128 @@ def extract_archive(archive_path: str, extract_to: Optional[str] = None) -> tupl
     
     return dbf_files, temp_dir
 
+class ArchiveSource:
+    """
+    Доступ к членам архива (ZIP/RAR) без распаковки на диск.
+
+    ZIP читается через zipfile, RAR — через rarfile (потоковое чтение членов).
+    Если rarfile недоступен или не может прочитать архив, используется прежняя
+    распаковка во временную папку, которая удаляется в close().
+    """
+
+    def __init__(self, archive_path: str):
+        self.archive_path = archive_path
+        self._zip = None
+        self._rar = None
+        self._temp_dir = None
+        self._paths = {}
+        self._infos = {}
+        lower = archive_path.lower()
+        if lower.endswith('.zip'):
+            import zipfile
+            self._zip = zipfile.ZipFile(archive_path, 'r')
+            for info in self._zip.infolist():
+                if not info.is_dir():
+                    self._infos[info.filename] = info
+        elif lower.endswith('.rar'):
+            self._open_rar()
+        else:
+            raise ValueError(f"Неподдерживаемый тип архива: {archive_path}")
+
+    def _open_rar(self):
+        try:
+            import rarfile
+            rf = rarfile.RarFile(self.archive_path)
+            infos = {info.filename: info for info in rf.infolist() if not info.is_dir()}
+            # Проверяем, что бэкенд распаковки действительно доступен
+            for info in infos.values():
+                with rf.open(info) as fh:
+                    fh.read(1)
+                break
+            self._rar = rf
+            self._infos = infos
+            return
+        except Exception:
+            self._rar = None
+        # Фолбэк: распаковка во временную папку утилитами unar/unrar
+        self._temp_dir = tempfile.mkdtemp(prefix="finstat_extract_")
+        for path in _extract_rar(str(Path(self.archive_path).resolve()), self._temp_dir):
+            name = os.path.relpath(path, self._temp_dir)
+            self._paths[name] = path
+            self._infos[name] = None
+
+    def members(self) -> List[str]:
+        """Имена файлов-членов архива в порядке следования."""
+        return list(self._infos.keys())
+
+    def peek(self, name: str, size: int) -> bytes:
+        """Первые size байт члена архива (распаковывается только начало потока)."""
+        if self._zip is not None:
+            with self._zip.open(self._infos[name]) as fh:
+                return fh.read(size)
+        if self._rar is not None:
+            with self._rar.open(self._infos[name]) as fh:
+                return fh.read(size)
+        with open(self._paths[name], 'rb') as fh:
+            return fh.read(size)
+
+    def read(self, name: str) -> bytes:
+        """Полное содержимое члена архива в памяти."""
+        if self._zip is not None:
+            return self._zip.read(self._infos[name])
+        if self._rar is not None:
+            return self._rar.read(self._infos[name])
+        with open(self._paths[name], 'rb') as fh:
+            return fh.read()
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+        if self._rar is not None:
+            self._rar.close()
+            self._rar = None
+        if self._temp_dir:
+            cleanup_temp_dir(self._temp_dir)
+            self._temp_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def read_archive_members(archive_path: str,
+                         select: Callable[[str, Callable[[int], bytes]], bool]) -> Tuple[List[Tuple[str, bytes]], bool]:
+    """
+    Читает в память выбранные .dbf члены архива.
+
+    Args:
+        archive_path: путь к архиву
+        select: select(basename, peek) -> bool; peek(n) возвращает первые n байт члена
+
+    Returns:
+        (members, has_dbf):
+          - members: список (basename, bytes) выбранных членов в порядке архива
+          - has_dbf: были ли в архиве .dbf вообще (False — архив пуст или не читается)
+    """
+    members = []
+    has_dbf = False
+    try:
+        with ArchiveSource(archive_path) as src:
+            for name in src.members():
+                base = os.path.basename(name)
+                if not base.lower().endswith('.dbf'):
+                    continue
+                has_dbf = True
+                if select(base, lambda n, _name=name: src.peek(_name, n)):
+                    members.append((base, src.read(name)))
+    except Exception as e:
+        print(f"Ошибка чтения архива {archive_path}: {e}")
+    return members, has_dbf
+
 def cleanup_temp_dir(temp_dir: str):
     """Удаление временной папки"""
     if temp_dir and os.path.exists(temp_dir):
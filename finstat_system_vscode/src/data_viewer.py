@@ -5,7 +5,8 @@
 import argparse
 import sqlite3
 import pandas as pd
-from .db import get_conn
+from .db import get_conn, read_sql
+from .indicator_cube import open_cube
 
 def show_summary(conn):
     """Общая статистика по загруженным данным"""
@@ -14,24 +15,28 @@ def show_summary(conn):
     print("=" * 50)
     
     # Статистика по банкам
-    banks = pd.read_sql_query("SELECT COUNT(*) as count FROM banks", conn)
+    banks = read_sql(conn, "SELECT COUNT(*) as count FROM banks")
     print(f"Банков в системе: {banks.iloc[0]['count']}")
     
     # Статистика по формам отчетности
-    forms = pd.read_sql_query("SELECT COUNT(*) as count FROM forms", conn)
+    forms = read_sql(conn, "SELECT COUNT(*) as count FROM forms")
     print(f"Форм отчетности: {forms.iloc[0]['count']}")
     
     # Статистика по периодам
-    periods = pd.read_sql_query("SELECT COUNT(DISTINCT period) as count FROM raw_values", conn)
+    periods = read_sql(conn, "SELECT COUNT(DISTINCT period) as count FROM raw_values")
     print(f"Периодов данных: {periods.iloc[0]['count']}")
     
     # Статистика по записям
-    raw_count = pd.read_sql_query("SELECT COUNT(*) as count FROM raw_values", conn)
+    raw_count = read_sql(conn, "SELECT COUNT(*) as count FROM raw_values")
     print(f"Записей сырых данных: {raw_count.iloc[0]['count']}")
     
     # Статистика по индикаторам
-    ind_count = pd.read_sql_query("SELECT COUNT(*) as count FROM indicator_values", conn)
-    print(f"Рассчитанных индикаторов: {ind_count.iloc[0]['count']}")
+    cube = open_cube(conn)
+    if cube is not None:
+        print(f"Рассчитанных индикаторов: {int(cube.present.sum())}")
+    else:
+        ind_count = read_sql(conn, "SELECT COUNT(*) as count FROM indicator_values")
+        print(f"Рассчитанных индикаторов: {ind_count.iloc[0]['count']}")
 
 def show_banks(conn):
     """Список банков"""
@@ -39,7 +44,7 @@ def show_banks(conn):
     print("БАНКИ В СИСТЕМЕ")
     print("=" * 50)
     
-    df = pd.read_sql_query("""
+    df = read_sql(conn, """
         SELECT b.bank_id, b.bank_name, 
                COUNT(DISTINCT rv.period) as periods_count,
                COUNT(DISTINCT rv.form_code) as forms_count,
@@ -48,7 +53,7 @@ def show_banks(conn):
         LEFT JOIN raw_values rv ON b.bank_id = rv.bank_id
         GROUP BY b.bank_id, b.bank_name
         ORDER BY b.bank_id
-    """, conn)
+    """)
     
     if df.empty:
         print("Нет данных по банкам")
@@ -62,7 +67,7 @@ def show_forms(conn):
     print("ФОРМЫ ОТЧЕТНОСТИ")
     print("=" * 50)
     
-    df = pd.read_sql_query("""
+    df = read_sql(conn, """
         SELECT f.form_code, f.form_name,
                COUNT(DISTINCT rv.bank_id) as banks_count,
                COUNT(DISTINCT rv.period) as periods_count,
@@ -71,7 +76,7 @@ def show_forms(conn):
         LEFT JOIN raw_values rv ON f.form_code = rv.form_code
         GROUP BY f.form_code, f.form_name
         ORDER BY f.form_code
-    """, conn)
+    """)
     
     if df.empty:
         print("Нет данных по формам")
@@ -85,7 +90,7 @@ def show_periods(conn):
     print("ПЕРИОДЫ ДАННЫХ")
     print("=" * 50)
     
-    df = pd.read_sql_query("""
+    df = read_sql(conn, """
         SELECT period,
                COUNT(DISTINCT bank_id) as banks_count,
                COUNT(DISTINCT form_code) as forms_count,
@@ -93,7 +98,7 @@ def show_periods(conn):
         FROM raw_values
         GROUP BY period
         ORDER BY period DESC
-    """, conn)
+    """)
     
     if df.empty:
         print("Нет данных по периодам")
@@ -107,11 +112,11 @@ def show_ingestion_log(conn):
     print("ЖУРНАЛ ИМПОРТА ФАЙЛОВ")
     print("=" * 50)
     
-    df = pd.read_sql_query("""
+    df = read_sql(conn, """
         SELECT file_name, bank_id, form_code, period, rows_loaded, loaded_at
         FROM ingestion_log
         ORDER BY loaded_at DESC
-    """, conn)
+    """)
     
     if df.empty:
         print("Нет записей импорта")
@@ -148,7 +153,7 @@ def show_raw_data(conn, bank_id=None, form_code=None, period=None, limit=50):
         LIMIT {limit}
     """
     
-    df = pd.read_sql_query(query, conn, params=params)
+    df = read_sql(conn, query, params)
     
     if df.empty:
         print("Нет данных для отображения")
@@ -166,6 +171,16 @@ def show_indicators(conn, bank_id=None, period=None):
     print("РАССЧИТАННЫЕ ИНДИКАТОРЫ")
     print("=" * 50)
     
+    cube = open_cube(conn)
+    if cube is not None:
+        # Актуальный куб индикаторов: срез по банку/периоду без запроса к БД
+        df = cube.frame(bank_id or None, period or None)
+        if df.empty:
+            print("Нет рассчитанных индикаторов")
+            return
+        print(df.to_string(index=False))
+        return
+
     where_conditions = []
     params = []
     
@@ -185,7 +200,7 @@ def show_indicators(conn, bank_id=None, period=None):
         ORDER BY bank_id, period, indicator_id
     """
     
-    df = pd.read_sql_query(query, conn, params=params)
+    df = read_sql(conn, query, params)
     
     if df.empty:
         print("Нет рассчитанных индикаторов")
@@ -207,7 +222,7 @@ def main():
     
     args = parser.parse_args()
     
-    conn = get_conn()
+    conn = get_conn("read_mostly")
     
     try:
         if args.command == "summary":
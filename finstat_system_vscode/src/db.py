@@ -1,33 +1,229 @@
-import os, sqlite3, yaml, re
+import os, sqlite3, yaml, re, csv, hashlib
+from contextlib import contextmanager
+from . import duckdb_backend
 
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 CFG_PATH = os.path.join(BASE_DIR, "configs", "config.yaml")
+DICT_PATH = os.path.join(BASE_DIR, "configs", "data_dictionary.csv")
 DATA_DIR = os.path.join(BASE_DIR, "data")
-DB_PATH = os.path.join(DATA_DIR, "finstat.db")
+DEFAULT_DB_URL = "sqlite:///data/finstat.db"
 
-def get_conn():
-    os.makedirs(DATA_DIR, exist_ok=True)
-    return sqlite3.connect(DB_PATH)
+def parse_db_url(url: str):
+    """db_url -> (бэкенд, путь к файлу). Поддерживаются sqlite:///путь и duckdb:///путь;
+    относительный путь отсчитывается от корня проекта, ':memory:' — БД в памяти."""
+    m = re.match(r"^(sqlite|duckdb):///(.+)$", str(url or DEFAULT_DB_URL).strip())
+    if not m:
+        raise ValueError(f"Неподдерживаемый db_url: {url} (ожидается sqlite:///путь или duckdb:///путь)")
+    backend, path = m.group(1), m.group(2)
+    if path != ":memory:" and not os.path.isabs(path):
+        path = os.path.join(BASE_DIR, path)
+    return backend, path
+
+def _configured_db_url():
+    try:
+        with open(CFG_PATH, "r", encoding="utf-8") as f:
+            return (yaml.safe_load(f) or {}).get("db_url") or DEFAULT_DB_URL
+    except OSError:
+        return DEFAULT_DB_URL
+
+DB_URL = _configured_db_url()
+DB_BACKEND, DB_PATH = parse_db_url(DB_URL)
+
+def connect(url: str = None, profile: str = None):
+    """Соединение по db_url (по умолчанию — из config.yaml). Для SQLite profile —
+    имя профиля из storage.profiles; для DuckDB применяются настройки storage.duckdb."""
+    backend, path = parse_db_url(url or DB_URL)
+    if path != ":memory:":
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    if backend == "duckdb":
+        storage = (load_config() or {}).get("storage") or {}
+        conn = duckdb_backend.connect(path, storage.get("duckdb") or {})
+    else:
+        conn = sqlite3.connect(path)
+    if profile:
+        apply_profile(conn, profile)
+    return conn
+
+def get_conn(profile: str = None):
+    """Соединение с БД. profile — имя профиля из storage.profiles (config.yaml):
+    bulk_load (импорт, расчёты), read_mostly (отчёт, просмотр, LLM),
+    concurrent (параллельная работа этапов, watch). Без профиля — настройки SQLite по умолчанию."""
+    return connect(DB_URL, profile)
+
+def database_file(conn):
+    """Путь к файлу основной БД соединения; None — БД в памяти."""
+    for _, name, path in conn.execute("PRAGMA database_list").fetchall():
+        if name == "main" or is_duckdb(conn):
+            return path or None
+    return None
+
+def connect_readonly(path: str, profile: str = "read_mostly") -> sqlite3.Connection:
+    """Соединение SQLite только для чтения (mode=ro), например для процессов
+    параллельного расчёта. Из профиля берутся только PRAGMA, не требующие записи."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    apply_profile(conn, profile, only=("cache_size", "mmap_size", "temp_store", "busy_timeout"))
+    return conn
+
+def is_duckdb(conn) -> bool:
+    return getattr(conn, "backend", "sqlite") == "duckdb"
+
+def read_sql(conn, sql: str, params=()):
+    """pd.read_sql_query для обоих бэкендов (DuckDB отдаёт DataFrame колонками)."""
+    if is_duckdb(conn):
+        return conn.read_frame(sql, params)
+    import pandas as pd
+    return pd.read_sql_query(sql, conn, params=params or None)
+
+# PRAGMA профиля соединения: имя -> допустимые значения (None — целое число)
+_PROFILE_PRAGMAS = {
+    "journal_mode": ("delete", "truncate", "persist", "memory", "wal", "off"),
+    "synchronous": ("off", "normal", "full", "extra"),
+    "cache_size": None,
+    "mmap_size": None,
+    "temp_store": ("default", "file", "memory"),
+    "busy_timeout": None,
+}
+
+def connection_profile(name: str) -> dict:
+    profiles = ((load_config() or {}).get("storage") or {}).get("profiles") or {}
+    if name not in profiles:
+        raise ValueError(f"Неизвестный профиль соединения: {name} (есть: {', '.join(profiles) or 'нет'})")
+    return profiles[name] or {}
+
+def apply_profile(conn: sqlite3.Connection, profile: str, only=None):
+    """Выставляет PRAGMA профиля (journal_mode, synchronous, cache_size, mmap_size,
+    temp_store, busy_timeout) на соединении. only — выставить только эти PRAGMA.
+    Для DuckDB профили не применяются."""
+    if is_duckdb(conn):
+        return
+    settings = connection_profile(profile)
+    for pragma, allowed in _PROFILE_PRAGMAS.items():
+        value = settings.get(pragma)
+        if value is None or (only is not None and pragma not in only):
+            continue
+        if allowed is None:
+            value = int(value)
+        else:
+            value = str(value).lower()
+            if value not in allowed:
+                raise ValueError(f"Недопустимое значение {pragma}={value} в профиле {profile}")
+        conn.execute(f"PRAGMA {pragma}={value}")
+
+@contextmanager
+def deferred_indexes(conn: sqlite3.Connection, tables, enabled: bool = True):
+    """Снимает вторичные индексы таблиц tables на время массовой загрузки и
+    пересоздаёт их после неё (одна сортировка вместо обновления индекса на
+    каждой вставке). Автоиндексы PRIMARY KEY/UNIQUE не затрагиваются."""
+    if not enabled or is_duckdb(conn):
+        yield []
+        return
+    marks = ",".join("?" * len(tables))
+    indexes = conn.execute(f"SELECT name, sql FROM sqlite_master WHERE type='index' AND sql IS NOT NULL "
+                           f"AND tbl_name IN ({marks})", tuple(tables)).fetchall()
+    conn.commit()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX IF EXISTS "{name}"')
+    conn.commit()
+    try:
+        yield [name for name, _ in indexes]
+    except BaseException:
+        # Незавершённый файл откатываем (как при аварийном выходе), индексы возвращаем
+        conn.rollback()
+        raise
+    finally:
+        conn.commit()
+        for _, sql in indexes:
+            conn.execute(sql)
+        conn.commit()
+
+def finalize_bulk_load(conn: sqlite3.Connection):
+    """Завершение массовой загрузки: ANALYZE (статистика для планировщика) и
+    checkpoint журнала WAL с усечением файла -wal. Для DuckDB — CHECKPOINT."""
+    conn.commit()
+    if is_duckdb(conn):
+        conn.execute("CHECKPOINT")
+        return
+    conn.execute("ANALYZE")
+    conn.commit()
+    if str(conn.execute("PRAGMA journal_mode").fetchone()[0]).lower() == "wal":
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
 
 SCHEMA_SQL = r"""
 PRAGMA foreign_keys=ON;
-CREATE TABLE IF NOT EXISTS banks (bank_id TEXT PRIMARY KEY, bank_name TEXT);
-CREATE TABLE IF NOT EXISTS forms (form_code TEXT PRIMARY KEY, form_name TEXT);
-CREATE TABLE IF NOT EXISTS raw_values (
-  bank_id TEXT NOT NULL, form_code TEXT NOT NULL, period TEXT NOT NULL,
-  item_code TEXT NOT NULL, value REAL,
-  PRIMARY KEY (bank_id, form_code, period, item_code),
-  FOREIGN KEY (bank_id) REFERENCES banks(bank_id) ON DELETE CASCADE
+CREATE TABLE IF NOT EXISTS banks (bank_key INTEGER PRIMARY KEY, bank_id TEXT NOT NULL UNIQUE, bank_name TEXT);
+CREATE TABLE IF NOT EXISTS forms (form_key INTEGER PRIMARY KEY, form_code TEXT NOT NULL UNIQUE, form_name TEXT);
+CREATE TABLE IF NOT EXISTS periods (period_key INTEGER PRIMARY KEY, period TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS items (item_key INTEGER PRIMARY KEY, item_code TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS indicators (
+  indicator_key INTEGER PRIMARY KEY, indicator_id TEXT NOT NULL UNIQUE, name TEXT, formula TEXT, description TEXT
 );
+CREATE TABLE IF NOT EXISTS raw_facts (
+  bank_key INTEGER NOT NULL, period_key INTEGER NOT NULL, form_key INTEGER NOT NULL,
+  item_key INTEGER NOT NULL, value REAL,
+  PRIMARY KEY (bank_key, period_key, form_key, item_key),
+  FOREIGN KEY (bank_key) REFERENCES banks(bank_key) ON DELETE CASCADE
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS indicator_facts (
+  bank_key INTEGER NOT NULL, indicator_key INTEGER NOT NULL, period_key INTEGER NOT NULL, value REAL,
+  PRIMARY KEY (bank_key, indicator_key, period_key)
+) WITHOUT ROWID;
 CREATE TABLE IF NOT EXISTS data_dictionary (
   form_code TEXT NOT NULL, item_code TEXT NOT NULL, std_key TEXT NOT NULL,
   description TEXT, PRIMARY KEY (form_code, item_code)
 );
-CREATE TABLE IF NOT EXISTS indicators (indicator_id TEXT PRIMARY KEY, name TEXT, formula TEXT, description TEXT);
-CREATE TABLE IF NOT EXISTS indicator_values (
-  bank_id TEXT NOT NULL, indicator_id TEXT NOT NULL, period TEXT NOT NULL, value REAL,
-  PRIMARY KEY (bank_id, indicator_id, period)
-);
+-- Представления с прежними именами и колонками (data_viewer, report_xls, запросы модулей).
+-- LEFT JOIN: SQLite не читает измерения, колонки которых запросу не нужны.
+CREATE VIEW IF NOT EXISTS raw_values AS
+  SELECT b.bank_id, f.form_code, p.period, i.item_code, r.value
+  FROM raw_facts r
+  LEFT JOIN banks b ON b.bank_key = r.bank_key
+  LEFT JOIN forms f ON f.form_key = r.form_key
+  LEFT JOIN periods p ON p.period_key = r.period_key
+  LEFT JOIN items i ON i.item_key = r.item_key;
+CREATE VIEW IF NOT EXISTS indicator_values AS
+  SELECT b.bank_id, d.indicator_id, p.period, v.value
+  FROM indicator_facts v
+  LEFT JOIN banks b ON b.bank_key = v.bank_key
+  LEFT JOIN indicators d ON d.indicator_key = v.indicator_key
+  LEFT JOIN periods p ON p.period_key = v.period_key;
+-- Запись через представления (INSERT [OR REPLACE] / DELETE) для совместимости.
+-- Измерения дополняются через WHERE NOT EXISTS: политика конфликта внешнего
+-- INSERT OR REPLACE не должна пересоздавать строки измерений с новыми ключами.
+CREATE TRIGGER IF NOT EXISTS raw_values_insert INSTEAD OF INSERT ON raw_values BEGIN
+  INSERT INTO banks(bank_id) SELECT NEW.bank_id WHERE NOT EXISTS (SELECT 1 FROM banks WHERE bank_id = NEW.bank_id);
+  INSERT INTO forms(form_code) SELECT NEW.form_code WHERE NOT EXISTS (SELECT 1 FROM forms WHERE form_code = NEW.form_code);
+  INSERT INTO periods(period) SELECT NEW.period WHERE NOT EXISTS (SELECT 1 FROM periods WHERE period = NEW.period);
+  INSERT INTO items(item_code) SELECT NEW.item_code WHERE NOT EXISTS (SELECT 1 FROM items WHERE item_code = NEW.item_code);
+  INSERT INTO raw_facts(bank_key, period_key, form_key, item_key, value) VALUES (
+    (SELECT bank_key FROM banks WHERE bank_id = NEW.bank_id),
+    (SELECT period_key FROM periods WHERE period = NEW.period),
+    (SELECT form_key FROM forms WHERE form_code = NEW.form_code),
+    (SELECT item_key FROM items WHERE item_code = NEW.item_code),
+    NEW.value);
+END;
+CREATE TRIGGER IF NOT EXISTS raw_values_delete INSTEAD OF DELETE ON raw_values BEGIN
+  DELETE FROM raw_facts
+  WHERE bank_key = (SELECT bank_key FROM banks WHERE bank_id = OLD.bank_id)
+    AND period_key = (SELECT period_key FROM periods WHERE period = OLD.period)
+    AND form_key = (SELECT form_key FROM forms WHERE form_code = OLD.form_code)
+    AND item_key = (SELECT item_key FROM items WHERE item_code = OLD.item_code);
+END;
+CREATE TRIGGER IF NOT EXISTS indicator_values_insert INSTEAD OF INSERT ON indicator_values BEGIN
+  INSERT INTO banks(bank_id) SELECT NEW.bank_id WHERE NOT EXISTS (SELECT 1 FROM banks WHERE bank_id = NEW.bank_id);
+  INSERT INTO indicators(indicator_id) SELECT NEW.indicator_id WHERE NOT EXISTS (SELECT 1 FROM indicators WHERE indicator_id = NEW.indicator_id);
+  INSERT INTO periods(period) SELECT NEW.period WHERE NOT EXISTS (SELECT 1 FROM periods WHERE period = NEW.period);
+  INSERT INTO indicator_facts(bank_key, indicator_key, period_key, value) VALUES (
+    (SELECT bank_key FROM banks WHERE bank_id = NEW.bank_id),
+    (SELECT indicator_key FROM indicators WHERE indicator_id = NEW.indicator_id),
+    (SELECT period_key FROM periods WHERE period = NEW.period),
+    NEW.value);
+END;
+CREATE TRIGGER IF NOT EXISTS indicator_values_delete INSTEAD OF DELETE ON indicator_values BEGIN
+  DELETE FROM indicator_facts
+  WHERE bank_key = (SELECT bank_key FROM banks WHERE bank_id = OLD.bank_id)
+    AND indicator_key = (SELECT indicator_key FROM indicators WHERE indicator_id = OLD.indicator_id)
+    AND period_key = (SELECT period_key FROM periods WHERE period = OLD.period);
+END;
 CREATE TABLE IF NOT EXISTS algo_classifications (
   bank_id TEXT NOT NULL, period TEXT NOT NULL, status TEXT NOT NULL CHECK(status in ('Green','Yellow','Red')), details TEXT,
   PRIMARY KEY (bank_id, period)
@@ -41,17 +237,359 @@ CREATE TABLE IF NOT EXISTS ingestion_log (
   file_name TEXT PRIMARY KEY, bank_id TEXT, form_code TEXT, period TEXT, rows_loaded INTEGER,
   loaded_at TEXT DEFAULT (datetime('now'))
 );
+CREATE TABLE IF NOT EXISTS ingestion_manifest (
+  archive TEXT NOT NULL, member TEXT NOT NULL, sha256 TEXT NOT NULL, size INTEGER,
+  form_code TEXT, period TEXT, rows_loaded INTEGER, loaded_at TEXT DEFAULT (datetime('now')),
+  PRIMARY KEY (archive, member)
+);
+CREATE INDEX IF NOT EXISTS idx_ingestion_manifest_sha ON ingestion_manifest(sha256);
+CREATE TABLE IF NOT EXISTS projected_pairs (
+  bank_id TEXT NOT NULL, period TEXT NOT NULL, PRIMARY KEY (bank_id, period)
+);
+CREATE TABLE IF NOT EXISTS dirty_pairs (
+  bank_id TEXT NOT NULL, period TEXT NOT NULL, marked_at TEXT DEFAULT (datetime('now')),
+  PRIMARY KEY (bank_id, period)
+);
+CREATE TABLE IF NOT EXISTS schema_version (
+  version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at TEXT DEFAULT (datetime('now'))
+);
 """
 
+# Версионированные миграции поверх SCHEMA_SQL: (версия, описание, SQL).
+# Применяются по возрастанию версии, каждая — отдельной транзакцией с записью в schema_version.
+# Новые изменения схемы добавляются сюда новой версией, уже выпущенные не меняются.
+MIGRATIONS = [
+    (1, "Покрывающие индексы по периоду для raw_facts и indicator_facts", r"""
+-- report (Raw_values), _resolve_period/_latest_period (EXISTS по периоду)
+CREATE INDEX IF NOT EXISTS ix_raw_facts_period ON raw_facts(period_key, bank_key, form_key, item_key, value);
+-- report (Indicators), перцентили по периоду (_collect_peer_percentiles)
+CREATE INDEX IF NOT EXISTS ix_indicator_facts_period ON indicator_facts(period_key, indicator_key, bank_key, value);
+"""),
+    (2, "Хэш определения формулы индикатора для инкрементального пересчёта", r"""
+ALTER TABLE indicators ADD COLUMN formula_hash TEXT;
+"""),
+    (3, "sha256 конфигураций, перенесённых в БД (data_dictionary.csv -> data_dictionary)", r"""
+CREATE TABLE IF NOT EXISTS config_sync (
+  name TEXT PRIMARY KEY, sha256 TEXT NOT NULL, synced_at TEXT DEFAULT (datetime('now'))
+);
+"""),
+    (4, "Версия данных indicator_values (инвалидация куба индикаторов)", r"""
+CREATE TABLE IF NOT EXISTS data_versions (
+  name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO data_versions(name) VALUES ('indicator_values');
+-- Запись через представление indicator_values тоже меняет версию
+CREATE TRIGGER IF NOT EXISTS indicator_values_version_insert INSTEAD OF INSERT ON indicator_values BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'indicator_values';
+END;
+CREATE TRIGGER IF NOT EXISTS indicator_values_version_delete INSTEAD OF DELETE ON indicator_values BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'indicator_values';
+END;
+"""),
+    (5, "Индекс raw_facts по периоду без копии фактов: только period_key", r"""
+-- Индекс таблицы WITHOUT ROWID и так несёт столбцы PK: EXISTS по периоду и пары
+-- ищутся по нему, за value raw_by_period обращается к PK
+DROP INDEX IF EXISTS ix_raw_facts_period;
+CREATE INDEX IF NOT EXISTS ix_raw_facts_period ON raw_facts(period_key);
+"""),
+]
+
 def init_db(conn: sqlite3.Connection):
+    if is_duckdb(conn):
+        duckdb_backend.init_schema(conn)
+        return
+    if is_legacy_layout(conn):
+        raise RuntimeError("БД в прежнем формате (TEXT-ключи в raw_values/indicator_values): "
+                           "выполните python run.py migrate-db")
     cur = conn.cursor()
     cur.executescript(SCHEMA_SQL)
     conn.commit()
+    apply_migrations(conn)
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return int(row[0]) if row and row[0] is not None else 0
+
+def apply_migrations(conn: sqlite3.Connection):
+    """Применяет миграции MIGRATIONS новее текущей schema_version. Возвращает список применённых версий."""
+    current = schema_version(conn)
+    applied = []
+    for version, description, sql in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            conn.executescript("BEGIN;\n" + sql)
+            conn.execute("INSERT INTO schema_version(version, description) VALUES(?,?)", (version, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+def is_legacy_layout(conn: sqlite3.Connection) -> bool:
+    """raw_values — таблица (а не представление над raw_facts): БД создана до
+    перехода на целочисленные ключи и требует migrate_db."""
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name='raw_values'").fetchone()
+    return bool(row) and row[0] == "table"
+
+# Перенос данных из прежних таблиц (переименованных в legacy_*) в измерения и факты
+_MIGRATE_SQL = r"""
+INSERT INTO banks(bank_id, bank_name) SELECT bank_id, bank_name FROM legacy_banks ORDER BY rowid;
+INSERT OR IGNORE INTO banks(bank_id)
+  SELECT bank_id FROM legacy_raw_values UNION SELECT bank_id FROM legacy_indicator_values;
+INSERT INTO forms(form_code, form_name) SELECT form_code, form_name FROM legacy_forms ORDER BY rowid;
+INSERT OR IGNORE INTO forms(form_code) SELECT DISTINCT form_code FROM legacy_raw_values;
+INSERT INTO periods(period)
+  SELECT period FROM legacy_raw_values UNION SELECT period FROM legacy_indicator_values ORDER BY 1;
+INSERT INTO items(item_code) SELECT DISTINCT item_code FROM legacy_raw_values ORDER BY 1;
+INSERT INTO indicators(indicator_id, name, formula, description)
+  SELECT indicator_id, name, formula, description FROM legacy_indicators ORDER BY rowid;
+INSERT OR IGNORE INTO indicators(indicator_id) SELECT DISTINCT indicator_id FROM legacy_indicator_values ORDER BY 1;
+INSERT INTO raw_facts(bank_key, period_key, form_key, item_key, value)
+  SELECT b.bank_key, p.period_key, f.form_key, i.item_key, r.value
+  FROM legacy_raw_values r
+  JOIN banks b ON b.bank_id = r.bank_id JOIN periods p ON p.period = r.period
+  JOIN forms f ON f.form_code = r.form_code JOIN items i ON i.item_code = r.item_code
+  ORDER BY 1, 2, 3, 4;
+INSERT INTO indicator_facts(bank_key, indicator_key, period_key, value)
+  SELECT b.bank_key, d.indicator_key, p.period_key, v.value
+  FROM legacy_indicator_values v
+  JOIN banks b ON b.bank_id = v.bank_id JOIN indicators d ON d.indicator_id = v.indicator_id
+  JOIN periods p ON p.period = v.period
+  ORDER BY 1, 2, 3;
+DROP TABLE legacy_raw_values;
+DROP TABLE legacy_indicator_values;
+DROP TABLE legacy_banks;
+DROP TABLE legacy_forms;
+DROP TABLE legacy_indicators;
+"""
+
+def migrate_db(conn: sqlite3.Connection, vacuum: bool = True):
+    """Приводит БД к текущей схеме. БД прежнего формата переводится на измерения
+    с целочисленными ключами и факты WITHOUT ROWID (raw_facts, indicator_facts)
+    одной транзакцией, затем применяются версионированные миграции MIGRATIONS.
+    Возвращает (был ли перевод прежнего формата, список применённых версий)."""
+    if is_duckdb(conn):
+        init_db(conn)
+        return False, []
+    if not is_legacy_layout(conn):
+        before = schema_version(conn) if _has_table(conn, "schema_version") else 0
+        init_db(conn)
+        return False, [v for v, _, _ in MIGRATIONS if before < v <= schema_version(conn)]
+    conn.commit()
+    conn.execute("PRAGMA foreign_keys=OFF")
+    renames = "".join(f"ALTER TABLE {t} RENAME TO legacy_{t};\n"
+                      for t in ("raw_values", "indicator_values", "banks", "forms", "indicators"))
+    # PRAGMA внутри транзакции не действует, поэтому убираем его из схемы
+    schema = SCHEMA_SQL.replace("PRAGMA foreign_keys=ON;", "")
+    try:
+        conn.executescript("BEGIN;\n" + renames + schema + _MIGRATE_SQL + "COMMIT;")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("PRAGMA foreign_keys=ON")
+    applied = apply_migrations(conn)
+    if vacuum:
+        conn.execute("VACUUM")
+    return True, applied
+
+def _has_table(conn: sqlite3.Connection, name: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone() is not None
+
+# Измерения: имя -> (таблица, суррогатный ключ, естественный ключ)
+DIMENSIONS = {
+    "bank": ("banks", "bank_key", "bank_id"),
+    "form": ("forms", "form_key", "form_code"),
+    "period": ("periods", "period_key", "period"),
+    "item": ("items", "item_key", "item_code"),
+    "indicator": ("indicators", "indicator_key", "indicator_id"),
+}
+
+class DimensionKeys:
+    """Кэш суррогатных ключей измерений для пакетной записи фактов.
+
+    Отсутствующие значения добавляются в таблицу измерения (INSERT OR IGNORE)
+    в текущей транзакции; ключи однажды выданных значений не меняются.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self._cache = {dim: {} for dim in DIMENSIONS}
+
+    def keys(self, dim: str, values):
+        """{значение: ключ}, содержащий все values (и ранее запрошенные значения)."""
+        cache = self._cache[dim]
+        missing = sorted({v for v in values if v not in cache})
+        if missing:
+            table, key, natural = DIMENSIONS[dim]
+            self.conn.executemany(f"INSERT OR IGNORE INTO {table}({natural}) VALUES(?)", [(v,) for v in missing])
+            for pos in range(0, len(missing), 500):
+                chunk = missing[pos:pos + 500]
+                cache.update(self.conn.execute(
+                    f"SELECT {natural}, {key} FROM {table} WHERE {natural} IN ({','.join('?' * len(chunk))})",
+                    chunk).fetchall())
+        return cache
+
+def write_raw_values(conn: sqlite3.Connection, rows, dims: DimensionKeys = None):
+    """INSERT OR REPLACE строк (bank_id, form_code, period, item_code, value) в raw_facts."""
+    if is_duckdb(conn):
+        conn.insert_frame("raw_values", ("bank_id", "form_code", "period", "item_code", "value"), rows,
+                          key=("bank_id", "form_code", "period", "item_code"))
+        return
+    dims = dims or DimensionKeys(conn)
+    banks = dims.keys("bank", {r[0] for r in rows})
+    forms = dims.keys("form", {r[1] for r in rows})
+    periods = dims.keys("period", {r[2] for r in rows})
+    items = dims.keys("item", {r[3] for r in rows})
+    conn.executemany("INSERT OR REPLACE INTO raw_facts(bank_key, period_key, form_key, item_key, value) VALUES(?,?,?,?,?)",
+                     [(banks[b], periods[p], forms[f], items[i], v) for b, f, p, i, v in rows])
+
+def delete_raw_values(conn: sqlite3.Connection, form_code: str, period: str, bank_id: str = None):
+    """Удаляет строки формы за период (только банка bank_id, если задан) из raw_values.
+    Возвращает пары (bank_id, period), у которых были строки."""
+    where = "form_code = ? AND period = ?" + (" AND bank_id = ?" if bank_id is not None else "")
+    params = (form_code, period) + ((bank_id,) if bank_id is not None else ())
+    pairs = conn.execute(f"SELECT DISTINCT bank_id, period FROM raw_values WHERE {where} ORDER BY bank_id",
+                         params).fetchall()
+    if not pairs:
+        return []
+    if is_duckdb(conn):
+        conn.execute(f"DELETE FROM raw_values WHERE {where}", params)
+    else:
+        conn.execute("DELETE FROM raw_facts WHERE form_key = (SELECT form_key FROM forms WHERE form_code = ?) "
+                     "AND period_key = (SELECT period_key FROM periods WHERE period = ?)"
+                     + (" AND bank_key = (SELECT bank_key FROM banks WHERE bank_id = ?)" if bank_id is not None else ""),
+                     params)
+    return [tuple(p) for p in pairs]
+
+def data_version(conn, name: str) -> int:
+    """Версия набора данных name из data_versions (0 — не менялся или таблицы нет)."""
+    try:
+        row = conn.execute("SELECT version FROM data_versions WHERE name = ?", (name,)).fetchone()
+    except Exception:
+        return 0
+    return int(row[0]) if row else 0
+
+def bump_data_version(conn, name: str):
+    """Увеличивает версию набора данных name в той же транзакции, что и его запись."""
+    conn.execute("INSERT INTO data_versions(name, version) VALUES(?, 1) "
+                 "ON CONFLICT(name) DO UPDATE SET version = data_versions.version + 1", (name,))
+
+def write_indicator_values(conn: sqlite3.Connection, rows, dims: DimensionKeys = None):
+    """INSERT OR REPLACE строк (bank_id, indicator_id, period, value) в indicator_facts.
+    Увеличивает версию indicator_values (куб индикаторов становится устаревшим)."""
+    bump_data_version(conn, "indicator_values")
+    if is_duckdb(conn):
+        conn.insert_frame("indicator_values", ("bank_id", "indicator_id", "period", "value"), rows,
+                          key=("bank_id", "indicator_id", "period"))
+        return
+    dims = dims or DimensionKeys(conn)
+    banks = dims.keys("bank", {r[0] for r in rows})
+    indicators = dims.keys("indicator", {r[1] for r in rows})
+    periods = dims.keys("period", {r[2] for r in rows})
+    conn.executemany("INSERT OR REPLACE INTO indicator_facts(bank_key, indicator_key, period_key, value) VALUES(?,?,?,?)",
+                     [(banks[b], indicators[i], periods[p], v) for b, i, p, v in rows])
+
+def get_dirty_pairs(conn: sqlite3.Connection):
+    """Пары (bank_id, period), затронутые импортом и ещё не пересчитанные."""
+    return conn.execute("SELECT bank_id, period FROM dirty_pairs ORDER BY bank_id, period").fetchall()
+
+def clear_dirty_pairs(conn: sqlite3.Connection, pairs=None):
+    """Снимает отметку с пар (все, если pairs не задан) после пересчёта."""
+    if pairs is None:
+        conn.execute("DELETE FROM dirty_pairs")
+    else:
+        conn.executemany("DELETE FROM dirty_pairs WHERE bank_id=? AND period=?", list(pairs))
+    conn.commit()
+
+def fill_temp_keys(conn: sqlite3.Connection, name: str, columns, rows, payload=()):
+    """(Пере)создаёт временную таблицу ключей для выборок по подмножеству
+    (например, только затронутых банков или пар банк×период). Возвращает её имя.
+    payload — дополнительные целочисленные столбцы вне ключа (их значения
+    идут в конце каждой строки rows)."""
+    cols = ", ".join(columns)
+    all_cols = list(columns) + list(payload)
+    defs = [c + " TEXT NOT NULL" for c in columns] + [c + " INTEGER" for c in payload]
+    conn.execute(f"DROP TABLE IF EXISTS temp.{name}")
+    conn.execute(f"CREATE TEMP TABLE {name} ({', '.join(defs)}, PRIMARY KEY ({cols}))")
+    rows = [tuple(r) if isinstance(r, (tuple, list)) else (r,) for r in rows]
+    if is_duckdb(conn):
+        conn.insert_frame(f"temp.{name}", all_cols, rows, key=list(columns), conflict="IGNORE")
+        return f"temp.{name}"
+    conn.executemany(f"INSERT OR IGNORE INTO temp.{name}({', '.join(all_cols)}) "
+                     f"VALUES ({', '.join('?' * len(all_cols))})", rows)
+    return f"temp.{name}"
+
+_FILE_CACHE = {}
+
+def load_cached(path: str, loader):
+    """loader(path) с кэшем на процесс: файл перечитывается только после изменения
+    (mtime/размер). Возвращаемый объект нельзя изменять на месте."""
+    try:
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        stamp = None
+    hit = _FILE_CACHE.get((path, loader))
+    if hit is not None and stamp is not None and hit[0] == stamp:
+        return hit[1]
+    value = loader(path)
+    _FILE_CACHE[(path, loader)] = (stamp, value)
+    return value
 
 def load_config():
     with open(CFG_PATH, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
+def read_data_dictionary(path: str = DICT_PATH):
+    """{(form_code, item_code): (std_key, description)} из data_dictionary.csv.
+    Пропускает пустые строки и комментарии (#...); при повторе пары действует последняя строка.
+    """
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, "r", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        for row in reader:
+            if not row or not row[0] or row[0].lstrip().startswith("#"):
+                continue
+            # Ожидаемые колонки: form_code, item_code, std_key, description
+            if len(row) < 3:
+                continue
+            form_code = row[0].strip()
+            item_code = row[1].strip()
+            std_key = row[2].strip()
+            if form_code and item_code and std_key:
+                entries[(form_code, item_code)] = (std_key, row[3].strip() if len(row) > 3 else None)
+    return entries
+
+def load_data_dictionary(path: str = DICT_PATH):
+    """Загружает словарь соответствий (form_code, item_code) -> std_key."""
+    return {key: std_key for key, (std_key, _) in read_data_dictionary(path).items()}
+
+def sync_data_dictionary(conn: sqlite3.Connection, path: str = DICT_PATH) -> bool:
+    """Переносит data_dictionary.csv в таблицу data_dictionary, если sha256 файла
+    отличается от записанного в config_sync. True — таблица обновлена (значения
+    std_key, а с ними и индикаторы, могли измениться)."""
+    try:
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        digest = ""
+    row = conn.execute("SELECT sha256 FROM config_sync WHERE name = 'data_dictionary'").fetchone()
+    if row and row[0] == digest:
+        return False
+    conn.execute("DELETE FROM data_dictionary")
+    conn.executemany("INSERT INTO data_dictionary(form_code, item_code, std_key, description) VALUES(?,?,?,?)",
+                     [(form_code, item_code, std_key, description)
+                      for (form_code, item_code), (std_key, description) in read_data_dictionary(path).items()])
+    conn.execute("DELETE FROM config_sync WHERE name = 'data_dictionary'")
+    conn.execute("INSERT INTO config_sync(name, sha256) VALUES('data_dictionary', ?)", (digest,))
+    conn.commit()
+    return True
+
 def parse_filename_generic(filename: str, pattern: str):
     m = re.match(pattern, filename, flags=re.IGNORECASE)
     if not m: return None
@@ -64,3 +602,85 @@ def parse_filename_generic(filename: str, pattern: str):
         else:
             period = raw_date
     return gd.get("bank_id"), gd.get("form"), period
+
+# Типовые выборки модулей (имя -> SQL). Периоды и пары банк×период ищутся по
+# измерениям с проверкой EXISTS по индексу фактов, а не сканированием фактов.
+# check_query_plans следит, чтобы ни одна из них не читала факты целиком.
+HOT_QUERIES = {
+    # _resolve_period / _latest_period (report_xls, llm_module)
+    "latest_period": "SELECT p.period FROM periods p WHERE EXISTS "
+                     "(SELECT 1 FROM raw_facts r WHERE r.period_key = p.period_key) ORDER BY p.period DESC LIMIT 1",
+    "latest_period_upto": "SELECT p.period FROM periods p WHERE p.period <= ? AND EXISTS "
+                          "(SELECT 1 FROM raw_facts r WHERE r.period_key = p.period_key) ORDER BY p.period DESC LIMIT 1",
+    "earliest_period": "SELECT p.period FROM periods p WHERE EXISTS "
+                       "(SELECT 1 FROM raw_facts r WHERE r.period_key = p.period_key) ORDER BY p.period LIMIT 1",
+    "period_loaded": "SELECT 1 FROM periods p WHERE p.period = ? AND EXISTS "
+                     "(SELECT 1 FROM raw_facts r WHERE r.period_key = p.period_key)",
+    # llm_analyze_all: последние N периодов ≤ даты
+    "recent_periods": "SELECT p.period FROM periods p WHERE p.period <= ? AND EXISTS "
+                      "(SELECT 1 FROM raw_facts r WHERE r.period_key = p.period_key) ORDER BY p.period DESC LIMIT ?",
+    # calculate_indicators: пары банк×период с сырыми данными (префикс PK raw_facts)
+    "raw_pairs": "SELECT b.bank_id, p.period FROM banks b, periods p WHERE EXISTS "
+                 "(SELECT 1 FROM raw_facts r WHERE r.bank_key = b.bank_key AND r.period_key = p.period_key)",
+    # report_xls: листы Indicators и Raw_values
+    "raw_by_period": "SELECT * FROM raw_values WHERE period=?",
+    # llm_module: _collect_peer_percentiles
+    "peer_values": "SELECT indicator_id, value FROM indicator_values WHERE period=? AND indicator_id IN ({ids})",
+    # indicator_cube.get_series: ряды всех банков за окно периодов (report_xls, _collect_series)
+    # (CROSS JOIN: поиск по префиксу (period_key, indicator_key) ix_indicator_facts_period
+    # только для запрошенных индикаторов, а не всех индикаторов периода)
+    "indicator_window": "SELECT b.bank_id, d.indicator_id, p.period, v.value FROM periods p "
+                        "CROSS JOIN indicators d CROSS JOIN indicator_facts v JOIN banks b ON b.bank_key = v.bank_key "
+                        "WHERE p.period BETWEEN ? AND ? AND d.indicator_id IN ({ids}) "
+                        "AND v.period_key = p.period_key AND v.indicator_key = d.indicator_key",
+    "indicator_window_all": "SELECT bank_id, indicator_id, period, value FROM indicator_values "
+                            "WHERE period BETWEEN ? AND ?",
+}
+
+# Таблицы фактов и их псевдонимы в представлениях и HOT_QUERIES
+_FACT_NAMES = {"raw_facts", "indicator_facts", "r", "v"}
+
+def hot_query(conn, name: str) -> str:
+    """SQL типовой выборки name для бэкенда соединения."""
+    if is_duckdb(conn) and name in duckdb_backend.DUCKDB_QUERIES:
+        return duckdb_backend.DUCKDB_QUERIES[name]
+    return HOT_QUERIES[name]
+
+def latest_period(conn: sqlite3.Connection, upto: str = None):
+    """Последний период с сырыми данными (не позже upto, если задан) или None."""
+    if upto:
+        row = conn.execute(hot_query(conn, "latest_period_upto"), (upto,)).fetchone()
+    else:
+        row = conn.execute(hot_query(conn, "latest_period")).fetchone()
+    return row[0] if row else None
+
+def earliest_period(conn: sqlite3.Connection):
+    row = conn.execute(hot_query(conn, "earliest_period")).fetchone()
+    return row[0] if row else None
+
+def period_loaded(conn: sqlite3.Connection, period: str) -> bool:
+    return conn.execute(hot_query(conn, "period_loaded"), (period,)).fetchone() is not None
+
+def check_query_plans(conn: sqlite3.Connection = None):
+    """Проверка планов HOT_QUERIES (EXPLAIN QUERY PLAN): возвращает {имя: [строки плана]}
+    для выборок, которые читают таблицу фактов полным сканированием (SCAN).
+    Без conn проверяется пустая БД в памяти с текущей схемой и миграциями."""
+    if conn is not None and is_duckdb(conn):
+        raise ValueError("Проверка планов выполняется только для SQLite")
+    own = conn is None
+    if own:
+        conn = sqlite3.connect(":memory:")
+        init_db(conn)
+    failures = {}
+    try:
+        for name, sql in HOT_QUERIES.items():
+            sql = sql.format(ids="?,?", periods="?,?")
+            plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, [None] * sql.count("?"))]
+            scans = [line for line in plan
+                     if line.startswith("SCAN ") and line.split()[1] in _FACT_NAMES]
+            if scans:
+                failures[name] = plan
+    finally:
+        if own:
+            conn.close()
+    return failures
@@ -0,0 +1,337 @@
+"""
+Колоночное чтение DBF без построчных словарей dbfread.
+
+Файл отображается в память (mmap) или берётся готовым буфером, заголовок
+разбирается один раз, а нужные колонки вырезаются из буфера записей
+фиксированной ширины как массивы NumPy. Числовые колонки (включая
+NUL-паддинг) парсятся векторно; если колонка не проходит векторный разбор,
+она целиком декодируется через RelaxedFieldParser по уникальным значениям —
+с той же семантикой, что и построчное чтение dbfread.
+"""
+import mmap
+import struct
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from dbfread import FieldParser
+from dbfread.dbf import DBFField, DBFHeader
+
+
+class RelaxedFieldParser(FieldParser):
+    """Парсер DBF, который корректно обрабатывает числа с NUL-паддингом."""
+    def _clean_bytes(self, data):
+        if isinstance(data, (bytes, bytearray)):
+            return bytes(data).replace(b"\x00", b"").strip()
+        return data
+
+    def parseN(self, field, data):
+        data = self._clean_bytes(data)
+        try:
+            return super().parseN(field, data)
+        except Exception:
+            try:
+                s = data.decode('latin-1') if isinstance(data, (bytes, bytearray)) else str(data)
+                s = s.replace('\x00','').replace(' ', '').replace(',', '.')
+                if s == '':
+                    return None
+                # Пытаемся float, если точка присутствует
+                return float(s) if ('.' in s) else int(s)
+            except Exception:
+                return None
+
+    def parseF(self, field, data):
+        data = self._clean_bytes(data)
+        try:
+            return super().parseF(field, data)
+        except Exception:
+            try:
+                s = data.decode('latin-1') if isinstance(data, (bytes, bytearray)) else str(data)
+                s = s.replace('\x00','').replace(' ', '').replace(',', '.')
+                return float(s) if s != '' else None
+            except Exception:
+                return None
+
+
+# Байты, допустимые в векторном разборе чисел: цифры, знак, точка, экспонента,
+# пробел и NUL (паддинг). Всё остальное (запятая, '*', буквы) — через парсер.
+_NUMERIC_BYTES = np.zeros(256, dtype=bool)
+for _c in b"0123456789+-.eE \x00":
+    _NUMERIC_BYTES[_c] = True
+_PAD_BYTES = np.zeros(256, dtype=bool)
+_PAD_BYTES[0x20] = True
+_PAD_BYTES[0x00] = True
+
+
+class _TableInfo:
+    """Минимальный аналог dbfread.DBF для FieldParser (кодировка, версия)."""
+    def __init__(self, header, encoding, char_decode_errors):
+        self.header = header
+        self.encoding = encoding
+        self.char_decode_errors = char_decode_errors
+
+
+def peek_field_names(peek: Callable[[int], bytes], encoding: str = "cp866") -> List[str]:
+    """Имена полей DBF по началу файла; peek(n) возвращает первые n байт.
+
+    Читается только заголовок, поэтому член архива не нужно распаковывать целиком.
+    """
+    head = peek(DBFHeader.size)
+    if len(head) < DBFHeader.size:
+        return []
+    headerlen = DBFHeader.unpack(head).headerlen
+    data = peek(max(headerlen, DBFHeader.size))
+    names = []
+    pos = DBFHeader.size
+    while pos + DBFField.size <= len(data) and data[pos:pos + 1] not in (b'\r', b'\n'):
+        field = DBFField.unpack(data[pos:pos + DBFField.size])
+        names.append(field.name.split(b'\0')[0].decode(encoding, errors="ignore"))
+        pos += DBFField.size
+    return names
+
+
+class ColumnarDBF:
+    """DBF-таблица с доступом по колонкам.
+
+    source — путь к файлу (читается через mmap) или bytes-подобный буфер.
+    Учитываются те же записи, что и при итерации dbfread: только с флагом
+    b' ' и до маркера конца 0x1A. Если раскладка записей нерегулярна
+    (сумма ширин полей не совпадает с длиной записи, «хвост» неполной
+    записи), записи читаются последовательно, как это делает dbfread.
+    """
+
+    def __init__(self, source, encoding: str = "cp866", char_decode_errors: str = "ignore",
+                 parserclass=RelaxedFieldParser):
+        self.encoding = encoding
+        self.char_decode_errors = char_decode_errors
+        self._mmap = None
+        self._owner = True
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self._buf = memoryview(source)
+        else:
+            with open(source, "rb") as f:
+                try:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._buf = memoryview(self._mmap)
+                except ValueError:
+                    # Пустой файл нельзя отобразить в память
+                    self._buf = memoryview(f.read())
+        self._read_headers()
+        self._parser = parserclass(_TableInfo(self.header, encoding, char_decode_errors))
+        for field in self.fields:
+            if field.type == 'I' and field.length != 4:
+                raise ValueError('Field type I must have length 4 (was {})'.format(field.length))
+            if field.type == 'L' and field.length != 1:
+                raise ValueError('Field type L must have length 1 (was {})'.format(field.length))
+            if not self._parser.field_type_supported(field.type):
+                raise ValueError('Unknown field type: {!r}'.format(field.type))
+        self._records = self._locate_records()
+        self._cache: Dict[str, Tuple[list, np.ndarray]] = {}
+
+    # --- заголовок и записи ---
+    def _read_headers(self):
+        buf = self._buf
+        if len(buf) < DBFHeader.size:
+            raise ValueError("DBF слишком короткий для заголовка")
+        self.header = DBFHeader.unpack(bytes(buf[:DBFHeader.size]))
+        self.fields = []
+        self.field_names: List[str] = []
+        self._offsets: Dict[str, int] = {}
+        pos = DBFHeader.size
+        offset = 1
+        while pos < len(buf):
+            sep = bytes(buf[pos:pos + 1])
+            if sep in (b'\r', b'\n', b''):
+                break
+            chunk = bytes(buf[pos:pos + DBFField.size])
+            if len(chunk) < DBFField.size:
+                raise struct.error("неполное описание поля DBF")
+            field = DBFField.unpack(chunk)
+            pos += DBFField.size
+            field.type = chr(ord(field.type))
+            if field.type in 'C':
+                field.length |= field.decimal_count << 8
+                field.decimal_count = 0
+            field.name = field.name.split(b'\0')[0].decode(self.encoding, errors=self.char_decode_errors)
+            self.fields.append(field)
+            self.field_names.append(field.name)
+            # При повторяющихся именах dbfread оставляет значение последнего поля
+            self._offsets[field.name] = offset
+            offset += field.length
+        self._fields_by_name = {f.name: f for f in self.fields}
+        self._data_width = offset - 1
+
+    def _locate_records(self) -> np.ndarray:
+        """Возвращает 2D-массив (записи × байты записи) только активных записей."""
+        start = self.header.headerlen
+        reclen = self.header.recordlen
+        total = max(0, len(self._buf) - start)
+        if reclen <= 0 or 1 + self._data_width != reclen:
+            return self._sequential_records()
+        n_full = total // reclen
+        data = np.frombuffer(self._buf, dtype=np.uint8, count=n_full * reclen, offset=start) \
+            if n_full else np.zeros(0, dtype=np.uint8)
+        recs = data.reshape(n_full, reclen)
+        flags = recs[:, 0]
+        eof = np.flatnonzero(flags == 0x1A)
+        if eof.size:
+            recs = recs[:eof[0]]
+            flags = flags[:eof[0]]
+        elif total % reclen:
+            tail = bytes(self._buf[start + n_full * reclen:start + n_full * reclen + 1])
+            if tail == b' ':
+                # Неполная последняя запись: dbfread прочитает её «как есть»
+                return self._sequential_records()
+        active = flags == 0x20
+        if active.all():
+            return recs
+        return recs[active]
+
+    def _sequential_records(self) -> np.ndarray:
+        """Медленный путь: последовательное чтение записей так же, как dbfread."""
+        buf = bytes(self._buf)
+        pos = self.header.headerlen
+        width = self._data_width
+        rows = []
+        while pos < len(buf):
+            sep = buf[pos:pos + 1]
+            if sep == b' ':
+                rec = buf[pos + 1:pos + 1 + width]
+                rows.append(b' ' + rec.ljust(width, b'\x00'))
+                pos += 1 + width
+            elif sep in (b'\x1a', b''):
+                break
+            else:
+                pos += self.header.recordlen
+        if not rows:
+            return np.zeros((0, 1 + width), dtype=np.uint8)
+        return np.frombuffer(b"".join(rows), dtype=np.uint8).reshape(len(rows), 1 + width)
+
+    def __len__(self):
+        return int(self._records.shape[0])
+
+    @property
+    def buffer(self) -> memoryview:
+        """Содержимое файла целиком (например, для хеширования без повторного чтения)."""
+        return self._buf
+
+    def with_encoding(self, encoding: str) -> "ColumnarDBF":
+        """Та же таблица (общие буфер и записи) с другой кодировкой значений.
+
+        Закрывать нужно исходную таблицу; close() копии только сбрасывает её кэш.
+        """
+        if encoding == self.encoding:
+            return self
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone.encoding = encoding
+        clone._parser = type(self._parser)(_TableInfo(self.header, encoding, self.char_decode_errors))
+        clone._cache = {}
+        clone._owner = False
+        return clone
+
+    def close(self):
+        if not self._owner:
+            self._cache.clear()
+            return
+        self._records = None
+        self._cache.clear()
+        try:
+            self._buf.release()
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+        except BufferError:
+            # На буфер ещё ссылаются массивы вызывающего кода — освободится вместе с ними
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    # --- доступ к колонкам ---
+    def raw(self, name: str) -> np.ndarray:
+        """Байты колонки: массив uint8 (записи × ширина поля)."""
+        field = self._fields_by_name[name]
+        off = self._offsets[name]
+        return self._records[:, off:off + field.length]
+
+    def uniques(self, name: str) -> Tuple[list, np.ndarray]:
+        """Уникальные значения колонки (как их вернул бы парсер dbfread) и индексы записей на них."""
+        if name in self._cache:
+            return self._cache[name]
+        field = self._fields_by_name[name]
+        block = np.ascontiguousarray(self.raw(name))
+        n, width = block.shape
+        if n == 0:
+            res = ([], np.zeros(0, dtype=np.intp))
+        else:
+            if width <= 8:
+                padded = np.zeros((n, 8), dtype=np.uint8)
+                padded[:, :width] = block
+                keys = padded.view("<u8").ravel()
+            else:
+                keys = block.view(f"V{width}").ravel()
+            _, first, inv = np.unique(keys, return_index=True, return_inverse=True)
+            parse = self._parser.parse
+            res = ([parse(field, block[i].tobytes()) for i in first], inv.ravel())
+        self._cache[name] = res
+        return res
+
+    def values(self, name: str) -> np.ndarray:
+        """Значения колонки по записям (object-массив)."""
+        uvals, inv = self.uniques(name)
+        arr = np.empty(len(uvals), dtype=object)
+        arr[:] = uvals
+        return arr[inv]
+
+    def floats(self, name: str, convert: Callable[[object], Optional[float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Числовая колонка: (значения float64, маска непустых).
+
+        Сначала векторный разбор по байтам; если хотя бы одно значение ему не
+        поддаётся, вся колонка переводится через convert(значение парсера)
+        по уникальным значениям.
+        """
+        n = len(self)
+        field = self._fields_by_name[name]
+        if field.type in "NFC" and n:
+            parsed = self._parse_numeric(self.raw(name), field.type == "N")
+            if parsed is not None:
+                return parsed
+        uvals, inv = self.uniques(name)
+        conv = [convert(v) for v in uvals]
+        ok_u = np.array([c is not None for c in conv], dtype=bool)
+        val_u = np.array([c if c is not None else np.nan for c in conv], dtype=np.float64)
+        return val_u[inv], ok_u[inv]
+
+    @staticmethod
+    def _parse_numeric(block: np.ndarray, int_literals: bool) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        if not _NUMERIC_BYTES[block].all():
+            return None
+        pad = _PAD_BYTES[block]
+        width = block.shape[1]
+        filled = ~pad
+        count = filled.sum(axis=1)
+        ok = count > 0
+        if not ok.any():
+            return np.full(block.shape[0], np.nan), ok
+        first = filled.argmax(axis=1)
+        last = width - 1 - filled[:, ::-1].argmax(axis=1)
+        # Пробел/NUL внутри числа парсер склеивает — такой случай не векторизуем
+        if np.any((last - first + 1)[ok] != count[ok]):
+            return None
+        text = np.where(pad, np.uint8(0x20), block)
+        strings = np.ascontiguousarray(text[ok]).view(f"S{width}").ravel()
+        try:
+            parsed = strings.astype(np.float64)
+        except ValueError:
+            return None
+        out = np.full(block.shape[0], np.nan)
+        out[ok] = parsed
+        if int_literals:
+            # parseN отдаёт int для целых литералов, поэтому "-0" даёт 0.0, а не -0.0
+            frac = (block == 0x2E) | (block == 0x45) | (block == 0x65)
+            out[(out == 0) & ~frac.any(axis=1)] = 0.0
+        return out, ok
@@ -0,0 +1,301 @@
+"""
+Встроенная DuckDB как хранилище (db_url: duckdb:///data/finstat.duckdb).
+
+Модули пишут SQL в диалекте SQLite и работают с соединением через API sqlite3
+(execute/executemany/cursor/commit). DuckDBConnection воспроизводит этот API
+поверх duckdb: неявная транзакция перед INSERT/UPDATE/DELETE (как в sqlite3),
+общая транзакция у всех курсоров соединения, commit/rollback без открытой
+транзакции ничего не делают. Таблицы raw_values и indicator_values в DuckDB
+обычные (колоночное хранение, без измерений с суррогатными ключами), поэтому
+выборки, завязанные на raw_facts/periods, заменены в DUCKDB_QUERIES.
+
+Соединение с файлом DuckDB в режиме записи может держать только один процесс:
+watch, import и view одновременно на одной БД не запускаются.
+"""
+import re
+
+try:
+    import duckdb
+except Exception:  # пакет может быть не установлен у всех
+    duckdb = None  # type: ignore
+
+DUCKDB_SCHEMA_SQL = r"""
+CREATE TABLE IF NOT EXISTS banks (bank_id TEXT PRIMARY KEY, bank_name TEXT);
+CREATE TABLE IF NOT EXISTS forms (form_code TEXT PRIMARY KEY, form_name TEXT);
+CREATE TABLE IF NOT EXISTS indicators (indicator_id TEXT PRIMARY KEY, name TEXT, formula TEXT, description TEXT);
+ALTER TABLE indicators ADD COLUMN IF NOT EXISTS formula_hash TEXT;
+CREATE TABLE IF NOT EXISTS raw_values (
+  bank_id TEXT NOT NULL, form_code TEXT NOT NULL, period TEXT NOT NULL, item_code TEXT NOT NULL, value DOUBLE,
+  PRIMARY KEY (bank_id, period, form_code, item_code)
+);
+CREATE TABLE IF NOT EXISTS indicator_values (
+  bank_id TEXT NOT NULL, indicator_id TEXT NOT NULL, period TEXT NOT NULL, value DOUBLE,
+  PRIMARY KEY (bank_id, indicator_id, period)
+);
+CREATE TABLE IF NOT EXISTS data_dictionary (
+  form_code TEXT NOT NULL, item_code TEXT NOT NULL, std_key TEXT NOT NULL,
+  description TEXT, PRIMARY KEY (form_code, item_code)
+);
+CREATE TABLE IF NOT EXISTS algo_classifications (
+  bank_id TEXT NOT NULL, period TEXT NOT NULL, status TEXT NOT NULL CHECK(status in ('Green','Yellow','Red')), details TEXT,
+  PRIMARY KEY (bank_id, period)
+);
+CREATE TABLE IF NOT EXISTS llm_classifications (
+  bank_id TEXT NOT NULL, period TEXT NOT NULL, status TEXT NOT NULL CHECK(status in ('Green','Yellow','Red')),
+  reasoning TEXT, model TEXT, created_at TEXT DEFAULT strftime(now(), '%Y-%m-%d %H:%M:%S'),
+  PRIMARY KEY (bank_id, period)
+);
+CREATE TABLE IF NOT EXISTS ingestion_log (
+  file_name TEXT PRIMARY KEY, bank_id TEXT, form_code TEXT, period TEXT, rows_loaded INTEGER,
+  loaded_at TEXT DEFAULT strftime(now(), '%Y-%m-%d %H:%M:%S')
+);
+CREATE TABLE IF NOT EXISTS ingestion_manifest (
+  archive TEXT NOT NULL, member TEXT NOT NULL, sha256 TEXT NOT NULL, size BIGINT,
+  form_code TEXT, period TEXT, rows_loaded INTEGER, loaded_at TEXT DEFAULT strftime(now(), '%Y-%m-%d %H:%M:%S'),
+  PRIMARY KEY (archive, member)
+);
+CREATE TABLE IF NOT EXISTS projected_pairs (
+  bank_id TEXT NOT NULL, period TEXT NOT NULL, PRIMARY KEY (bank_id, period)
+);
+CREATE TABLE IF NOT EXISTS dirty_pairs (
+  bank_id TEXT NOT NULL, period TEXT NOT NULL, marked_at TEXT DEFAULT strftime(now(), '%Y-%m-%d %H:%M:%S'),
+  PRIMARY KEY (bank_id, period)
+);
+CREATE TABLE IF NOT EXISTS schema_version (
+  version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at TEXT DEFAULT strftime(now(), '%Y-%m-%d %H:%M:%S')
+);
+CREATE TABLE IF NOT EXISTS config_sync (
+  name TEXT PRIMARY KEY, sha256 TEXT NOT NULL, synced_at TEXT DEFAULT strftime(now(), '%Y-%m-%d %H:%M:%S')
+);
+CREATE TABLE IF NOT EXISTS data_versions (
+  name TEXT PRIMARY KEY, version BIGINT NOT NULL DEFAULT 0
+);
+"""
+
+# Замены HOT_QUERIES (db.py), которые обращаются к таблицам раскладки SQLite
+DUCKDB_QUERIES = {
+    "latest_period": "SELECT MAX(period) FROM raw_values",
+    "latest_period_upto": "SELECT MAX(period) FROM raw_values WHERE period <= ?",
+    "earliest_period": "SELECT MIN(period) FROM raw_values",
+    "period_loaded": "SELECT 1 FROM raw_values WHERE period = ? LIMIT 1",
+    "recent_periods": "SELECT DISTINCT period FROM raw_values WHERE period <= ? ORDER BY period DESC LIMIT ?",
+    "raw_pairs": "SELECT DISTINCT bank_id, period FROM raw_values",
+    "indicator_window": "SELECT bank_id, indicator_id, period, value FROM indicator_values "
+                        "WHERE period BETWEEN ? AND ? AND indicator_id IN ({ids})",
+}
+
+_DML = re.compile(r"^\s*(INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+# «x IS ?» (SQLite) — в DuckDB параметр после IS не допускается
+_IS_PARAM = re.compile(r"\bIS\s+\?", re.IGNORECASE)
+
+
+# executemany простых INSERT/UPDATE/DELETE выполняется одним запросом над DataFrame:
+# построчный executemany в DuckDB стоит порядка миллисекунды на строку
+_MANY_INSERT = re.compile(r"^\s*INSERT\s+(?:OR\s+(IGNORE|REPLACE)\s+)?INTO\s+([\w.]+)\s*\(([^)]*)\)\s*"
+                          r"VALUES\s*\(\s*\?(?:\s*,\s*\?)*\s*\)\s*$", re.IGNORECASE)
+_MANY_UPDATE = re.compile(r"^\s*UPDATE\s+([\w.]+)\s+SET\s+(.+?)\s+WHERE\s+(.+?)\s*$", re.IGNORECASE | re.DOTALL)
+_MANY_DELETE = re.compile(r"^\s*DELETE\s+FROM\s+([\w.]+)\s+WHERE\s+(.+?)\s*$", re.IGNORECASE | re.DOTALL)
+_PARAM_EQ = re.compile(r"^\s*(\w+)\s*=\s*\?\s*$")
+
+
+def _translate(sql: str) -> str:
+    return _IS_PARAM.sub("IS NOT DISTINCT FROM ?", sql)
+
+
+def _param_columns(clause: str, sep: str):
+    """['col', ...] для «col=? <sep> col=?» или None, если выражение сложнее."""
+    cols = []
+    for part in re.split(sep, clause, flags=re.IGNORECASE):
+        m = _PARAM_EQ.match(part)
+        if not m:
+            return None
+        cols.append(m.group(1))
+    return cols
+
+
+class DuckDBCursor:
+    """Курсор в духе sqlite3 (результат выборки забирается сразу)."""
+
+    def __init__(self, conn: "DuckDBConnection"):
+        self.connection = conn
+        self.description = None
+        self.rowcount = -1
+        self._rows = []
+        self._pos = 0
+
+    def execute(self, sql: str, params=()):
+        conn = self.connection
+        dml = conn._begin_for(sql)
+        result = conn.raw.execute(_translate(sql), list(params) if params else None)
+        if dml:
+            self.description, self._rows = None, []
+            self.rowcount = int(result.fetchone()[0])
+        else:
+            self.description = result.description
+            self._rows = result.fetchall() if result.description else []
+            self.rowcount = -1
+        self._pos = 0
+        return self
+
+    def executemany(self, sql: str, seq_of_params):
+        seq = [list(p) for p in seq_of_params]
+        self.description, self._rows, self._pos = None, [], 0
+        if seq and not self.connection._execute_many_frame(sql, seq):
+            self.connection._begin_for(sql)
+            self.connection.raw.executemany(_translate(sql), seq)
+        self.rowcount = len(seq)
+        return self
+
+    def fetchone(self):
+        if self._pos >= len(self._rows):
+            return None
+        row = self._rows[self._pos]
+        self._pos += 1
+        return row
+
+    def fetchmany(self, size: int = 1):
+        rows = self._rows[self._pos:self._pos + size]
+        self._pos += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._rows[self._pos:]
+        self._pos = len(self._rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        self._rows = []
+
+
+class DuckDBConnection:
+    """Соединение DuckDB с API и транзакционной семантикой sqlite3.Connection."""
+
+    backend = "duckdb"
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.in_transaction = False
+
+    def _begin_for(self, sql: str) -> bool:
+        dml = bool(_DML.match(sql))
+        if dml and not self.in_transaction:
+            self.raw.execute("BEGIN TRANSACTION")
+            self.in_transaction = True
+        return dml
+
+    def cursor(self) -> DuckDBCursor:
+        return DuckDBCursor(self)
+
+    def execute(self, sql: str, params=()) -> DuckDBCursor:
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql: str, seq_of_params) -> DuckDBCursor:
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def commit(self):
+        if self.in_transaction:
+            self.raw.execute("COMMIT")
+            self.in_transaction = False
+
+    def rollback(self):
+        if self.in_transaction:
+            self.raw.execute("ROLLBACK")
+            self.in_transaction = False
+
+    def close(self):
+        # Как в sqlite3: незафиксированные изменения при закрытии отбрасываются
+        self.rollback()
+        self.raw.close()
+
+    def read_frame(self, sql: str, params=()):
+        """Результат выборки как pandas.DataFrame (колоночная выгрузка без построчного fetch)."""
+        return self.raw.execute(_translate(sql), list(params) if params else None).df()
+
+    def insert_frame(self, table: str, columns, rows, key=None, conflict: str = "REPLACE"):
+        """Пакетная вставка строк через DataFrame одним запросом. conflict — REPLACE,
+        IGNORE или None (обычный INSERT). Повторы key (по умолчанию PRIMARY KEY таблицы)
+        внутри пакета сводятся как при построчной записи: для REPLACE остаётся
+        последняя строка, для IGNORE — первая."""
+        import pandas as pd
+        if not rows:
+            return
+        frame = pd.DataFrame([tuple(r) for r in rows], columns=list(columns))
+        if conflict:
+            key = list(key or self._primary_key(table) or columns)
+            frame = frame.drop_duplicates(subset=key, keep="last" if conflict.upper() == "REPLACE" else "first")
+        cols = ", ".join(columns)
+        verb = f"INSERT OR {conflict.upper()}" if conflict else "INSERT"
+        self._run_frame(f"{verb} INTO {table}({cols}) SELECT {cols} FROM _many_frame", frame)
+
+    def _primary_key(self, table: str):
+        database, _, name = table.rpartition(".")
+        row = self.raw.execute(
+            "SELECT constraint_column_names FROM duckdb_constraints() WHERE table_name = ? "
+            "AND constraint_type = 'PRIMARY KEY' AND (? = '' OR database_name = ?)",
+            [name, database, database]).fetchone()
+        return list(row[0]) if row else None
+
+    def _run_frame(self, sql: str, frame):
+        self._begin_for("INSERT")
+        self.raw.register("_many_frame", frame)
+        try:
+            self.raw.execute(sql)
+        finally:
+            self.raw.unregister("_many_frame")
+
+    def _execute_many_frame(self, sql: str, seq) -> bool:
+        """executemany для INSERT ... VALUES(?,...), UPDATE t SET c=?,... WHERE k=? AND ...
+        и DELETE FROM t WHERE k=? AND ... одним запросом; False — запрос другого вида."""
+        import pandas as pd
+        m = _MANY_INSERT.match(sql)
+        if m:
+            columns = [c.strip() for c in m.group(3).split(",")]
+            self.insert_frame(m.group(2), columns, seq, conflict=m.group(1))
+            return True
+        m = _MANY_UPDATE.match(sql)
+        if m:
+            table, sets, where = m.group(1), _param_columns(m.group(2), r","), _param_columns(m.group(3), r"\bAND\b")
+            if not sets or not where:
+                return False
+            names = [f"p{i}" for i in range(len(sets) + len(where))]
+            frame = pd.DataFrame([tuple(r) for r in seq], columns=names)
+            frame = frame.drop_duplicates(subset=names[len(sets):], keep="last")
+            assign = ", ".join(f"{c} = f.{n}" for c, n in zip(sets, names))
+            cond = " AND ".join(f"t.{c} = f.{n}" for c, n in zip(where, names[len(sets):]))
+            self._run_frame(f"UPDATE {table} AS t SET {assign} FROM _many_frame AS f WHERE {cond}", frame)
+            return True
+        m = _MANY_DELETE.match(sql)
+        if m:
+            table, where = m.group(1), _param_columns(m.group(2), r"\bAND\b")
+            if not where:
+                return False
+            names = [f"p{i}" for i in range(len(where))]
+            frame = pd.DataFrame([tuple(r) for r in seq], columns=names)
+            cond = " AND ".join(f"t.{c} = f.{n}" for c, n in zip(where, names))
+            self._run_frame(f"DELETE FROM {table} AS t USING _many_frame AS f WHERE {cond}", frame)
+            return True
+        return False
+
+
+def connect(path: str, settings: dict = None) -> DuckDBConnection:
+    """Открывает файл DuckDB. settings — storage.duckdb из config.yaml
+    (threads: 0 — по числу ядер; memory_limit, например '4GB')."""
+    if duckdb is None:
+        raise RuntimeError("Для db_url duckdb:/// нужен пакет duckdb: pip install duckdb")
+    settings = settings or {}
+    raw = duckdb.connect(path)
+    if int(settings.get("threads") or 0) > 0:
+        raw.execute(f"SET threads = {int(settings['threads'])}")
+    limit = str(settings.get("memory_limit") or "").strip()
+    if limit:
+        if not re.match(r"^\d+(\.\d+)?\s*[KMGT]i?B$", limit, re.IGNORECASE):
+            raise ValueError(f"Недопустимое значение storage.duckdb.memory_limit: {limit}")
+        raw.execute(f"SET memory_limit = '{limit}'")
+    return DuckDBConnection(raw)
+
+
+def init_schema(conn: DuckDBConnection):
+    conn.raw.execute(DUCKDB_SCHEMA_SQL)
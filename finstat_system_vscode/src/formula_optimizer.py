@@ -0,0 +1,143 @@
+"""
+Оптимизация линейных формул indicators.yaml: исключение общих подвыражений.
+
+Линейные формулы приводятся к картам слагаемых {имя: коэффициент} + свободный
+член (ссылки на другие линейные индикаторы раскрываются). По картам:
+- совпадающие индикаторы становятся ссылкой на первый из них;
+- формула, целиком входящая в другую, подставляется в неё ссылкой;
+- общие частичные суммы (от MIN_SHARED_TERMS слагаемых) выносятся в отдельные
+  промежуточные узлы PARTIAL_PREFIX<N>, которые считаются один раз.
+Результат — план {имя: (карта слагаемых, свободный член)} и отчёт о числе слагаемых.
+"""
+from typing import Dict, List, Tuple
+
+# Префикс имён промежуточных частичных сумм (не попадают в indicator_values)
+PARTIAL_PREFIX = "_cse_"
+# Минимум слагаемых в выносимой частичной сумме
+MIN_SHARED_TERMS = 3
+
+LinearForm = Tuple[Dict[str, float], float]
+
+
+def expand_references(forms: Dict[str, LinearForm], order: List[str]) -> Dict[str, LinearForm]:
+    """Канонические карты слагаемых: ссылки на другие линейные индикаторы из forms
+    раскрываются (order — порядок вычисления, зависимости раньше). Ссылки на
+    нелинейные индикаторы остаются слагаемыми-именами."""
+    expanded: Dict[str, LinearForm] = {}
+    for name in order:
+        if name not in forms:
+            continue
+        coeffs, const = forms[name]
+        out: Dict[str, float] = {}
+        for term, c in coeffs.items():
+            if term in expanded:
+                ref_coeffs, ref_const = expanded[term]
+                for ref_term, ref_c in ref_coeffs.items():
+                    out[ref_term] = out.get(ref_term, 0.0) + c * ref_c
+                const += c * ref_const
+            else:
+                out[term] = out.get(term, 0.0) + c
+        expanded[name] = ({t: c for t, c in out.items() if c != 0.0}, const)
+    return expanded
+
+
+def _terms(form: LinearForm) -> frozenset:
+    return frozenset(form[0].items())
+
+
+def _substitute(form: LinearForm, shared: frozenset, name: str, shared_const: float = 0.0) -> LinearForm:
+    """Заменяет в форме слагаемые shared ссылкой на узел name (его свободный член shared_const)."""
+    coeffs, const = form
+    drop = {t for t, _ in shared}
+    out = {t: c for t, c in coeffs.items() if t not in drop}
+    out[name] = 1.0
+    return out, const - shared_const
+
+
+def optimize(forms: Dict[str, LinearForm], order: List[str], reserved=()) -> Tuple[Dict[str, LinearForm], dict]:
+    """План вычисления линейных формул forms (в исходной записи, со ссылками) с
+    вынесенными общими подвыражениями. reserved — уже занятые имена (std_key,
+    индикаторы), с которыми не должны совпасть имена частичных сумм.
+    Возвращает (план, отчёт); план содержит все индикаторы forms и частичные суммы."""
+    plan = dict(expand_references(forms, order))
+    report = {"terms_before": sum(len(c) for c, _ in forms.values()), "aliases": {}, "reused": {}, "partials": {}}
+
+    # Совпадающие индикаторы
+    seen = {}
+    for name in [n for n in order if n in plan]:
+        key = (_terms(plan[name]), plan[name][1])
+        if key in seen and plan[name][0]:
+            plan[name] = ({seen[key]: 1.0}, 0.0)
+            report["aliases"][name] = seen[key]
+        else:
+            seen[key] = name
+    nodes = [n for n in plan if n not in report["aliases"]]
+
+    reserved = set(reserved) | set(plan)
+    counter = 0
+    while True:
+        # Формула целиком входит в другую — подставляем ссылку (сначала самые длинные)
+        changed = True
+        while changed:
+            changed = False
+            for name in sorted(nodes, key=lambda n: -len(plan[n][0])):
+                terms = _terms(plan[name])
+                for other in sorted(nodes, key=lambda n: -len(plan[n][0])):
+                    other_terms = _terms(plan[other])
+                    if other != name and len(other_terms) >= 2 and other_terms < terms:
+                        plan[name] = _substitute(plan[name], other_terms, other, plan[other][1])
+                        report["reused"].setdefault(name, []).append(other)
+                        changed = True
+                        break
+        # Наибольшее общее подмножество слагаемых двух формул — новая частичная сумма
+        best = frozenset()
+        for i, a in enumerate(nodes):
+            terms_a = _terms(plan[a])
+            for b in nodes[i + 1:]:
+                common = terms_a & _terms(plan[b])
+                if len(common) > len(best):
+                    best = common
+        if len(best) < MIN_SHARED_TERMS:
+            break
+        counter += 1
+        while f"{PARTIAL_PREFIX}{counter}" in reserved:
+            counter += 1
+        partial = f"{PARTIAL_PREFIX}{counter}"
+        users = [n for n in nodes if best <= _terms(plan[n])]
+        for name in users:
+            plan[name] = _substitute(plan[name], best, partial)
+        plan[partial] = (dict(sorted(best)), 0.0)
+        nodes.append(partial)
+        report["partials"][partial] = {"terms": len(best), "used_by": users}
+
+    report["terms_after"] = sum(len(c) for c, _ in plan.values())
+    return plan, report
+
+
+def form_expression(form: LinearForm) -> str:
+    """Текст формулы по карте слагаемых: A + B - C + 0.5 * D + 100.0."""
+    coeffs, const = form
+    parts = []
+    for term, c in coeffs.items():
+        sign = "-" if c < 0 else "+"
+        mag = abs(c)
+        parts.append((sign, term if mag == 1.0 else f"{mag!r} * {term}"))
+    if const != 0.0 or not parts:
+        parts.append(("-" if const < 0 else "+", repr(abs(const))))
+    text = parts[0][1] if parts[0][0] == "+" else f"-{parts[0][1]}"
+    for sign, part in parts[1:]:
+        text += f" {sign} {part}"
+    return text
+
+
+def format_report(report: dict) -> List[str]:
+    """Строки отчёта optimize() для вывода в консоль."""
+    before, after = report["terms_before"], report["terms_after"]
+    lines = [f"Слагаемых в линейных формулах: {before} -> {after} (сэкономлено {before - after})"]
+    for name, target in report["aliases"].items():
+        lines.append(f"  {name} совпадает с {target}")
+    for name, refs in report["reused"].items():
+        lines.append(f"  {name} использует {', '.join(refs)}")
+    for name, info in report["partials"].items():
+        lines.append(f"  {name}: общая сумма из {info['terms']} слагаемых для {', '.join(info['used_by'])}")
+    return lines
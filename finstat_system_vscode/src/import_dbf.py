@@ -1,45 +1,274 @@
-import os, re
-from dbfread import DBF, FieldParser
+import os, re, time, hashlib, csv, gzip
+from collections import deque
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from tqdm import tqdm
-from .db import load_config, parse_filename_generic
-from .archive_utils import extract_archive, cleanup_temp_dir, list_archive_contents
+from .db import (load_config, parse_filename_generic, init_db, load_data_dictionary,
+                 DimensionKeys, write_raw_values, delete_raw_values, deferred_indexes)
+from .dbf_reader import ColumnarDBF, peek_field_names
+from .archive_utils import read_archive_members
 
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 CFG = load_config()
-
-class RelaxedFieldParser(FieldParser):
-    """Парсер DBF, который корректно обрабатывает числа с NUL-паддингом."""
-    def _clean_bytes(self, data):
-        if isinstance(data, (bytes, bytearray)):
-            return bytes(data).replace(b"\x00", b"").strip()
-        return data
-
-    def parseN(self, field, data):
-        data = self._clean_bytes(data)
-        try:
-            return super().parseN(field, data)
-        except Exception:
-            try:
-                s = data.decode('latin-1') if isinstance(data, (bytes, bytearray)) else str(data)
-                s = s.replace('\x00','').replace(' ', '').replace(',', '.')
-                if s == '':
-                    return None
-                # Пытаемся float, если точка присутствует
-                return float(s) if ('.' in s) else int(s)
-            except Exception:
-                return None
-
-    def parseF(self, field, data):
-        data = self._clean_bytes(data)
-        try:
-            return super().parseF(field, data)
-        except Exception:
+IMPORT_CFG = CFG.get("import") or {}
+BULK_CHUNK_SIZE = int(IMPORT_CFG.get("chunk_size", 50000) or 50000)
+# Порог объёма входных файлов (МБ), с которого индексы фактов перестраиваются после импорта
+REBUILD_INDEXES_MIN_MB = float(((CFG.get("storage") or {}).get("rebuild_indexes_min_mb", 100)) or 0)
+PROJECTION_MODES = ("none", "drop", "side_store")
+
+class BulkLoader:
+    """Пакетная запись нормализованных строк в raw_values.
+
+    Строки буферизуются и пишутся через executemany кусками по chunk_size
+    сразу в raw_facts (суррогатные ключи измерений берутся из DimensionKeys),
+    все куски одного файла попадают в одну транзакцию (commit в finish_file).
+    Вставки в banks дедуплицируются в пределах файла и пишутся перед строками
+    значений. Порядок строк сохраняется, поэтому INSERT OR REPLACE даёт то же
+    содержимое raw_values, что и построчная запись. Затронутые пары
+    (bank_id, period) фиксируются в dirty_pairs в той же транзакции.
+
+    Строки, отброшенные проекцией по словарю (add_dropped), в raw_values не
+    попадают: их пары (bank_id, period) пишутся в projected_pairs (чтобы набор
+    пар для расчёта индикаторов не зависел от проекции), а если задан
+    side_store — сами строки сохраняются в сжатый CSV побочного хранилища.
+    """
+
+    def __init__(self, conn, chunk_size=BULK_CHUNK_SIZE, side_store=None):
+        self.conn = conn
+        self.side_store = side_store
+        self.cur = conn.cursor()
+        self.dims = DimensionKeys(conn)
+        self.chunk_size = max(1, int(chunk_size))
+        self._rows = []
+        self._banks = {}
+        self._banks_written = set()
+        self._touched = set()
+        self._dropped = []
+        self._dropped_pairs = set()
+        self._started = None
+        self.total_rows = 0
+        self.total_seconds = 0.0
+        self.total_dropped = 0
+        self.dirty = set()
+
+    def begin_file(self):
+        self._rows = []
+        self._banks = {}
+        self._banks_written = set()
+        self._touched = set()
+        self._dropped = []
+        self._dropped_pairs = set()
+        self._started = time.perf_counter()
+
+    def add_bank(self, bank_id):
+        if bank_id not in self._banks_written:
+            self._banks[bank_id] = None
+
+    def add_form(self, form_code):
+        self.cur.execute("INSERT OR IGNORE INTO forms(form_code, form_name) VALUES(?,?)", (form_code, None))
+
+    def add_row(self, bank_id, form_code, period, item_code, value):
+        self._rows.append((bank_id, form_code, period, item_code, value))
+        if len(self._rows) >= self.chunk_size:
+            self.flush()
+
+    def add_rows(self, bank_ids, form_code, period, item_codes, values):
+        """Пакетный add_row: списки по строкам, форма и период общие."""
+        n = len(values)
+        pos = 0
+        while pos < n:
+            end = min(n, pos + self.chunk_size - len(self._rows))
+            self._rows.extend(zip(bank_ids[pos:end], repeat(form_code, end - pos), repeat(period, end - pos),
+                                  item_codes[pos:end], values[pos:end]))
+            pos = end
+            if len(self._rows) >= self.chunk_size:
+                self.flush()
+
+    def add_dropped(self, bank_ids, form_code, period, item_codes, values):
+        """Строки вне словаря (режим проекции): в raw_values не пишутся."""
+        self.total_dropped += len(values)
+        pairs = {(b, period) for b in bank_ids}
+        self._dropped_pairs.update(pairs)
+        self._touched.update(pairs)
+        if self.side_store:
+            self._dropped.extend(zip(bank_ids, item_codes, values))
+
+    def flush(self):
+        if self._banks:
+            self.cur.executemany("INSERT OR IGNORE INTO banks(bank_id, bank_name) VALUES(?,?)",
+                                 [(b, None) for b in self._banks])
+            self._banks_written.update(self._banks)
+            self._banks = {}
+        if self._rows:
+            self._touched.update((r[0], r[2]) for r in self._rows)
+            write_raw_values(self.conn, self._rows, self.dims)
+            self._rows = []
+
+    def finish_file(self, log_name, bank_id, form_code, period, rows, manifest=None):
+        """Дописывает остаток буфера, журнал импорта, манифест и фиксирует транзакцию файла.
+        manifest — (archive, member, sha256, size). Возвращает скорость загрузки (строк/с)."""
+        self.flush()
+        self._mark_dirty()
+        if self._dropped:
+            _write_side_store(self.side_store, log_name, form_code, period, self._dropped)
+            self._dropped = []
+        self.cur.execute("INSERT OR REPLACE INTO ingestion_log(file_name, bank_id, form_code, period, rows_loaded) VALUES(?,?,?,?,?)",
+                         (log_name, bank_id, form_code, period, rows))
+        if manifest:
+            self.cur.execute("INSERT OR REPLACE INTO ingestion_manifest(archive, member, sha256, size, form_code, period, rows_loaded) "
+                             "VALUES(?,?,?,?,?,?,?)", tuple(manifest) + (form_code, period, rows))
+        self.conn.commit()
+        elapsed = time.perf_counter() - (self._started or time.perf_counter())
+        self._started = None
+        self.total_rows += rows
+        self.total_seconds += elapsed
+        return rows / elapsed if elapsed > 0 else float(rows)
+
+    def commit_rows(self):
+        """Дописывает буфер и фиксирует транзакцию без записи в журнал и манифест."""
+        self.flush()
+        self._mark_dirty()
+        self._dropped = []
+        self.conn.commit()
+
+    def _mark_dirty(self):
+        if self._dropped_pairs:
+            self.cur.executemany("INSERT OR IGNORE INTO projected_pairs(bank_id, period) VALUES(?,?)",
+                                 sorted(self._dropped_pairs))
+            self._dropped_pairs = set()
+        if self._touched:
+            self.cur.executemany("INSERT OR IGNORE INTO dirty_pairs(bank_id, period) VALUES(?,?)",
+                                 sorted(self._touched))
+            self.dirty.update(self._touched)
+            self._touched = set()
+
+    def discard_previous(self, form_code, period, bank_id=None):
+        """Удаляет строки прежней версии файла (форма, период; банк — у файла одного банка)
+        в транзакции текущего файла и отмечает их пары в dirty_pairs. Возвращает число пар."""
+        pairs = delete_raw_values(self.conn, form_code, period, bank_id)
+        if pairs:
+            self.cur.executemany("INSERT OR IGNORE INTO dirty_pairs(bank_id, period) VALUES(?,?)", pairs)
+            self.dirty.update(pairs)
+        return len(pairs)
+
+    def rate(self):
+        return self.total_rows / self.total_seconds if self.total_seconds > 0 else 0.0
+
+
+def _to_float(val, encoding):
+    try:
+        if val is None or val == "":
+            return None
+        if isinstance(val, (int, float)):
+            return float(val)
+        if isinstance(val, bytes):
+            # Декодируем байтовые строки с NUL-паддингом
             try:
-                s = data.decode('latin-1') if isinstance(data, (bytes, bytearray)) else str(data)
-                s = s.replace('\x00','').replace(' ', '').replace(',', '.')
-                return float(s) if s != '' else None
+                s = val.decode(encoding, errors='ignore')
             except Exception:
+                s = val.decode('latin-1', errors='ignore')
+            s = s.replace("\x00", "").strip().replace(" ", "").replace(",", ".")
+            if not s:
                 return None
+            return float(s)
+        # Строка: чистим пробелы/запятые/точки
+        s = str(val).replace("\x00", "").strip().replace(" ", "").replace(",", ".")
+        if not s or s.lower() in ["none", "null", "n/a"]:
+            return None
+        return float(s)
+    except Exception:
+        return None
+
+def _projection_items(mode=None):
+    """Коды статей словаря по формам для проекции импорта.
+
+    mode — режим import.projection: 'none' (грузим всё, возвращает None),
+    'drop' или 'side_store' — {form_code: set(item_code)} из data_dictionary.csv.
+    """
+    mode = mode or IMPORT_CFG.get("projection") or "none"
+    if mode not in PROJECTION_MODES:
+        raise ValueError(f"Неизвестный режим проекции: {mode} (ожидается одно из {', '.join(PROJECTION_MODES)})")
+    if mode == "none":
+        return None
+    keep = {}
+    for form_code, item_code in load_data_dictionary():
+        keep.setdefault(form_code, set()).add(item_code)
+    return keep
+
+def _side_store_folder(mode=None):
+    """Папка побочного хранилища, если строки вне словаря нужно сохранять."""
+    mode = mode or IMPORT_CFG.get("projection") or "none"
+    if mode != "side_store":
+        return None
+    return os.path.join(BASE_DIR, IMPORT_CFG.get("side_store_folder") or os.path.join("data", "side_store"))
+
+def _write_side_store(folder, log_name, form_code, period, rows):
+    """Сохраняет отброшенные строки файла в <folder>/<form_code>/<period>__<файл>.csv.gz."""
+    target = os.path.join(folder, str(form_code))
+    os.makedirs(target, exist_ok=True)
+    safe = re.sub(r"[^\w.-]+", "_", log_name)
+    path = os.path.join(target, f"{period}__{safe}.csv.gz")
+    with gzip.open(path, "wt", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["bank_id", "item_code", "value"])
+        w.writerows(rows)
+
+def _content_digest(source):
+    """sha256 и размер содержимого DBF (путь к файлу, bytes или открытая ColumnarDBF)."""
+    h = hashlib.sha256()
+    if isinstance(source, ColumnarDBF):
+        source = source.buffer
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        h.update(source)
+        return h.hexdigest(), len(source)
+    size = 0
+    with open(source, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+            size += len(chunk)
+    return h.hexdigest(), size
+
+def _manifest_entry(archive_name, fname, digest):
+    """Ключ манифеста: (archive, member, sha256, size); у одиночного DBF archive = ''."""
+    sha, size = digest
+    return (archive_name or "", fname, sha, size)
+
+def _already_loaded(cur, entry, form_code, period):
+    """True, если содержимое с тем же sha256 уже загружено для этой формы и периода.
+
+    Переименованный файл (или член другого архива) с тем же содержимым не
+    загружается повторно — в манифест лишь добавляется запись под новым именем.
+    """
+    archive, member, sha, size = entry
+    cur.execute("SELECT archive, member, rows_loaded FROM ingestion_manifest "
+                "WHERE sha256=? AND form_code IS ? AND period IS ?", (sha, form_code, period))
+    found = cur.fetchall()
+    if not found:
+        return False
+    if not any(a == archive and m == member for a, m, _ in found):
+        cur.execute("INSERT OR REPLACE INTO ingestion_manifest(archive, member, sha256, size, form_code, period, rows_loaded) "
+                    "VALUES(?,?,?,?,?,?,?)", (archive, member, sha, size, form_code, period, found[0][2]))
+        cur.connection.commit()
+    return True
+
+def _replaces_version(cur, entry, form_code, period):
+    """True, если этот же член (archive, member) уже загружен для формы и периода с другим
+    содержимым: исправленный файл заменяет прежние строки, а не дописывается поверх них."""
+    archive, member, sha, _ = entry
+    cur.execute("SELECT sha256 FROM ingestion_manifest WHERE archive=? AND member=? "
+                "AND form_code IS ? AND period IS ?", (archive, member, form_code, period))
+    found = cur.fetchone()
+    return found is not None and found[0] != sha
+
+def _discard_replaced(cur, loader, entry, bank_id, form_code, period):
+    """Перед загрузкой изменённого члена удаляет строки его прежней версии. Файлы форм
+    ЦБ содержат все банки формы за период; у файла одного банка (имя по filename_regex)
+    удаляются только строки этого банка. Возвращает True, если строки удалялись."""
+    if not _replaces_version(cur, entry, form_code, period):
+        return False
+    loader.discard_previous(form_code, period, None if bank_id in (None, "UNKNOWN") else bank_id)
+    return True
 
 def _guess_field(record, preferred):
     for key in preferred:
@@ -49,39 +278,119 @@ def _guess_field(record, preferred):
         if key.lower() in lower: return lower[key.lower()]
     return None
 
-def _build_meta_map(dbf_paths):
-    """Строит карту признака A/P для форм 0409802/0409803 по meta-файлам в распакованном архиве."""
+def _collect_meta(table, form_code, meta):
+    """Дополняет карту признака A/P для 0409802/0409803 по meta-файлу (F802META/F803META)."""
+    # ожидаем поля: FSECTION ('АКТИВЫ'/'ПАССИВЫ'), FSTR ('1','2','32.1', ...)
+    fields = set(table.field_names)
+    n = len(table)
+    sections = table.values('FSECTION') if 'FSECTION' in fields else [None] * n
+    fstrs = table.values('FSTR') if 'FSTR' in fields else [None] * n
+    for sec, fstr in zip(sections, fstrs):
+        sec = str(sec or '').strip().upper()
+        fstr = str(fstr or '').strip()
+        if not fstr:
+            continue
+        ap = 'A' if 'АКТИВ' in sec else 'P' if 'ПАССИВ' in sec else None
+        if ap:
+            meta[(form_code, fstr)] = ap
+
+
+def _collect_bank_names(table, bank_names):
+    """Дополняет {bank_id: bank_name} из DBF, где есть поля REGN и NAME_B."""
+    field_names = {f.upper() for f in table.field_names}
+    if 'REGN' not in field_names or 'NAME_B' not in field_names:
+        return
+    n = len(table)
+    regns = table.values('REGN') if 'REGN' in table.field_names else [None] * n
+    names_b = table.values('NAME_B') if 'NAME_B' in table.field_names else [None] * n
+    found = {}
+    for regn, name_b in zip(regns, names_b):
+        bank_id = str(regn) if regn is not None else None
+        bank_name = str(name_b).strip() if name_b is not None else None
+        if bank_id and bank_name:
+            found[bank_id] = bank_name
+    bank_names.update(found)
+
+
+def _scan_members(sources, forms_cfg, generic_pattern):
+    """Однократное открытие каждого DBF с классификацией по имени и набору полей.
+
+    За один проход по членам собираются наименования банков (REGN + NAME_B),
+    карта A/P из F802META/F803META и открытые таблицы форм для разбора значений.
+    sources — список (имя файла, путь или bytes).
+
+    Возвращает (tables, bank_names, meta_map):
+      - tables: [(имя, ColumnarDBF)] для DBF форм; если файл не открылся — (имя, source);
+      - bank_names: {bank_id: bank_name} (при повторах побеждает последнее значение);
+      - meta_map: {(form_code, FSTR): 'A'|'P'}.
+    """
+    tables = []
+    bank_names = {}
     meta = {}
-    for p in dbf_paths:
-        name = os.path.basename(p).upper()
+    for name, source in sources:
+        _, form_code, period = _detect_form_period(name, forms_cfg, generic_pattern)
+        # Справочники читаются в cp866, DBF форм — в кодировке формы
+        encoding = forms_cfg.get(form_code, {}).get("encoding", "utf-8") if period else 'cp866'
         try:
-            if name.startswith('F802META') and name.endswith('.DBF'):
-                t = DBF(p, encoding='cp866', char_decode_errors='ignore')
-                # ожидаем поля: FSECTION ('АКТИВЫ'/'ПАССИВЫ'), FSTR ('1','2','32.1', ...)
-                for r in t:
-                    sec = str(r.get('FSECTION') or '').strip().upper()
-                    fstr = str(r.get('FSTR') or '').strip()
-                    if not fstr:
-                        continue
-                    ap = 'A' if 'АКТИВ' in sec else 'P' if 'ПАССИВ' in sec else None
-                    if ap:
-                        meta[("0409802", fstr)] = ap
-            if name.startswith('F803META') and name.endswith('.DBF'):
-                t = DBF(p, encoding='cp866', char_decode_errors='ignore')
-                for r in t:
-                    sec = str(r.get('FSECTION') or '').strip().upper()
-                    fstr = str(r.get('FSTR') or '').strip()
-                    if not fstr:
-                        continue
-                    ap = 'A' if 'АКТИВ' in sec else 'P' if 'ПАССИВ' in sec else None
-                    if ap:
-                        meta[("0409803", fstr)] = ap
+            table = ColumnarDBF(source, encoding=encoding, char_decode_errors='ignore')
         except Exception:
+            if period:
+                tables.append((name, source))
             continue
-    return meta
+        ref = table.with_encoding('cp866')
+        try:
+            _collect_bank_names(ref, bank_names)
+        except Exception:
+            # Тихо пропускаем любые ошибки на нецелевых файлах
+            pass
+        upper = name.upper()
+        if upper.endswith('.DBF') and upper.startswith(('F802META', 'F803META')):
+            try:
+                _collect_meta(ref, "0409802" if upper.startswith('F802META') else "0409803", meta)
+            except Exception:
+                pass
+        if period:
+            tables.append((name, table))
+        else:
+            table.close()
+    return tables, bank_names, meta
+
+
+def _close_tables(tables):
+    for _name, table in tables:
+        if isinstance(table, ColumnarDBF):
+            table.close()
+
+
+def _select_member(name, peek, forms_cfg, generic_pattern):
+    """Нужен ли член архива импорту: DBF формы (по filename_patterns или
+    filename_regex), meta-файл 0409802/0409803 или справочник с REGN и NAME_B."""
+    upper = name.upper()
+    if upper.startswith(('F802META', 'F803META')):
+        return True
+    if _detect_form_period(name, forms_cfg, generic_pattern)[1]:
+        return True
+    try:
+        fields = {f.upper() for f in peek_field_names(peek)}
+    except Exception:
+        return False
+    return 'REGN' in fields and 'NAME_B' in fields
 
 
-def import_all_dbf(conn):
+def _read_archive(archive_path, forms_cfg, generic_pattern):
+    """Читает в память только нужные импорту DBF из архива (без распаковки на диск).
+    Возвращает (members, has_dbf) — см. read_archive_members."""
+    return read_archive_members(
+        archive_path, lambda name, peek: _select_member(name, peek, forms_cfg, generic_pattern))
+
+
+def import_all_dbf(conn, workers=None, projection=None, files=None):
+    """Импорт всех DBF/архивов из input/.
+
+    projection — режим проекции по словарю ('none' | 'drop' | 'side_store'),
+    по умолчанию import.projection из config.yaml. files — импортировать только
+    эти имена файлов из input/ (используется режимом watch).
+    """
     input_folder = os.path.join(BASE_DIR, CFG.get("input_folder", "input"))
     archive_folder = os.path.join(BASE_DIR, CFG.get("archive_folder", "archive"))
     os.makedirs(archive_folder, exist_ok=True)
@@ -89,17 +398,38 @@ def import_all_dbf(conn):
     default_value_fields = CFG.get("default_value_fields", ["VALUE","AMOUNT","SUM","VAL","VSEGO","C3","IITG"])
     forms_cfg = CFG.get("forms", {})
     generic_pattern = CFG.get("filename_regex")
+    if workers is None:
+        workers = int(IMPORT_CFG.get("workers", 1) or 1)
+    keep_items = _projection_items(projection)
 
-    cur = conn.cursor()
+    # Таблицы манифеста и dirty_pairs могут отсутствовать в БД, созданной раньше
+    init_db(conn)
+    loader = BulkLoader(conn, side_store=_side_store_folder(projection))
 
     # Получаем все файлы (.dbf и архивы)
     all_files = []
     for f in os.listdir(input_folder):
-        if f.lower().endswith((".dbf", ".rar", ".zip")):
+        if f.lower().endswith((".dbf", ".rar", ".zip")) and (files is None or f in files):
             all_files.append(f)
     all_files.sort()
 
-    # Обрабатываем каждый файл
+    # Крупный импорт: вторичные индексы фактов снимаются и строятся заново в конце
+    input_mb = sum(os.path.getsize(os.path.join(input_folder, f)) for f in all_files) / 1e6
+    rebuild = bool(all_files) and input_mb >= REBUILD_INDEXES_MIN_MB
+    with deferred_indexes(conn, ("raw_facts",), enabled=rebuild) as dropped:
+        if dropped:
+            print(f"Объём входных файлов {input_mb:.0f} МБ: индексы {', '.join(dropped)} будут перестроены после импорта")
+        if workers > 1 and len(all_files) > 1:
+            _import_parallel(conn, loader, all_files, input_folder, archive_folder, forms_cfg, generic_pattern,
+                             default_item_fields, default_value_fields, workers, keep_items)
+        else:
+            _import_serial(conn, loader, all_files, input_folder, archive_folder, forms_cfg, generic_pattern,
+                           default_item_fields, default_value_fields, keep_items)
+    _print_summary(loader)
+
+def _import_serial(conn, loader, all_files, input_folder, archive_folder, forms_cfg, generic_pattern,
+                   default_item_fields, default_value_fields, keep_items):
+    """Последовательный импорт: файлы по одному в текущем процессе."""
     pbar = tqdm(all_files, desc="Импорт файлов")
     for fname in pbar:
         pbar.set_postfix({"файл": fname})
@@ -107,76 +437,280 @@ def import_all_dbf(conn):
         if fname.lower().endswith((".rar", ".zip")):
             # Обрабатываем архив
             archive_path = os.path.join(input_folder, fname)
-            dbf_files, temp_dir = extract_archive(archive_path)
-            # Пытаемся извлечь полные наименования банков из справочных DBF (если есть)
-            _maybe_update_bank_names(conn, dbf_files)
-            meta_map = _build_meta_map(dbf_files)
+            members, has_dbf = _read_archive(archive_path, forms_cfg, generic_pattern)
+            # Один проход по членам: наименования банков, meta A/P и таблицы форм
+            tables, bank_names, meta_map = _scan_members(members, forms_cfg, generic_pattern)
+            del members
+            _apply_bank_names(conn, bank_names)
 
-            if not dbf_files:
+            if not has_dbf:
                 print(f"Не удалось извлечь DBF из {fname}")
                 continue
 
-            # Обрабатываем каждый DBF в архиве
-            for dbf_path in dbf_files:
-                dbf_name = os.path.basename(dbf_path)
-                _process_dbf_file(conn, dbf_path, dbf_name, forms_cfg, generic_pattern,
-                                 default_item_fields, default_value_fields, pbar, fname, meta_map)
+            # Обрабатываем каждый DBF формы прямо из памяти
+            try:
+                for dbf_name, table in tables:
+                    _process_dbf_file(conn, table, dbf_name, forms_cfg, generic_pattern,
+                                     default_item_fields, default_value_fields, pbar, fname, meta_map, loader,
+                                     keep_items)
+            finally:
+                _close_tables(tables)
 
-            # Очищаем временную папку
-            if temp_dir:
-                cleanup_temp_dir(temp_dir)
             # Переносим обработанный архив в архивную папку
-            try:
-                os.replace(archive_path, os.path.join(archive_folder, fname))
-            except Exception as e:
-                print(f"Не удалось переместить архив {fname} в {archive_folder}: {e}")
+            _move_to_archive(archive_path, archive_folder, fname)
         else:
             # Обрабатываем обычный DBF файл
             dbf_path = os.path.join(input_folder, fname)
-            _process_dbf_file(conn, dbf_path, fname, forms_cfg, generic_pattern,
-                             default_item_fields, default_value_fields, pbar, None, {})
-            # Также пробуем обновить название банка, если файл содержит NAME_B
-            _maybe_update_bank_names(conn, [dbf_path])
-            # Переносим обработанный DBF в архивную папку
+            tables, bank_names, _ = _scan_members([(fname, dbf_path)], forms_cfg, generic_pattern)
             try:
-                os.replace(dbf_path, os.path.join(archive_folder, fname))
-            except Exception as e:
-                print(f"Не удалось переместить файл {fname} в {archive_folder}: {e}")
+                for dbf_name, table in tables:
+                    _process_dbf_file(conn, table, dbf_name, forms_cfg, generic_pattern,
+                                     default_item_fields, default_value_fields, pbar, None, {}, loader,
+                                     keep_items)
+            finally:
+                _close_tables(tables)
+            # Также обновляем название банка, если файл содержит NAME_B
+            _apply_bank_names(conn, bank_names)
+            # Переносим обработанный DBF в архивную папку
+            _move_to_archive(dbf_path, archive_folder, fname)
 
-    print("Импорт завершен.")
+def rehydrate_form(conn, form_code, period=None, projection=None):
+    """Повторно загружает строки формы из уже обработанных файлов в archive/.
 
-def _maybe_update_bank_names(conn, dbf_paths):
-    """Обновляет таблицу banks.bank_name, если во входных DBF присутствуют поля REGN и NAME_B."""
-    cur = conn.cursor()
-    for p in dbf_paths:
+    Нужна, когда data_dictionary.csv расширился после импорта с проекцией:
+    файлы формы (одиночные DBF и члены архивов) разбираются заново, и строки,
+    попадающие под текущий словарь (при projection='none' — все), пишутся в
+    raw_values через INSERT OR REPLACE. Манифест и журнал импорта не меняются,
+    затронутые пары (банк, период) отмечаются в dirty_pairs.
+    """
+    archive_folder = os.path.join(BASE_DIR, CFG.get("archive_folder", "archive"))
+    default_item_fields = CFG.get("default_item_fields", ["ITEM","ROW_CODE","CODE","ACODE","STR","C1"])
+    default_value_fields = CFG.get("default_value_fields", ["VALUE","AMOUNT","SUM","VAL","VSEGO","C3","IITG"])
+    forms_cfg = CFG.get("forms", {})
+    generic_pattern = CFG.get("filename_regex")
+    form_code = str(form_code)
+    keep_items = _projection_items(projection)
+
+    init_db(conn)
+    loader = BulkLoader(conn)
+    files = sorted(f for f in os.listdir(archive_folder) if f.lower().endswith((".dbf", ".rar", ".zip"))) \
+        if os.path.isdir(archive_folder) else []
+    total_rows = 0
+    total_files = 0
+    for fname in tqdm(files, desc=f"Восстановление формы {form_code}"):
+        path = os.path.join(archive_folder, fname)
+        if fname.lower().endswith((".rar", ".zip")):
+            members, _ = _read_archive(path, forms_cfg, generic_pattern)
+            tables, _, meta_map = _scan_members(members, forms_cfg, generic_pattern)
+            del members
+        else:
+            if str(_detect_form_period(fname, forms_cfg, generic_pattern)[1]) != form_code:
+                continue
+            tables, _, _ = _scan_members([(fname, path)], forms_cfg, generic_pattern)
+            meta_map = {}
         try:
-            table = DBF(p, encoding='cp866', char_decode_errors='ignore', parserclass=RelaxedFieldParser)
-            # Соберём множество полей
-            field_names = {f.name.upper() for f in table.fields}
-            if 'REGN' in field_names and 'NAME_B' in field_names:
-                for r in table:
-                    regn = r.get('REGN')
-                    name_b = r.get('NAME_B')
-                    bank_id = str(regn) if regn is not None else None
-                    bank_name = str(name_b).strip() if name_b is not None else None
-                    if bank_id and bank_name:
-                        cur.execute("UPDATE banks SET bank_name=? WHERE bank_id=?", (bank_name, bank_id))
-                conn.commit()
-        except Exception:
-            # Тихо пропускаем любые ошибки на нецелевых файлах
-            continue
+            for dbf_name, table in tables:
+                _, member_form, member_period = _detect_form_period(dbf_name, forms_cfg, generic_pattern)
+                if str(member_form) != form_code or (period and member_period != period):
+                    continue
+                decoded = _decode_dbf_file(table, dbf_name, forms_cfg, generic_pattern,
+                                           default_item_fields, default_value_fields, loader, meta_map, keep_items)
+                if decoded is None or decoded[3] is None:
+                    continue
+                loader.commit_rows()
+                total_rows += decoded[3]
+                total_files += 1
+        finally:
+            _close_tables(tables)
+    print(f"Восстановлено строк формы {form_code}: {total_rows} (файлов: {total_files})")
+    if loader.dirty:
+        print(f"Затронуто пар (банк, период): {len(loader.dirty)}")
+    return total_rows
+
+def _print_summary(loader):
+    if loader.total_rows:
+        print(f"Загружено строк: {loader.total_rows} ({loader.rate():,.0f} строк/с)")
+    if loader.total_dropped:
+        where = f" (сохранены в {loader.side_store})" if loader.side_store else ""
+        print(f"Отброшено строк вне словаря: {loader.total_dropped}{where}")
+    if loader.dirty:
+        print(f"Затронуто пар (банк, период): {len(loader.dirty)}")
+    print("Импорт завершен.")
 
-def _process_dbf_file(conn, dbf_path, fname, forms_cfg, generic_pattern,
-                     default_item_fields, default_value_fields, pbar, archive_name=None, meta_map=None):
-    """Обработка одного DBF файла"""
+def _move_to_archive(path, archive_folder, fname):
+    try:
+        os.replace(path, os.path.join(archive_folder, fname))
+    except Exception as e:
+        kind = "архив" if fname.lower().endswith((".rar", ".zip")) else "файл"
+        print(f"Не удалось переместить {kind} {fname} в {archive_folder}: {e}")
+
+
+class _RowBatch:
+    """Накопитель нормализованных строк одного DBF для параллельного импорта.
+
+    Имеет тот же интерфейс, что и BulkLoader, но ничего не пишет в БД: строки
+    хранятся колонками (форма и период у файла общие), чтобы дешевле передавать
+    их из дочернего процесса в процесс-писатель.
+    """
+
+    def __init__(self):
+        self.begin_file()
+
+    def begin_file(self):
+        self.banks = {}
+        self.forms = []
+        self.bank_ids = []
+        self.item_codes = []
+        self.values = []
+        self.dropped = None
+
+    def add_bank(self, bank_id):
+        self.banks[bank_id] = None
+
+    def add_form(self, form_code):
+        self.forms.append(form_code)
+
+    def add_row(self, bank_id, form_code, period, item_code, value):
+        self.bank_ids.append(bank_id)
+        self.item_codes.append(item_code)
+        self.values.append(value)
+
+    def add_rows(self, bank_ids, form_code, period, item_codes, values):
+        self.bank_ids.extend(bank_ids)
+        self.item_codes.extend(item_codes)
+        self.values.extend(values)
+
+    def add_dropped(self, bank_ids, form_code, period, item_codes, values):
+        self.dropped = (bank_ids, item_codes, values)
+
+    def flush(self):
+        pass
+
+    def replay(self, loader, form_code, period):
+        """Переносит накопленные строки в BulkLoader в исходном порядке."""
+        for f in self.forms:
+            loader.add_form(f)
+        for b in self.banks:
+            loader.add_bank(b)
+        loader.add_rows(self.bank_ids, form_code, period, self.item_codes, self.values)
+        if self.dropped:
+            bank_ids, item_codes, values = self.dropped
+            loader.add_dropped(bank_ids, form_code, period, item_codes, values)
+
+
+def _decode_input_file(input_folder, fname, forms_cfg, generic_pattern,
+                       default_item_fields, default_value_fields, keep_items=None):
+    """Чтение и декодирование одного входного файла (выполняется в пуле процессов).
+
+    Возвращает словарь с декодированными DBF (в порядке обработки) и найденными
+    наименованиями банков; в БД ничего не пишет.
+    """
+    path = os.path.join(input_folder, fname)
+    result = {"fname": fname, "path": path, "is_archive": fname.lower().endswith((".rar", ".zip")),
+              "extracted": True, "bank_names": {}, "members": []}
+    if result["is_archive"]:
+        members, has_dbf = _read_archive(path, forms_cfg, generic_pattern)
+        tables, result["bank_names"], meta_map = _scan_members(members, forms_cfg, generic_pattern)
+        del members
+        if not has_dbf:
+            result["extracted"] = False
+            return result
+    else:
+        tables, result["bank_names"], meta_map = _scan_members([(fname, path)], forms_cfg, generic_pattern)
+        meta_map = {}
+    try:
+        for dbf_name, table in tables:
+            digest = _content_digest(table)
+            batch = _RowBatch()
+            decoded = _decode_dbf_file(table, dbf_name, forms_cfg, generic_pattern,
+                                       default_item_fields, default_value_fields, batch, meta_map, keep_items)
+            result["members"].append((dbf_name, decoded, batch, digest))
+    finally:
+        _close_tables(tables)
+    return result
+
+
+def _import_parallel(conn, loader, all_files, input_folder, archive_folder, forms_cfg, generic_pattern,
+                     default_item_fields, default_value_fields, workers, keep_items=None):
+    """Параллельный импорт: распаковка и разбор DBF в пуле процессов, запись — одним писателем.
+
+    Результаты забираются строго в порядке отсортированного списка файлов, поэтому
+    ingestion_log, обновление наименований банков и перенос в archive/ выполняются
+    в той же последовательности, что и при последовательном импорте. Окно
+    одновременно обрабатываемых файлов ограничено (2 × workers), чтобы не держать
+    в памяти весь бэкфилл.
+    """
     cur = conn.cursor()
+    window = max(2, workers * 2)
+    pbar = tqdm(total=len(all_files), desc=f"Импорт файлов ({workers} процессов)")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        files = iter(all_files)
+        for fname in files:
+            pending.append(pool.submit(_decode_input_file, input_folder, fname, forms_cfg, generic_pattern,
+                                       default_item_fields, default_value_fields, keep_items))
+            if len(pending) >= window:
+                break
+        while pending:
+            result = pending.popleft().result()
+            nxt = next(files, None)
+            if nxt is not None:
+                pending.append(pool.submit(_decode_input_file, input_folder, nxt, forms_cfg, generic_pattern,
+                                           default_item_fields, default_value_fields, keep_items))
+            fname = result["fname"]
+            pbar.set_postfix({"файл": fname})
+            if result["is_archive"]:
+                _apply_bank_names(conn, result["bank_names"])
+                if not result["extracted"]:
+                    print(f"Не удалось извлечь DBF из {fname}")
+                    pbar.update(1)
+                    continue
+                for dbf_name, decoded, batch, digest in result["members"]:
+                    _write_decoded(cur, loader, fname, dbf_name, decoded, batch, digest, pbar)
+            else:
+                for dbf_name, decoded, batch, digest in result["members"]:
+                    _write_decoded(cur, loader, None, dbf_name, decoded, batch, digest, pbar)
+                _apply_bank_names(conn, result["bank_names"])
+            _move_to_archive(result["path"], archive_folder, fname)
+            pbar.update(1)
+    pbar.close()
+
+
+def _write_decoded(cur, loader, archive_name, fname, decoded, batch, digest, pbar):
+    """Запись заранее декодированного DBF (писатель параллельного импорта)."""
+    if decoded is None:
+        return
+    bank_id, form_code, period, rows = decoded
+    entry = _manifest_entry(archive_name, fname, digest)
+    if _already_loaded(cur, entry, form_code, period):
+        return
+    check_name = _log_name(archive_name, fname)
+    loader.begin_file()
+    if rows is None:
+        batch.replay(loader, form_code, period)
+        loader.flush()
+        return
+    _discard_replaced(cur, loader, entry, bank_id, form_code, period)
+    batch.replay(loader, form_code, period)
+    rate = loader.finish_file(check_name, bank_id, form_code, period, rows, entry)
+    pbar.set_postfix({"файл": check_name, "строк": rows, "строк/с": f"{rate:,.0f}"})
+
+
+def _log_name(archive_name, fname):
+    """Имя файла в ingestion_log: у членов архива — «архив/член»."""
+    return f"{archive_name}/{fname}" if archive_name else fname
+
 
-    # Проверяем, не был ли уже импортирован (используем имя архива если есть)
-    check_name = archive_name or fname
-    cur.execute("SELECT 1 FROM ingestion_log WHERE file_name=?", (check_name,))
-    if cur.fetchone():
+def _apply_bank_names(conn, bank_names):
+    """Обновляет banks.bank_name одним пакетом по собранному {bank_id: bank_name}."""
+    if not bank_names:
         return
+    conn.cursor().executemany("UPDATE banks SET bank_name=? WHERE bank_id=?",
+                              [(name, bank_id) for bank_id, name in bank_names.items()])
+    conn.commit()
 
+def _detect_form_period(fname, forms_cfg, generic_pattern):
+    """Определяет (bank_id, form_code, period) по имени файла."""
     bank_id = None
     form_code = None
     period = None
@@ -200,152 +734,175 @@ def _process_dbf_file(conn, dbf_path, fname, forms_cfg, generic_pattern,
     if not form_code:
         parsed = parse_filename_generic(fname, generic_pattern)
         if parsed: bank_id, form_code, period = parsed
+    return bank_id, form_code, period
+
+def _process_dbf_file(conn, source, fname, forms_cfg, generic_pattern,
+                     default_item_fields, default_value_fields, pbar, archive_name=None, meta_map=None, loader=None,
+                     keep_items=None):
+    """Обработка одного DBF файла"""
+    cur = conn.cursor()
+    loader = loader or BulkLoader(conn)
+
+    bank_id, form_code, period = _detect_form_period(fname, forms_cfg, generic_pattern)
     if not period:
         return
+    # Проверяем по манифесту, не загружено ли уже такое содержимое
+    entry = _manifest_entry(archive_name, fname, _content_digest(source))
+    if _already_loaded(cur, entry, form_code, period):
+        return
+    check_name = _log_name(archive_name, fname)
+    # Изменённое содержимое того же члена: строки прежней версии удаляются в транзакции файла
+    replaced = _discard_replaced(cur, loader, entry, bank_id, form_code, period)
 
-    cur.execute("INSERT OR IGNORE INTO banks(bank_id, bank_name) VALUES(?,?)", (bank_id or "UNKNOWN", None))
-    cur.execute("INSERT OR IGNORE INTO forms(form_code, form_name) VALUES(?,?)", (form_code, None))
+    decoded = _decode_dbf_file(source, fname, forms_cfg, generic_pattern,
+                               default_item_fields, default_value_fields, loader, meta_map, keep_items)
+    if decoded is None:
+        return
+    bank_id, form_code, period, rows = decoded
+    if rows is None:
+        if replaced:
+            # Новую версию прочитать не удалось — прежние строки остаются
+            conn.rollback()
+        return
+    rate = loader.finish_file(check_name, bank_id, form_code, period, rows, entry)
+    pbar.set_postfix({"файл": check_name, "строк": rows, "строк/с": f"{rate:,.0f}"})
+
+def _decode_dbf_file(source, fname, forms_cfg, generic_pattern,
+                     default_item_fields, default_value_fields, sink, meta_map=None, keep_items=None):
+    """Разбор одного DBF в нормализованные строки, которые передаются в sink
+    (BulkLoader или _RowBatch). source — путь к DBF, его содержимое (bytes)
+    или уже открытая ColumnarDBF (после разбора она закрывается).
+
+    keep_items — {form_code: set(item_code)} для проекции по словарю: строки
+    с другими кодами передаются в sink.add_dropped; None — загружаются все.
+
+    Возвращает (bank_id, form_code, period, rows); rows=None, если DBF не удалось
+    прочитать. None — если по имени файла не удалось определить период.
+    """
+    bank_id, form_code, period = _detect_form_period(fname, forms_cfg, generic_pattern)
+    if not period:
+        return None
 
+    sink.begin_file()
+    sink.add_bank(bank_id or "UNKNOWN")
+    sink.add_form(form_code)
     # Получаем настройки кодировки
-    encoding = forms_cfg.get(form_code, {}).get("encoding", "utf-8")
+    encoding = (forms_cfg.get(form_code) or {}).get("encoding", "utf-8")
 
     try:
-        table = DBF(dbf_path, encoding=encoding, char_decode_errors='ignore', parserclass=RelaxedFieldParser)
+        table = source if isinstance(source, ColumnarDBF) else \
+            ColumnarDBF(source, encoding=encoding, char_decode_errors='ignore')
     except Exception as e:
         print(f"Ошибка чтения DBF {fname}: {e}")
-        return
-
-    item_field = forms_cfg.get(form_code, {}).get("item_field")
-    value_field = forms_cfg.get(form_code, {}).get("value_field")
-    bank_field = forms_cfg.get(form_code, {}).get("bank_field")
-    ap_field   = forms_cfg.get(form_code, {}).get("ap_field")
-    ap_map     = forms_cfg.get(form_code, {}).get("ap_map", {})
-    meta_map = meta_map or {}
-
-    # Получаем первую запись для определения полей (стримингово)
-    sample = {}
-    try:
-        iterator = iter(table)
-        first = next(iterator)
-        sample = first
-    except StopIteration:
-        iterator = iter([])
-        sample = {}
-    except Exception as e:
-        print(f"Ошибка чтения записей DBF {fname}: {e}")
-        return
-
-    if not item_field:  item_field  = _guess_field(sample, default_item_fields) or "ITEM"
-    if not value_field: value_field = _guess_field(sample, default_value_fields) or "VALUE"
-
-    def _to_float(val):
-        try:
-            if val is None or val == "":
-                return None
-            if isinstance(val, (int, float)):
-                return float(val)
-            if isinstance(val, bytes):
-                # Декодируем байтовые строки с NUL-паддингом
-                try:
-                    s = val.decode(encoding, errors='ignore')
-                except Exception:
-                    s = val.decode('latin-1', errors='ignore')
-                s = s.replace("\x00", "").strip().replace(" ", "").replace(",", ".")
-                if not s:
-                    return None
-                return float(s)
-            # Строка: чистим пробелы/запятые/точки
-            s = str(val).replace("\x00", "").strip().replace(" ", "").replace(",", ".")
-            if not s or s.lower() in ["none", "null", "n/a"]:
-                return None
-            return float(s)
-        except Exception:
-            return None
-
-    rows=0
-    # Обрабатываем первую запись, затем остальные
-    for rec in ([sample] if sample else []):
-        # Извлекаем bank_id из записи если есть поле банка
-        current_bank_id = bank_id
-        if bank_field and bank_field in rec:
-            current_bank_id = str(rec.get(bank_field))
-        item_code = rec.get(item_field)
-        v = _to_float(rec.get(value_field))
-        if v is None:
-            pass
+        sink.flush()
+        return bank_id or "UNKNOWN", form_code, period, None
+
+    plan = _record_plan(form_code, forms_cfg)
+    keep = keep_items.get(str(form_code), set()) if keep_items is not None else None
+    with table:
+        banks, bank_ids, item_codes, values, dropped = plan.rows(
+            table, bank_id, meta_map or {}, default_item_fields, default_value_fields, keep)
+    for b in banks:
+        sink.add_bank(b)
+    # Записываем как есть; дальнейшее сопоставление делается словарем data_dictionary
+    sink.add_rows(bank_ids, form_code, period, item_codes, values)
+    if dropped and dropped[2]:
+        sink.add_dropped(dropped[0], form_code, period, dropped[1], dropped[2])
+    return bank_id or "UNKNOWN", form_code, period, len(values)
+
+
+class _RecordPlan:
+    """План разбора записей формы, собранный один раз из секции forms в config.yaml.
+
+    Банк, суффикс A/P (ap_map или meta 0409802/0409803) и строковый код статьи
+    вычисляются не по каждой записи, а по уникальным значениям колонок
+    (ColumnarDBF.uniques); строки собираются индексированием массивов.
+    Результат совпадает с построчной логикой: bank_id — str(значение поля банка),
+    item_code — str(код) + 'A'/'P', пустые значения пропускаются.
+    """
+
+    def __init__(self, form_code, conf):
+        self.conf = conf
+        self.form_code = form_code
+        self.item_field = conf.get("item_field")
+        self.value_field = conf.get("value_field")
+        self.bank_field = conf.get("bank_field")
+        self.ap_field = conf.get("ap_field")
+        # 'AP' (активно-пассивный) и неизвестные признаки — без суффикса
+        self.ap_suffix = {k: v for k, v in (conf.get("ap_map") or {}).items() if v in ("A", "P")}
+        self.use_meta = form_code in ("0409802", "0409803")
+        encoding = conf.get("encoding", "utf-8")
+        self.convert = lambda val: _to_float(val, encoding)
+
+    def rows(self, table, file_bank_id, meta_map, default_item_fields, default_value_fields, keep=None):
+        """Возвращает (banks, bank_ids, item_codes, values, dropped) для непустых значений
+        таблицы: banks — новые банки в порядке первого появления, остальное — списки
+        по строкам. Если задан keep (множество кодов статей), строки с кодами вне
+        него уходят в dropped = (bank_ids, item_codes, values), иначе dropped = None."""
+        fields = set(table.field_names)
+        # Набор полей берём из заголовка (для пустого файла — как будто записей нет)
+        sample = dict.fromkeys(table.field_names) if len(table) else {}
+        item_field = self.item_field or _guess_field(sample, default_item_fields) or "ITEM"
+        value_field = self.value_field or _guess_field(sample, default_value_fields) or "VALUE"
+        if value_field not in fields:
+            return [], [], [], [], None
+        values, present = table.floats(value_field, self.convert)
+        idx = np.flatnonzero(present)
+        if not idx.size:
+            return [], [], [], [], None
+
+        item_str, item_inv = self._codes(table, item_field, fields, idx, str)
+        ap_suffix, ap_inv = self._codes(table, self.ap_field, fields, idx, self._ap_suffix, [""])
+        n_ap = len(ap_suffix)
+        combo_u, combo_inv = np.unique(item_inv * n_ap + ap_inv, return_inverse=True)
+        norm = np.empty(len(combo_u), dtype=object)
+        for k, c in enumerate(combo_u.tolist()):
+            item, suffix = item_str[c // n_ap], ap_suffix[c % n_ap]
+            # Для форм 0409802/0409803 определяем A/P из meta
+            if self.use_meta and not suffix:
+                guess = meta_map.get((self.form_code, item))
+                suffix = guess if guess in ("A", "P") else ""
+            norm[k] = item + suffix
+
+        combo_inv = combo_inv.ravel()
+
+        if self.bank_field and self.bank_field in fields:
+            bank_str, bank_inv = self._codes(table, self.bank_field, fields, idx, str)
+            used, first = np.unique(bank_inv, return_index=True)
+            banks = [bank_str[u] for u in used[np.argsort(first)].tolist()]
+            row_banks = np.array([b or "UNKNOWN" for b in bank_str], dtype=object)[bank_inv]
         else:
-            # Актив/Пассив суффикс для item_code (только если определено ap_field)
-            suffix = ""
-            if ap_field and ap_field in rec:
-                ap_raw = rec.get(ap_field)
-                ap_key = None
-                if ap_raw is not None:
-                    ap_key = str(ap_raw).strip()
-                ap = ap_map.get(ap_key)
-                if ap == "A":
-                    suffix = "A"
-                elif ap == "P":
-                    suffix = "P"
-                elif ap == "AP":
-                    suffix = ""
-            # Для форм 0409802/0409803 пытаемся определить A/P из meta
-            if form_code in ("0409802","0409803") and not suffix:
-                ap_guess = meta_map.get((form_code, str(item_code)))
-                if ap_guess in ("A","P"):
-                    suffix = ap_guess
-
-            if current_bank_id and current_bank_id != "UNKNOWN":
-                cur.execute("INSERT OR IGNORE INTO banks(bank_id, bank_name) VALUES(?,?)", (current_bank_id, None))
-            item_norm = str(item_code) + (suffix if suffix in ("A","P") else "")
-            cur.execute("INSERT OR REPLACE INTO raw_values(bank_id,form_code,period,item_code,value) VALUES(?,?,?,?,?)",
-                        (current_bank_id or "UNKNOWN", form_code, period, item_norm, v))
-            rows += 1
-
-    for rec in iterator:
-        # Извлекаем bank_id из записи если есть поле банка
-        current_bank_id = bank_id
-        if bank_field and bank_field in rec:
-            current_bank_id = str(rec.get(bank_field))
-
-        item_code = rec.get(item_field)
-        v = _to_float(rec.get(value_field))
-        if v is None:
-            continue
-
-        # Актив/Пассив суффикс для item_code (только если определено ap_field)
-        suffix = ""
-        if ap_field and ap_field in rec:
-            ap_raw = rec.get(ap_field)
-            ap_key = None
-            if ap_raw is not None:
-                ap_key = str(ap_raw).strip()
-            ap = ap_map.get(ap_key)
-            if ap == "A":
-                suffix = "A"
-            elif ap == "P":
-                suffix = "P"
-            elif ap == "AP":
-                # Активно-пассивный — без суффикса
-                suffix = ""
-
-        # Добавляем банк в список если его еще нет
-        if current_bank_id and current_bank_id != "UNKNOWN":
-            cur.execute("INSERT OR IGNORE INTO banks(bank_id, bank_name) VALUES(?,?)", (current_bank_id, None))
-
-        # Для форм 0409802/0409803 пытаемся определить A/P из meta
-        if form_code in ("0409802","0409803") and not suffix:
-            ap_guess = meta_map.get((form_code, str(item_code)))
-            if ap_guess in ("A","P"):
-                suffix = ap_guess
-
-        # Нормализация item_code: добавляем суффикс A/P, если найден
-        item_norm = str(item_code) + (suffix if suffix in ("A","P") else "")
-        # Записываем как есть; дальнейшее сопоставление делается словарем data_dictionary
-        cur.execute("INSERT OR REPLACE INTO raw_values(bank_id,form_code,period,item_code,value) VALUES(?,?,?,?,?)",
-                    (current_bank_id or "UNKNOWN", form_code, period, item_norm, v))
-        rows += 1
-
-    cur.execute("INSERT OR REPLACE INTO ingestion_log(file_name, bank_id, form_code, period, rows_loaded) VALUES(?,?,?,?,?)",
-                (check_name, bank_id or "UNKNOWN", form_code, period, rows))
-    conn.commit()
-    pbar.set_postfix({"файл": check_name, "строк": rows})
+            banks = [file_bank_id]
+            row_banks = np.full(idx.size, file_bank_id or "UNKNOWN", dtype=object)
+        banks = [b for b in banks if b and b != "UNKNOWN"]
+        row_items = norm[combo_inv]
+        row_values = values[idx]
+        if keep is None:
+            return banks, row_banks.tolist(), row_items.tolist(), row_values.tolist(), None
+        # Проекция: решение принимается по уникальным кодам, затем маской по строкам
+        mask = np.array([code in keep for code in norm.tolist()], dtype=bool)[combo_inv]
+        drop = ~mask
+        dropped = (row_banks[drop].tolist(), row_items[drop].tolist(), row_values[drop].tolist())
+        return banks, row_banks[mask].tolist(), row_items[mask].tolist(), row_values[mask].tolist(), dropped
+
+    def _ap_suffix(self, ap_raw):
+        return self.ap_suffix.get(str(ap_raw).strip() if ap_raw is not None else None, "")
+
+    @staticmethod
+    def _codes(table, field, fields, idx, convert, missing=None):
+        """Значения колонки по уникальным (convert применён) и индексы строк idx на них."""
+        if field and field in fields:
+            uvals, inv = table.uniques(field)
+            return [convert(v) for v in uvals], inv[idx].astype(np.int64)
+        return (missing or [convert(None)]), np.zeros(idx.size, dtype=np.int64)
+
+
+_RECORD_PLANS = {}
+
+def _record_plan(form_code, forms_cfg):
+    """План разбора для формы (кэшируется на процесс)."""
+    conf = forms_cfg.get(form_code) or {}
+    plan = _RECORD_PLANS.get(form_code)
+    if plan is None or plan.conf is not conf:
+        plan = _RECORD_PLANS[form_code] = _RecordPlan(form_code, conf)
+    return plan
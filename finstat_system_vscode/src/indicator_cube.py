@@ -0,0 +1,292 @@
+"""
+Куб индикаторов на диске: банк × индикатор × период, float64 (NaN — нет значения).
+
+calc-indicators после расчёта сохраняет indicator_values рядом с файлом БД, в
+каталог <файл БД без расширения>_cube/:
+- values.npy — значения; открываются через np.load(mmap_mode="r"), в память
+  попадают только прочитанные страницы;
+- present.npy — есть ли строка в indicator_values (строка с пустым значением
+  отличается от отсутствующей);
+- index.json — оси куба (банки, индикаторы и периоды по возрастанию) и версия
+  indicator_values (data_versions), по которой куб построен.
+Любая запись в indicator_values увеличивает версию, поэтому для устаревшего куба
+open_cube возвращает None, и потребители читают БД, как раньше. Включается
+storage.indicator_cube в config.yaml.
+
+get_series отдаёт ряды по набору индикаторов и окну периодов в том же виде
+(IndicatorCube над подмножеством): ряды всех банков читаются одним запросом или
+срезом актуального куба и хранятся в LRU-кэше на процесс (SERIES_CACHE_SIZE
+блоков) по ключу (БД, версия indicator_values, набор индикаторов, окно периодов).
+"""
+import json
+import os
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from .db import CFG_PATH, load_cached, database_file, data_version, hot_query
+
+INDEX_FILE = "index.json"
+VALUES_FILE = "values.npy"
+PRESENT_FILE = "present.npy"
+# Блоков рядов get_series в кэше на процесс
+SERIES_CACHE_SIZE = 8
+
+
+def _read_cube_enabled(path: str) -> bool:
+    with open(path, "r", encoding="utf-8") as f:
+        return bool(((yaml.safe_load(f) or {}).get("storage") or {}).get("indicator_cube"))
+
+
+def cube_enabled() -> bool:
+    try:
+        return load_cached(CFG_PATH, _read_cube_enabled)
+    except OSError:
+        return False
+
+
+def cube_dir(conn) -> Optional[str]:
+    """Каталог куба для БД соединения; None — БД в памяти."""
+    path = database_file(conn)
+    return os.path.splitext(path)[0] + "_cube" if path else None
+
+
+class IndicatorCube:
+    """Открытый куб: values[банк, индикатор, период] и маска строк present той же формы.
+    Срезы by_bank / by_indicator / by_period — представления NumPy без копирования."""
+
+    def __init__(self, values, present, banks, indicators, periods, version: int):
+        self.values = values
+        self.present = present
+        self.banks = banks
+        self.indicators = indicators
+        self.periods = periods
+        self.version = version
+        self.bank_index = {b: i for i, b in enumerate(banks)}
+        self.indicator_index = {d: i for i, d in enumerate(indicators)}
+        self.period_index = {p: i for i, p in enumerate(periods)}
+
+    def by_bank(self, bank_id: str) -> Optional[np.ndarray]:
+        """(индикатор × период) банка; None — банка нет в кубе."""
+        i = self.bank_index.get(bank_id)
+        return None if i is None else self.values[i]
+
+    def by_indicator(self, indicator_id: str) -> Optional[np.ndarray]:
+        """(банк × период) индикатора; None — индикатора нет в кубе."""
+        i = self.indicator_index.get(indicator_id)
+        return None if i is None else self.values[:, i]
+
+    def by_period(self, period: str) -> Optional[np.ndarray]:
+        """(банк × индикатор) периода; None — периода нет в кубе."""
+        i = self.period_index.get(period)
+        return None if i is None else self.values[:, :, i]
+
+    def value(self, bank_id: str, indicator_id: str, period: str) -> Optional[float]:
+        """Значение ячейки; None — нет строки или значение пустое."""
+        b, d, p = self.bank_index.get(bank_id), self.indicator_index.get(indicator_id), self.period_index.get(period)
+        if b is None or d is None or p is None:
+            return None
+        v = self.values[b, d, p]
+        return None if np.isnan(v) else float(v)
+
+    def cells(self, bank_id: str, indicator_ids, periods) -> dict:
+        """{indicator_id: {period: value}} по строкам indicator_values банка: пустое
+        значение — None, отсутствующие строки пропускаются."""
+        b = self.bank_index.get(bank_id)
+        if b is None:
+            return {}
+        cols = [p for p in periods if p in self.period_index]
+        rows = [d for d in indicator_ids if d in self.indicator_index]
+        if not cols or not rows:
+            return {}
+        cell = np.ix_([self.indicator_index[d] for d in rows], [self.period_index[p] for p in cols])
+        values = np.where(np.isnan(self.values[b][cell]), None, self.values[b][cell]).tolist()
+        present = self.present[b][cell].tolist()
+        out = {}
+        for indicator_id, row_values, row_present in zip(rows, values, present):
+            row = {p: v for p, v, ok in zip(cols, row_values, row_present) if ok}
+            if row:
+                out[indicator_id] = row
+        return out
+
+    def select_banks(self, bank_ids) -> "IndicatorCube":
+        """Куб только по банкам bank_ids в заданном порядке (банков нет — пустые строки)."""
+        bank_ids = list(bank_ids)
+        pos = [(n, self.bank_index[b]) for n, b in enumerate(bank_ids) if b in self.bank_index]
+        shape = (len(bank_ids),) + self.values.shape[1:]
+        values = np.full(shape, np.nan)
+        present = np.zeros(shape, dtype=bool)
+        if pos:
+            rows, idx = (np.array(c, dtype=np.intp) for c in zip(*pos))
+            values[rows] = self.values[idx]
+            present[rows] = self.present[idx]
+        return IndicatorCube(values, present, bank_ids, self.indicators, self.periods, self.version)
+
+    def frame(self, bank_id: str = None, period: str = None) -> pd.DataFrame:
+        """Строки indicator_values (bank_id, indicator_id, period, value) банка и/или
+        периода (по умолчанию все) в порядке bank_id, period, indicator_id."""
+        columns = ["bank_id", "indicator_id", "period", "value"]
+        banks, periods = slice(None), slice(None)
+        if bank_id is not None:
+            if bank_id not in self.bank_index:
+                return pd.DataFrame(columns=columns)
+            i = self.bank_index[bank_id]
+            banks = slice(i, i + 1)
+        if period is not None:
+            if period not in self.period_index:
+                return pd.DataFrame(columns=columns)
+            i = self.period_index[period]
+            periods = slice(i, i + 1)
+        # (банк, период, индикатор): np.nonzero возвращает ячейки в нужном порядке
+        present = np.transpose(self.present[banks, :, periods], (0, 2, 1))
+        b, p, d = np.nonzero(present)
+        values = np.transpose(self.values[banks, :, periods], (0, 2, 1))[b, p, d]
+        return pd.DataFrame({
+            "bank_id": np.asarray(self.banks, dtype=object)[banks][b],
+            "indicator_id": np.asarray(self.indicators, dtype=object)[d],
+            "period": np.asarray(self.periods, dtype=object)[periods][p],
+            "value": values,
+        }, columns=columns)
+
+
+def _pivot(rows, indicators=None):
+    """Оси (банки, индикаторы, периоды по возрастанию), значения и маска строк по строкам
+    (bank_id, indicator_id, period, value). indicators — фиксированная ось индикаторов."""
+    columns = list(zip(*rows)) or [(), (), (), ()]
+    axes, codes = [], []
+    for n, column in enumerate(columns[:3]):
+        column = np.array(column, dtype=object).astype(str)
+        if n == 1 and indicators is not None:
+            names = np.array(indicators, dtype=str)
+            order = np.argsort(names, kind="stable")
+            inverse = order[np.searchsorted(names[order], column)]
+        else:
+            names, inverse = np.unique(column, return_inverse=True)
+        axes.append(names.tolist())
+        codes.append(inverse)
+    shape = tuple(len(a) for a in axes)
+    values = np.full(shape, np.nan)
+    present = np.zeros(shape, dtype=bool)
+    values[tuple(codes)] = np.array(columns[3], dtype=float)
+    present[tuple(codes)] = True
+    return axes, values, present
+
+
+def build_cube(conn) -> Optional[str]:
+    """Строит куб из indicator_values (файлы заменяются целиком); возвращает каталог
+    или None, если куб выключен или БД в памяти."""
+    directory = cube_dir(conn)
+    if not directory or not cube_enabled():
+        return None
+    # Версия читается до значений: запись между ними даст куб с прежней версией, то есть устаревший
+    version = data_version(conn, "indicator_values")
+    rows = conn.execute("SELECT bank_id, indicator_id, period, value FROM indicator_values").fetchall()
+    axes, values, present = _pivot(rows)
+    shape = values.shape
+
+    os.makedirs(directory, exist_ok=True)
+    suffix = f".{os.getpid()}.tmp"
+    for name, array in ((VALUES_FILE, values), (PRESENT_FILE, present)):
+        with open(os.path.join(directory, name + suffix), "wb") as f:
+            np.save(f, array)
+    with open(os.path.join(directory, INDEX_FILE + suffix), "w", encoding="utf-8") as f:
+        json.dump({"version": version, "banks": axes[0], "indicators": axes[1], "periods": axes[2]}, f, ensure_ascii=False)
+    # index.json заменяется последним: до этого читатели видят прежнюю (уже устаревшую) версию
+    for name in (VALUES_FILE, PRESENT_FILE, INDEX_FILE):
+        os.replace(os.path.join(directory, name + suffix), os.path.join(directory, name))
+    print(f"Куб индикаторов: {shape[0]} банков × {shape[1]} индикаторов × {shape[2]} периодов -> {directory}")
+    return directory
+
+
+_OPENED = {}
+
+
+def open_cube(conn) -> Optional[IndicatorCube]:
+    """Куб для БД соединения, если он включён, построен и не устарел; иначе None."""
+    if not cube_enabled():
+        return None
+    directory = cube_dir(conn)
+    if not directory:
+        return None
+    index_path = os.path.join(directory, INDEX_FILE)
+    try:
+        stamp = os.stat(index_path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _OPENED.get(directory)
+    if cached is not None and cached[0] == stamp:
+        cube = cached[1]
+    else:
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        shape = (len(index["banks"]), len(index["indicators"]), len(index["periods"]))
+        mmap_mode = "r" if all(shape) else None
+        values = np.load(os.path.join(directory, VALUES_FILE), mmap_mode=mmap_mode)
+        present = np.load(os.path.join(directory, PRESENT_FILE), mmap_mode=mmap_mode)
+        if values.shape != shape or present.shape != shape:
+            return None
+        cube = IndicatorCube(values, present, index["banks"], index["indicators"], index["periods"], int(index["version"]))
+        _OPENED[directory] = (stamp, cube)
+    return cube if cube.version == data_version(conn, "indicator_values") else None
+
+
+def refresh_cube(conn) -> Optional[str]:
+    """Перестраивает куб, если он включён и отсутствует или устарел."""
+    if cube_enabled() and open_cube(conn) is None:
+        return build_cube(conn)
+    return cube_dir(conn) if cube_enabled() else None
+
+
+_SERIES_CACHE = OrderedDict()
+
+
+def _load_series(conn, indicators, period_range, version: int) -> IndicatorCube:
+    start, end = period_range
+    cube = open_cube(conn)
+    if cube is None:
+        if indicators is not None:
+            sql = hot_query(conn, "indicator_window").format(ids=",".join("?" * len(indicators)))
+            rows = conn.execute(sql, (start, end, *indicators)).fetchall() if indicators else []
+        else:
+            rows = conn.execute(hot_query(conn, "indicator_window_all"), (start, end)).fetchall()
+        axes, values, present = _pivot(rows, indicators)
+        return IndicatorCube(values, present, axes[0], axes[1], axes[2], version)
+    # Срез актуального куба без запроса к БД; оси — как у выборки из БД
+    names = list(indicators) if indicators is not None else list(cube.indicators)
+    pos = [cube.indicator_index.get(d, -1) for d in names]
+    per_idx = [j for j, p in enumerate(cube.periods) if start <= p <= end]
+    cell = np.ix_(np.arange(len(cube.banks)), np.array([max(i, 0) for i in pos], dtype=np.intp),
+                  np.array(per_idx, dtype=np.intp))
+    found = np.array([i >= 0 for i in pos], dtype=bool)[None, :, None]
+    present = cube.present[cell] & found
+    banks = np.flatnonzero(present.any(axis=(1, 2)))
+    periods = np.flatnonzero(present.any(axis=(0, 1)))
+    present = present[banks][:, :, periods]
+    values = np.where(present, cube.values[cell][banks][:, :, periods], np.nan)
+    return IndicatorCube(values, present, [cube.banks[i] for i in banks], names,
+                         [cube.periods[per_idx[j]] for j in periods], version)
+
+
+def get_series(conn, bank_ids, indicator_ids, period_range) -> IndicatorCube:
+    """Ряды индикаторов indicator_ids (None — все) банков bank_ids (None — все) за
+    периоды period_range = (первый, последний) включительно: IndicatorCube с осями
+    банки × индикаторы × периоды (индикаторы — запрошенные по возрастанию, периоды —
+    только встречающиеся в окне). Ряды всех банков окна читаются одним запросом
+    (или срезом актуального куба) и кэшируются; запись в indicator_values меняет
+    версию данных, поэтому кэш не отдаёт устаревших значений."""
+    indicators = tuple(sorted(set(indicator_ids))) if indicator_ids is not None else None
+    window = tuple(str(p) for p in period_range)
+    version = data_version(conn, "indicator_values")
+    key = (database_file(conn) or id(conn), version, indicators, window)
+    block = _SERIES_CACHE.get(key)
+    if block is None:
+        block = _load_series(conn, indicators, window, version)
+        _SERIES_CACHE[key] = block
+        while len(_SERIES_CACHE) > SERIES_CACHE_SIZE:
+            _SERIES_CACHE.popitem(last=False)
+    else:
+        _SERIES_CACHE.move_to_end(key)
+    return block if bank_ids is None else block.select_banks(bank_ids)
@@ -1,47 +1,39 @@
 import os
-import csv
 import ast
 import math
+import marshal
+import hashlib
+import graphlib
 import sqlite3
-from typing import Optional, Dict, Any
+import importlib.util
+import multiprocessing
+import numpy as np
+from typing import Optional, Dict, Any, Callable, List
 import yaml
 from datetime import date
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from .formula_optimizer import PARTIAL_PREFIX, optimize, form_expression, format_report
+from .db import (sync_data_dictionary, load_cached, fill_temp_keys, DimensionKeys, write_indicator_values,
+                 hot_query, is_duckdb, init_db, get_dirty_pairs, clear_dirty_pairs, CFG_PATH,
+                 database_file, connect_readonly)
 
 
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 CFG_DIR = os.path.join(BASE_DIR, "configs")
+# Скомпилированные формулы indicators.yaml (ключ — sha256 файла и версия байткода Python)
+FORMULA_CACHE_DIR = os.path.join(BASE_DIR, "data", "formula_cache")
 
 
-def _load_indicators_config() -> Dict[str, str]:
-    path = os.path.join(CFG_DIR, "indicators.yaml")
+def _read_indicators_yaml(path: str) -> Dict[str, str]:
     with open(path, "r", encoding="utf-8") as f:
         data = yaml.safe_load(f) or {}
     # Ожидается: { indicator_id: "FORMULA" }
     return {str(k): str(v) for k, v in data.items()}
 
 
-def _load_data_dictionary() -> Dict[tuple, str]:
-    """Загружает словарь соответствий (form_code, item_code) -> std_key.
-    Пропускает пустые строки и комментарии (#...).
-    """
-    path = os.path.join(CFG_DIR, "data_dictionary.csv")
-    mapping: Dict[tuple, str] = {}
-    if not os.path.exists(path):
-        return mapping
-    with open(path, "r", encoding="utf-8") as f:
-        reader = csv.reader(f)
-        for row in reader:
-            if not row or not row[0] or row[0].lstrip().startswith("#"):
-                continue
-            # Ожидаемые колонки: form_code, item_code, std_key, description
-            if len(row) < 3:
-                continue
-            form_code = row[0].strip()
-            item_code = row[1].strip()
-            std_key = row[2].strip()
-            if form_code and item_code and std_key:
-                mapping[(form_code, item_code)] = std_key
-    return mapping
+def _load_indicators_config() -> Dict[str, str]:
+    return load_cached(os.path.join(CFG_DIR, "indicators.yaml"), _read_indicators_yaml)
 
 
 class _SafeEvaluator(ast.NodeVisitor):
@@ -102,45 +94,521 @@ def _eval_formula(expr: str, variables: Dict[str, float]) -> Optional[float]:
         return None
 
 
-def calculate_indicators(conn: sqlite3.Connection) -> None:
+# Пар банк×период в одной матрице (строк × столбцов float64 — до ~50 МБ на 300 std_key)
+_MATRIX_CHUNK = 20000
+# Строк indicator_values в одной пакетной записи
+_WRITE_BATCH = 20000
+
+
+def _std_matrix(conn: sqlite3.Connection, pairs, columns, needed=None) -> np.ndarray:
+    """Плотная матрица (пара × std_key): строка i — pairs[i], столбец j — columns[j],
+    значение — сумма сырых значений строк отчётности, отображённых таблицей
+    data_dictionary на std_key. Агрегация выполняется в БД одним проходом
+    JOIN ... GROUP BY (пара, std_key); пары и нужные std_key передаются во временные
+    таблицы. needed — заполнить только эти std_key (остальные столбцы нулевые)."""
+    matrix = np.zeros((len(pairs), len(columns)))
+    cols = [(name, j) for j, name in enumerate(columns) if needed is None or name in needed]
+    if not cols or not pairs:
+        return matrix
+    cols_t = fill_temp_keys(conn, "matrix_columns", ["std_key"], cols, payload=["col"])
+    pairs_t = fill_temp_keys(conn, "matrix_pairs", ["bank_id", "period"],
+                             [(b, p, i) for i, (b, p) in enumerate(pairs)], payload=["idx"])
+    if is_duckdb(conn):
+        sql = (f"SELECT s.idx, c.col, COALESCE(SUM(r.value), 0.0) FROM {pairs_t} s "
+               "JOIN raw_values r ON r.bank_id = s.bank_id AND r.period = s.period "
+               "JOIN data_dictionary d ON d.form_code = r.form_code AND d.item_code = r.item_code "
+               f"JOIN {cols_t} c ON c.std_key = d.std_key GROUP BY s.idx, c.col")
+    else:
+        # Словарь переводится в суррогатные ключи; CROSS JOIN фиксирует порядок:
+        # для каждой пары — точечный поиск по полному PK raw_facts вместо
+        # сканирования всех строк отчётности пары (большая часть их не в словаре)
+        conn.execute("DROP TABLE IF EXISTS temp.matrix_fact_keys")
+        conn.execute("CREATE TEMP TABLE matrix_fact_keys (form_key INTEGER NOT NULL, item_key INTEGER NOT NULL, "
+                     "col INTEGER, PRIMARY KEY (form_key, item_key)) WITHOUT ROWID")
+        conn.execute("INSERT INTO temp.matrix_fact_keys SELECT f.form_key, i.item_key, c.col "
+                     f"FROM data_dictionary d JOIN {cols_t} c ON c.std_key = d.std_key "
+                     "JOIN forms f ON f.form_code = d.form_code JOIN items i ON i.item_code = d.item_code")
+        sql = (f"SELECT s.idx, k.col, COALESCE(SUM(r.value), 0.0) FROM {pairs_t} s "
+               "CROSS JOIN banks b CROSS JOIN periods p CROSS JOIN temp.matrix_fact_keys k CROSS JOIN raw_facts r "
+               "WHERE b.bank_id = s.bank_id AND p.period = s.period AND r.bank_key = b.bank_key "
+               "AND r.period_key = p.period_key AND r.form_key = k.form_key AND r.item_key = k.item_key "
+               "GROUP BY s.idx, k.col")
+    rows = conn.execute(sql).fetchall()
+    if rows:
+        idx, col, val = (np.array(c) for c in zip(*rows))
+        matrix[idx.astype(np.intp), col.astype(np.intp)] = val.astype(float)
+    return matrix
+
+
+class FormulaVariables(dict):
+    """Значения std_key для скомпилированных формул: отсутствующая переменная = 0.0."""
+
+    def __missing__(self, key):
+        return 0.0
+
+
+_FORMULA_ARG = "__v"
+_FORMULA_DIV = "__div"
+# Версия формата дискового кэша формул (входит в ключ файла)
+_FORMULA_CACHE_FORMAT = b"6"
+
+
+def _div(a, b):
+    """Деление в скомпилированных формулах. Числа — обычное деление (на ноль —
+    ZeroDivisionError); столбцы NumPy — NaN в строках с нулевым делителем. NaN
+    сохраняется всеми последующими операциями, поэтому значение формулы в такой
+    строке пустое — как при ZeroDivisionError в расчёте по одной паре."""
+    if type(a) is float and type(b) is float:
+        return a / b
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    out = np.full(np.broadcast_shapes(a.shape, b.shape), np.nan)
+    np.divide(a, b, out=out, where=(b != 0))
+    return out
+
+
+_FORMULA_GLOBALS = {"__builtins__": {}, _FORMULA_DIV: _div}
+
+
+class _FormulaCompiler(ast.NodeTransformer):
+    """Проверка и перевод дерева формулы в выражение над FormulaVariables.
+    Допустимы те же узлы, что у _SafeEvaluator; константы приводятся к float,
+    имена заменяются на __v["ИМЯ"]."""
+
+    _BINOPS = (ast.Add, ast.Sub, ast.Mult, ast.Div)
+    _UNARYOPS = (ast.UAdd, ast.USub)
+
+    def generic_visit(self, node):
+        raise ValueError(f"Недопустимый элемент формулы: {type(node).__name__}")
+
+    def visit_Expression(self, node):
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_BinOp(self, node):
+        if not isinstance(node.op, self._BINOPS):
+            raise ValueError("Недопустимая операция")
+        node.left, node.right = self.visit(node.left), self.visit(node.right)
+        if isinstance(node.op, ast.Div):
+            return ast.copy_location(ast.Call(func=ast.Name(_FORMULA_DIV, ast.Load()),
+                                              args=[node.left, node.right], keywords=[]), node)
+        return node
+
+    def visit_UnaryOp(self, node):
+        if not isinstance(node.op, self._UNARYOPS):
+            raise ValueError("Недопустимая унарная операция")
+        node.operand = self.visit(node.operand)
+        return node
+
+    def visit_Constant(self, node):
+        if not isinstance(node.value, (int, float)):
+            raise ValueError("Недопустимое константное значение")
+        return ast.copy_location(ast.Constant(float(node.value)), node)
+
+    def visit_Name(self, node):
+        return ast.copy_location(ast.Subscript(value=ast.Name(_FORMULA_ARG, ast.Load()),
+                                               slice=ast.Constant(node.id), ctx=ast.Load()), node)
+
+
+def compile_formula_code(expr: str, name: str = "formula"):
+    """Код-объект, вычисление которого даёт функцию f(FormulaVariables).
+    Значениями переменных могут быть числа или столбцы NumPy одной длины.
+    ValueError/SyntaxError — формула недопустима."""
+    body = _FormulaCompiler().visit(ast.parse(expr, mode="eval")).body
+    tree = ast.Expression(ast.Lambda(
+        args=ast.arguments(posonlyargs=[], args=[ast.arg(_FORMULA_ARG)], kwonlyargs=[], kw_defaults=[], defaults=[]),
+        body=body))
+    return compile(ast.fix_missing_locations(tree), f"<indicators.yaml:{name}>", "eval")
+
+
+def _formula_evaluator(code) -> Callable[[FormulaVariables], Optional[float]]:
+    """Вычислитель с семантикой _eval_formula: деление на ноль, NaN и inf — None."""
+    if code is None:
+        return lambda variables: None
+    fn = eval(code, _FORMULA_GLOBALS)
+    isfinite = math.isfinite
+
+    def evaluate(variables: FormulaVariables) -> Optional[float]:
+        try:
+            val = fn(variables)
+            return float(val) if isfinite(val) else None
+        except Exception:
+            return None
+    return evaluate
+
+
+def _linear_terms(node):
+    """Линейная форма выражения: ({имя: коэффициент}, свободный член), либо None,
+    если выражение нелинейно (произведение переменных, деление на переменную)."""
+    if isinstance(node, ast.Expression):
+        return _linear_terms(node.body)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return {}, float(node.value)
+    if isinstance(node, ast.Name):
+        return {node.id: 1.0}, 0.0
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        terms = _linear_terms(node.operand)
+        if terms is None or isinstance(node.op, ast.UAdd):
+            return terms
+        return _scale_terms(terms, -1.0)
+    if isinstance(node, ast.BinOp):
+        left, right = _linear_terms(node.left), _linear_terms(node.right)
+        if left is None or right is None:
+            return None
+        if isinstance(node.op, (ast.Add, ast.Sub)):
+            sign = 1.0 if isinstance(node.op, ast.Add) else -1.0
+            coeffs = dict(left[0])
+            for name, c in right[0].items():
+                coeffs[name] = coeffs.get(name, 0.0) + sign * c
+            return coeffs, left[1] + sign * right[1]
+        if isinstance(node.op, ast.Mult):
+            if not left[0]:
+                return _scale_terms(right, left[1])
+            if not right[0]:
+                return _scale_terms(left, right[1])
+            return None
+        if isinstance(node.op, ast.Div) and not right[0] and right[1] != 0:
+            return _scale_terms(left, 1.0 / right[1])
+    return None
+
+
+def _scale_terms(terms, factor: float):
+    coeffs, const = terms
+    return {name: c * factor for name, c in coeffs.items()}, const * factor
+
+
+def _load_formula_codes(path: str) -> Dict[str, tuple]:
+    """{indicator_id: (код, имена переменных, линейная форма или None)} для
+    indicators.yaml. Берётся из дискового кэша FORMULA_CACHE_DIR, если sha256 файла
+    не изменился; иначе формулы компилируются и кэш перезаписывается.
+    Недопустимые формулы и формулы в циклических ссылках дают (None, (), None);
+    их список хранится в кэше вместе с кодами и печатается при каждой загрузке.
+    Сводка оптимизатора печатается только при компиляции в основном процессе
+    (процессы пула calc-indicators её не повторяют; полный отчёт — formula-plan)."""
+    with open(path, "rb") as f:
+        raw = f.read()
+    key = hashlib.sha256(raw + importlib.util.MAGIC_NUMBER + _FORMULA_CACHE_FORMAT).hexdigest()[:16]
+    cache_path = os.path.join(FORMULA_CACHE_DIR, f"indicators_{key}.marshal")
+    entry = None
+    try:
+        with open(cache_path, "rb") as f:
+            entry = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        entry = None
+    if entry is None:
+        formulas = {str(k): str(v) for k, v in (yaml.safe_load(raw) or {}).items()}
+        codes, invalid, report = _compile_formulas(formulas)
+        entry = (codes, tuple(invalid))
+        _store_formula_cache(cache_path, entry)
+        if multiprocessing.parent_process() is None:
+            print(format_report(report)[0])
+    codes, invalid = entry
+    if invalid:
+        print(f"Недопустимые формулы в indicators.yaml (значение будет пустым): {', '.join(invalid)}")
+    return codes
+
+
+def _compile_formulas(formulas: Dict[str, str]):
+    """(коды формул, список недопустимых, отчёт оптимизатора) для {indicator_id: формула}.
+    Линейные формулы заменяются планом formula_optimizer.optimize: общие частичные
+    суммы добавляются промежуточными узлами PARTIAL_PREFIX<N>."""
+    codes, invalid = {}, []
+    for ind_id, expr in formulas.items():
+        try:
+            code = compile_formula_code(expr, ind_id)
+            tree = ast.parse(expr, mode="eval")
+            names = tuple(sorted({n.id for n in ast.walk(tree) if isinstance(n, ast.Name)}))
+            codes[ind_id] = (code, names, _linear_terms(tree))
+        except (SyntaxError, ValueError) as e:
+            codes[ind_id] = (None, (), None)
+            invalid.append(f"{ind_id} ({e})")
+    for cycle in _formula_cycles(codes):
+        for ind_id in cycle:
+            codes[ind_id] = (None, (), None)
+        invalid.append(f"{cycle[0]} (циклическая ссылка {' → '.join(cycle)})")
+
+    forms = {ind_id: linear for ind_id, (code, _, linear) in codes.items() if code is not None and linear is not None}
+    reserved = set(codes) | {name for _, names, _ in codes.values() for name in names}
+    plan, report = optimize(forms, _formula_order(codes), reserved)
+    for name, form in plan.items():
+        codes[name] = (compile_formula_code(form_expression(form), name), tuple(sorted(form[0])), form)
+    return codes, invalid, report
+
+
+def formula_plan_report() -> List[str]:
+    """Отчёт оптимизатора формул configs/indicators.yaml (команда formula-plan)."""
+    _, invalid, report = _compile_formulas(_read_indicators_yaml(os.path.join(CFG_DIR, "indicators.yaml")))
+    lines = format_report(report)
+    if invalid:
+        lines.append(f"Недопустимые формулы: {', '.join(invalid)}")
+    return lines
+
+
+def _formula_graph(codes: Dict[str, tuple]) -> Dict[str, list]:
+    """{indicator_id: индикаторы, на которые ссылается формула}. Имя, совпадающее
+    с id индикатора, — ссылка на его значение, а не на std_key."""
+    return {ind_id: [name for name in names if name in codes] for ind_id, (_, names, _) in codes.items()}
+
+
+def _formula_cycles(codes: Dict[str, tuple]) -> list:
+    """Циклы ссылок между формулами (списки id, первый повторён в конце)."""
+    return _graph_cycles(_formula_graph(codes))
+
+
+def _graph_cycles(graph: Dict[str, list]) -> list:
+    """Циклы графа ссылок; у узлов циклов ссылки в graph обнуляются."""
+    cycles = []
+    while True:
+        try:
+            graphlib.TopologicalSorter(graph).prepare()
+            return cycles
+        except graphlib.CycleError as e:
+            cycle = list(e.args[1])
+            cycles.append(cycle)
+            for ind_id in cycle:
+                graph[ind_id] = []
+
+
+def _formula_hashes(formulas: Dict[str, str]) -> Dict[str, str]:
+    """{indicator_id: sha256 определения}: нормализованное дерево формулы и хэши
+    индикаторов, на которые она ссылается, — изменение зависимости меняет хэш
+    всех ссылающихся на неё индикаторов."""
+    trees, graph = {}, {}
+    for ind_id, expr in formulas.items():
+        try:
+            tree = ast.parse(expr, mode="eval")
+            trees[ind_id] = ast.dump(tree)
+            graph[ind_id] = sorted({n.id for n in ast.walk(tree) if isinstance(n, ast.Name) and n.id in formulas})
+        except SyntaxError:
+            trees[ind_id], graph[ind_id] = expr, []
+    _graph_cycles(graph)
+    hashes = {}
+    for ind_id in graphlib.TopologicalSorter(graph).static_order():
+        digest = hashlib.sha256(trees[ind_id].encode("utf-8"))
+        for ref in graph[ind_id]:
+            digest.update(f"|{ref}={hashes[ref]}".encode("utf-8"))
+        hashes[ind_id] = digest.hexdigest()
+    return hashes
+
+
+def _formula_order(codes: Dict[str, tuple]) -> list:
+    """id индикаторов в порядке вычисления: зависимости раньше ссылающихся на них."""
+    return list(graphlib.TopologicalSorter(_formula_graph(codes)).static_order())
+
+
+def _compile_indicators_file(path: str) -> Dict[str, Callable]:
+    """{indicator_id: вычислитель по одной паре} для indicators.yaml в порядке
+    вычисления (включая частичные суммы PARTIAL_PREFIX<N>): значение каждого узла
+    кладётся в FormulaVariables под его именем до вычисления ссылающихся на него
+    формул (пустое значение — None, тогда и зависимая формула пуста)."""
+    codes = _load_formula_codes(path)
+    return {ind_id: _formula_evaluator(codes[ind_id][0]) for ind_id in _formula_order(codes)}
+
+
+class _FormulaMatrix:
+    """Формулы indicators.yaml для расчёта сразу по матрице (пара × std_key).
+    Линейные части формул по std_key собраны в матрицу коэффициентов
+    (std_key × индикатор) и считаются одним матричным умножением; остальные
+    формулы (с делением на переменную или произведением переменных) —
+    скомпилированными функциями над столбцами с маскированием деления на ноль
+    (см. _div). Ссылки на другие индикаторы разрешаются в порядке _formula_order:
+    каждый индикатор и частичная сумма вычисляются один раз, зависимые формулы
+    берут готовый столбец. ids — индикаторы результата (без частичных сумм)."""
+
+    def __init__(self, codes: Dict[str, tuple]):
+        self.names = list(codes)
+        self.ids = [name for name in self.names if not name.startswith(PARTIAL_PREFIX)]
+        pos = {name: i for i, name in enumerate(self.names)}
+        self._output = [pos[ind_id] for ind_id in self.ids]
+        self._refs = {name: names for name, (_, names, _) in codes.items()}
+        self.columns = sorted({name for _, names, _ in codes.values() for name in names if name not in pos})
+        col_index = {name: j for j, name in enumerate(self.columns)}
+        self.linear_pos = [i for i, (code, _, linear) in enumerate(codes.values())
+                           if code is not None and linear is not None]
+        self.coef = np.zeros((len(self.columns), len(self.linear_pos)))
+        self.const = np.zeros(len(self.linear_pos))
+        linear_refs = {}
+        for k, i in enumerate(self.linear_pos):
+            coeffs, const = codes[self.names[i]][2]
+            refs = []
+            for name, c in coeffs.items():
+                if name in pos:
+                    refs.append((pos[name], c))
+                else:
+                    self.coef[col_index[name], k] = c
+            self.const[k] = const
+            linear_refs[i] = (k, refs)
+        # Шаги вычисления (позиция, столбец линейной части, ссылки, функция)
+        self.steps = []
+        for ind_id in _formula_order(codes):
+            i = pos[ind_id]
+            code, _, linear = codes[ind_id]
+            if code is None:
+                continue
+            if linear is not None:
+                self.steps.append((i, *linear_refs[i], None))
+            else:
+                self.steps.append((i, None, (), eval(code, _FORMULA_GLOBALS)))
+
+    def columns_for(self, ids) -> set:
+        """std_key, от которых (с учётом ссылок и частичных сумм) зависят индикаторы ids."""
+        stack, seen, columns = list(ids), set(), set()
+        while stack:
+            name = stack.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            for ref in self._refs.get(name, ()):
+                if ref in self._refs:
+                    stack.append(ref)
+                else:
+                    columns.add(ref)
+        return columns
+
+    def evaluate(self, matrix: np.ndarray) -> np.ndarray:
+        """Значения (пара × индикатор) для матрицы _std_matrix; NaN — пустое значение
+        (деление на ноль, NaN/inf, недопустимая формула, пустой индикатор в ссылке)."""
+        result = np.full((matrix.shape[0], len(self.names)), np.nan)
+        with np.errstate(all="ignore"):
+            base = matrix @ self.coef + self.const if self.linear_pos else None
+            variables = FormulaVariables({name: matrix[:, j] for j, name in enumerate(self.columns)})
+            variables.update({name: result[:, i] for i, name in enumerate(self.names)})
+            for i, k, refs, fn in self.steps:
+                if fn is None:
+                    value = base[:, k]
+                    for ref, c in refs:
+                        value = value + c * result[:, ref]
+                else:
+                    try:
+                        value = fn(variables)
+                    except Exception:
+                        continue
+                result[:, i] = value
+                column = result[:, i]
+                column[~np.isfinite(column)] = np.nan
+        return result[:, self._output]
+
+
+def _compile_formula_matrix(path: str) -> _FormulaMatrix:
+    return _FormulaMatrix(_load_formula_codes(path))
+
+
+def _store_formula_cache(cache_path: str, entry):
+    try:
+        os.makedirs(FORMULA_CACHE_DIR, exist_ok=True)
+        tmp = cache_path + ".tmp"
+        with open(tmp, "wb") as f:
+            marshal.dump(entry, f)
+        os.replace(tmp, cache_path)
+        # Кэши прежних версий indicators.yaml больше не нужны
+        for name in os.listdir(FORMULA_CACHE_DIR):
+            if name.startswith("indicators_") and os.path.join(FORMULA_CACHE_DIR, name) != cache_path:
+                os.remove(os.path.join(FORMULA_CACHE_DIR, name))
+    except OSError:
+        pass
+
+
+def _load_formula_matrix() -> _FormulaMatrix:
+    return load_cached(os.path.join(CFG_DIR, "indicators.yaml"), _compile_formula_matrix)
+
+
+def _shard_pairs(pairs, shards: int) -> list:
+    """Делит отсортированные пары на шарды по границам банков (все периоды банка —
+    в одном шарде); шард — не больше _MATRIX_CHUNK пар, если банк не крупнее."""
+    size = min(_MATRIX_CHUNK, max(1, -(-len(pairs) // shards)))
+    out, current = [], []
+    for pos, pair in enumerate(pairs):
+        if len(current) >= size and pair[0] != pairs[pos - 1][0]:
+            out.append(current)
+            current = []
+        current.append(pair)
+    if current:
+        out.append(current)
+    return out
+
+
+def _evaluate_shard(db_path: str, pairs, needed, selected) -> np.ndarray:
+    """Значения индикаторов (пара × выбранный индикатор) для шарда пар; выполняется
+    в процессе пула и читает сырые значения через соединение только для чтения."""
+    formulas = _load_formula_matrix()
+    conn = connect_readonly(db_path)
+    try:
+        return formulas.evaluate(_std_matrix(conn, pairs, formulas.columns, needed))[:, selected]
+    finally:
+        conn.close()
+
+
+def _write_indicator_rows(conn, pairs, ids, values: np.ndarray, dims: DimensionKeys) -> int:
+    """Записывает значения (пара × индикатор) пачками по _WRITE_BATCH строк; NaN — пустое значение."""
+    written = 0
+    cells = np.where(np.isnan(values), None, values).tolist()
+    out = []
+    for (bank_id, period), row in zip(pairs, cells):
+        out.extend(zip(repeat(bank_id), ids, repeat(period), row))
+        if len(out) >= _WRITE_BATCH:
+            write_indicator_values(conn, out, dims)
+            written += len(out)
+            out = []
+    if out:
+        write_indicator_values(conn, out, dims)
+        written += len(out)
+    return written
+
+
+def calculate_indicators(conn: sqlite3.Connection, pairs=None, indicators=None, workers: int = 1) -> None:
     """Читает сырые данные и рассчитывает индикаторы согласно configs/indicators.yaml.
     Результат сохраняет в таблицу indicator_values (bank_id, indicator_id, period, value).
+    pairs — пересчитать только эти пары (bank_id, period); по умолчанию все.
+    indicators — сохранить только эти индикаторы (сырые данные читаются только
+    для std_key, от которых они зависят); по умолчанию все.
+    workers > 1 — банки делятся на шарды, которые считаются в пуле процессов (каждый
+    читает свои сырые значения через отдельное соединение только для чтения);
+    результаты записывает одно это соединение в порядке шардов, поэтому они те же,
+    что и при последовательном расчёте. Только для SQLite-файла, иначе расчёт последовательный.
     """
-    indicators = _load_indicators_config()
-    mapping = _load_data_dictionary()
+    formulas = _load_formula_matrix()
+    sync_data_dictionary(conn)
+    selected = list(range(len(formulas.ids)))
+    needed = None
+    if indicators is not None:
+        wanted = set(indicators)
+        selected = [i for i, ind_id in enumerate(formulas.ids) if ind_id in wanted]
+        if not selected:
+            return
+        needed = formulas.columns_for(formulas.ids[i] for i in selected)
 
     cur = conn.cursor()
 
     # Собираем все уникальные пары (банк, период)
-    pairs = cur.execute("SELECT DISTINCT bank_id, period FROM raw_values").fetchall()
+    # projected_pairs — пары, все строки которых отброшены проекцией импорта по словарю
+    has_projected = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='projected_pairs'").fetchone()
+    if pairs is None:
+        pairs = sorted(cur.execute(
+            hot_query(conn, "raw_pairs")
+            + (" UNION SELECT bank_id, period FROM projected_pairs" if has_projected else "")).fetchall())
+    else:
+        pairs = sorted({(b, p) for b, p in pairs})
     if not pairs:
         print("Нет сырых данных для расчёта индикаторов.")
         return
 
     total_written = 0
-    for bank_id, period in pairs:
-        # Получаем все строки для банка/периода
-        rows = cur.execute(
-            "SELECT form_code, item_code, value FROM raw_values WHERE bank_id=? AND period=?",
-            (bank_id, period),
-        ).fetchall()
-
-        # Агрегируем значения по std_key
-        std_values: Dict[str, float] = {}
-        for form_code, item_code, value in rows:
-            key = mapping.get((str(form_code), str(item_code)))
-            if not key:
-                continue
-            std_values[key] = std_values.get(key, 0.0) + (float(value) if value is not None else 0.0)
-
-        # Вычисляем каждую формулу
-        for ind_id, expr in indicators.items():
-            val = _eval_formula(expr, std_values)
-            cur.execute(
-                "INSERT OR REPLACE INTO indicator_values(bank_id, indicator_id, period, value) VALUES(?,?,?,?)",
-                (bank_id, ind_id, period, val),
-            )
-            total_written += 1
+    dims = DimensionKeys(conn)
+    ids = [formulas.ids[i] for i in selected]
+    db_path = database_file(conn) if workers > 1 and not is_duckdb(conn) else None
+    if db_path and len(pairs) > 1:
+        # Процессы пула читают БД отдельными соединениями: всё записанное до расчёта должно быть зафиксировано
+        conn.commit()
+        shards = _shard_pairs(pairs, workers * 4)
+        with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as pool:
+            results = pool.map(_evaluate_shard, repeat(db_path), shards, repeat(needed), repeat(selected))
+            for shard, values in zip(shards, results):
+                total_written += _write_indicator_rows(conn, shard, ids, values, dims)
+    else:
+        for pos in range(0, len(pairs), _MATRIX_CHUNK):
+            chunk = pairs[pos:pos + _MATRIX_CHUNK]
+            values = formulas.evaluate(_std_matrix(conn, chunk, formulas.columns, needed))[:, selected]
+            total_written += _write_indicator_rows(conn, chunk, ids, values, dims)
 
     conn.commit()
     print(f"Рассчитано и сохранено значений индикаторов: {total_written}")
@@ -156,109 +624,180 @@ def calculate_qn17(values: Dict[str, float]) -> Optional[float]:
     return None
 
 
-def _shift_months(period_str: str, months: int) -> Optional[str]:
-    try:
-        y, m, d = [int(x) for x in period_str.split("-")]
-        # нормализуем на 1 число месяца
-        y0, m0 = y, m
-        total = y0 * 12 + (m0 - 1) - months
-        if total < 0:
-            return None
-        y1 = total // 12
-        m1 = total % 12 + 1
-        return f"{y1:04d}-{m1:02d}-01"
-    except Exception:
-        return None
+# Изменения {BASE}_PCT_{горизонт} по умолчанию (если в config.yaml нет indicator_changes)
+CHANGE_INDICATORS = ["QN9", "O1", "QN15", "QN18", "QN19", "QN11", "O2", "A1", "QN13"]
+CHANGE_HORIZONS = {"M1": (1, False), "M6": (6, True)}
+
+
+def _read_change_config(path: str):
+    """(базовые индикаторы, {горизонт: (месяцев, гибкое окно)}) из indicator_changes в config.yaml."""
+    with open(path, "r", encoding="utf-8") as f:
+        section = (yaml.safe_load(f) or {}).get("indicator_changes") or {}
+    indicators = [str(i) for i in section.get("indicators") or CHANGE_INDICATORS]
+    horizons = dict(CHANGE_HORIZONS)
+    if section.get("horizons"):
+        horizons = {str(name): (int(h["months"]), bool(h.get("window", False)))
+                    for name, h in section["horizons"].items()}
+    return indicators, horizons
 
 
-def calculate_indicator_changes(conn: sqlite3.Connection) -> None:
-    """Рассчитывает % изменение за 1 и 6 месяцев для заданного набора индикаторов.
-    Сохраняет как отдельные индикаторы: {BASE}_PCT_M1 и {BASE}_PCT_M6.
+def _load_change_config():
+    return load_cached(CFG_PATH, _read_change_config)
 
-    Для 6 месяцев применяется гибкая логика, если нет ровно t-6 месяцев:
-    - выбираем самую раннюю из доступных дат за последние 6 месяцев (но не старше 6 мес.).
-    - если подходящей даты нет, значение не рассчитывается.
+
+def _month_ordinals(periods) -> np.ndarray:
+    """Номера месяцев (год * 12 + месяц - 1) для периодов 'YYYY-MM-DD'; -1 — не разобран."""
+    out = np.full(len(periods), -1, dtype=np.int64)
+    for i, p in enumerate(periods):
+        try:
+            y, m = str(p).split("-")[:2]
+            out[i] = int(y) * 12 + int(m) - 1
+        except ValueError:
+            pass
+    return out
+
+
+def calculate_indicator_changes(conn: sqlite3.Connection, banks=None, pairs=None, indicators=None) -> None:
+    """Рассчитывает % изменения базовых индикаторов по горизонтам из indicator_changes
+    в config.yaml (по умолчанию {BASE}_PCT_M1 и {BASE}_PCT_M6) и сохраняет их как
+    отдельные индикаторы {BASE}_PCT_{горизонт}.
+    banks — пересчитать только эти банки (все их периоды); по умолчанию все.
+    pairs — пары (bank_id, period) с изменившимися значениями: пересчитываются только
+    изменения, окно которых их касается (периоды банка от period до period + самый
+    длинный горизонт).
+    indicators — пересчитать изменения только этих базовых индикаторов.
+
+    Горизонт с window: false сравнивается только с периодом ровно months назад. С
+    window: true (гибкое окно), если ровно months назад нет, берётся самая ранняя из
+    доступных дат за последние months месяцев; если подходящей даты нет, значение не
+    рассчитывается.
+
+    Расчёт векторный: ряды (банк, индикатор) сортируются по ключу ряд × месяц, и
+    предшественник для каждого горизонта ищется np.searchsorted по всем рядам сразу.
     """
-    target_indicators = [
-        "QN9", "O1", "QN15", "QN18", "QN19", "QN11", "O2", "A1", "QN13"
-    ]
+    change_indicators, horizons = _load_change_config()
+    target_indicators = [i for i in change_indicators if indicators is None or i in set(indicators)]
+    if not target_indicators or not horizons:
+        return
+    if pairs is not None:
+        pairs = list(pairs)
+        banks = sorted({bank_id for bank_id, _ in pairs})
+        if not banks:
+            return
 
-    cur = conn.cursor()
     # Считываем все значения интересующих индикаторов
     placeholders = ",".join(["?"] * len(target_indicators))
-    rows = cur.execute(
-        f"SELECT bank_id, indicator_id, period, value FROM indicator_values WHERE indicator_id IN ({placeholders})",
+    scope = ""
+    if banks is not None:
+        scope = f" AND bank_id IN (SELECT bank_id FROM {fill_temp_keys(conn, 'scope_banks', ['bank_id'], banks)})"
+    rows = conn.execute(
+        f"SELECT bank_id, indicator_id, period, value FROM indicator_values WHERE indicator_id IN ({placeholders})" + scope,
         target_indicators,
     ).fetchall()
     if not rows:
         return
 
-    # Группируем: bank -> indicator -> {period: value}
-    data: Dict[str, Dict[str, Dict[str, Optional[float]]]] = {}
-    for bank_id, indicator_id, period, value in rows:
-        data.setdefault(bank_id, {}).setdefault(indicator_id, {})[period] = value
+    bank_ids, ind_ids, periods, values = zip(*rows)
+    bank_names, bank_codes = np.unique(np.array(bank_ids, dtype=object).astype(str), return_inverse=True)
+    ind_names, ind_codes = np.unique(np.array(ind_ids, dtype=object).astype(str), return_inverse=True)
+    months = _month_ordinals(periods)
+    values = np.array(values, dtype=float)
+    touched_months = _month_ordinals([p for _, p in pairs]) if pairs is not None else months
+    # Ключ ряд × месяц; шаг span больше любого месяца плюс горизонт, поэтому поиск
+    # назад от месяца ряда не попадает в соседний ряд
+    window = max(m for m, _ in horizons.values())
+    span = int(max(months.max(), touched_months.max())) + window + 1
+    series = bank_codes.astype(np.int64) * len(ind_names) + ind_codes
+    keep = months >= 0
+    order = np.flatnonzero(keep)[np.argsort(series[keep] * span + months[keep], kind="stable")]
+    keys = series[order] * span + months[order]
+    curr = values[order]
+    rows_idx = np.arange(len(order))
+
+    target = np.ones(len(order), dtype=bool)
+    if pairs is not None:
+        # Только периоды, окно которых касается изменённых пар: period - window <= q <= period
+        bank_index = {b: i for i, b in enumerate(bank_names)}
+        touched = np.array(sorted(bank_index[b] * span + m for (b, _), m in zip(pairs, touched_months.tolist())
+                                  if b in bank_index and m >= 0), dtype=np.int64)
+        own = bank_codes[order].astype(np.int64) * span + months[order]
+        pos = np.searchsorted(touched, own - window, side="left")
+        target = pos < len(touched)
+        target[target] = touched[pos[target]] <= own[target]
+    target &= ~np.isnan(curr)
+
+    out = []
+    for name, (depth, flexible) in horizons.items():
+        if flexible:
+            # Самая ранняя дата ряда в [period - depth, period - 1] (ровно depth назад — она же)
+            prev = np.searchsorted(keys, keys - depth, side="left")
+            found = prev < rows_idx
+        else:
+            prev = np.minimum(np.searchsorted(keys, keys - depth, side="left"), len(keys) - 1)
+            found = keys[prev] == keys - depth
+        prev_values = curr[prev]
+        ok = target & found & ~np.isnan(prev_values) & (prev_values != 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            changes = (curr - prev_values) / np.abs(prev_values) * 100.0
+        idx = np.flatnonzero(ok)
+        suffix = f"_PCT_{name}"
+        out.extend((bank_ids[r], ind_ids[r] + suffix, periods[r], v)
+                   for r, v in zip(order[idx].tolist(), changes[idx].tolist()))
+
+    # Одна пакетная запись (upsert) всех изменений
+    if out:
+        write_indicator_values(conn, out)
+    written = len(out)
+    conn.commit()
+    if written:
+        print(f"Рассчитаны изменения индикаторов (%%): {written}")
 
-    def months_between(prev: str, cur: str) -> Optional[int]:
-        try:
-            y0, m0, _ = [int(x) for x in prev.split("-")]
-            y1, m1, _ = [int(x) for x in cur.split("-")]
-            return (y1 * 12 + (m1 - 1)) - (y0 * 12 + (m0 - 1))
-        except Exception:
-            return None
 
-    def pick_prev_within(per_map: Dict[str, Optional[float]], p: str, max_months: int) -> Optional[str]:
-        """Вернуть самую раннюю доступную дату в интервале (p-max_months, p),
-        т.е. максимально отстоящую назад, но не старше max_months.
-        """
-        candidates = []
-        for cand in per_map.keys():
-            if cand >= p:
-                continue
-            diff = months_between(cand, p)
-            if diff is None:
-                continue
-            if 1 <= diff <= max_months:
-                candidates.append((diff, cand))
-        if not candidates:
-            return None
-        # Самая ранняя в пределах окна: максимальная разница по месяцам
-        candidates.sort(reverse=True)
-        return candidates[0][1]
+def _store_formula_hashes(conn: sqlite3.Connection, formulas: Dict[str, str], hashes: Dict[str, str]) -> None:
+    conn.executemany("INSERT OR IGNORE INTO indicators(indicator_id) VALUES(?)", [(i,) for i in hashes])
+    conn.executemany("UPDATE indicators SET formula = ?, formula_hash = ? WHERE indicator_id = ?",
+                     [(formulas[i], h, i) for i, h in hashes.items()])
+    conn.commit()
 
-    written = 0
-    for bank_id, ind_map in data.items():
-        for ind_id, per_map in ind_map.items():
-            periods = sorted(per_map.keys())
-            for p in periods:
-                curr = per_map.get(p)
-                if curr is None:
-                    continue
-                # 1 месяц назад
-                p_m1 = _shift_months(p, 1)
-                if p_m1 and p_m1 in per_map:
-                    prev = per_map.get(p_m1)
-                    if prev not in (None, 0):
-                        chg = (curr - prev) / abs(prev) * 100.0
-                        cur.execute(
-                            "INSERT OR REPLACE INTO indicator_values(bank_id, indicator_id, period, value) VALUES(?,?,?,?)",
-                            (bank_id, f"{ind_id}_PCT_M1", p, chg),
-                        ); written += 1
-                # 6 месяцев назад (гибкое окно)
-                p_m6_exact = _shift_months(p, 6)
-                prev_key = None
-                if p_m6_exact and p_m6_exact in per_map:
-                    prev_key = p_m6_exact
-                else:
-                    prev_key = pick_prev_within(per_map, p, 6)
-                if prev_key is not None:
-                    prev6 = per_map.get(prev_key)
-                    if prev6 not in (None, 0):
-                        chg6 = (curr - prev6) / abs(prev6) * 100.0
-                        cur.execute(
-                            "INSERT OR REPLACE INTO indicator_values(bank_id, indicator_id, period, value) VALUES(?,?,?,?)",
-                            (bank_id, f"{ind_id}_PCT_M6", p, chg6),
-                        ); written += 1
 
-    conn.commit()
-    if written:
-        print(f"Рассчитаны изменения индикаторов (%%): {written}")
+def update_indicators(conn: sqlite3.Connection, full: bool = False, workers: int = 1) -> None:
+    """Инкрементальный расчёт индикаторов и изменений (команда calc-indicators).
+
+    Пересчитываются пары банк×период из dirty_pairs (отмечены импортом после
+    прошлого расчёта) — все индикаторы; и индикаторы, у которых изменилось
+    определение (хэш формулы с учётом ссылок не совпадает с indicators.formula_hash), —
+    по всем парам. Изменения PCT_M1/PCT_M6 пересчитываются для изменённых базовых
+    индикаторов и для периодов, окно которых касается пересчитанных пар.
+    Изменение configs/data_dictionary.csv (sha256 не совпадает с config_sync) меняет
+    входы всех индикаторов и приводит к полному пересчёту.
+    full — пересчитать всё, как раньше.
+    workers — число процессов расчёта индикаторов (см. calculate_indicators).
+    """
+    # Столбец formula_hash может отсутствовать в БД, созданной раньше
+    init_db(conn)
+    formulas = _load_indicators_config()
+    hashes = _formula_hashes(formulas)
+    stored = dict(conn.execute("SELECT indicator_id, formula_hash FROM indicators").fetchall())
+    changed = [ind_id for ind_id in formulas if stored.get(ind_id) != hashes[ind_id]]
+    dirty = get_dirty_pairs(conn)
+    if sync_data_dictionary(conn) and not full:
+        print("Словарь data_dictionary.csv изменился — полный пересчёт.")
+        full = True
+    if full or len(changed) == len(formulas):
+        calculate_indicators(conn, workers=workers)
+        calculate_indicator_changes(conn)
+    elif not changed and not dirty:
+        print("Индикаторы актуальны: нет новых данных и изменённых формул.")
+        return
+    else:
+        print(f"Инкрементальный пересчёт: пар банк×период {len(dirty)}, изменённых формул {len(changed)}"
+              + (f" ({', '.join(changed)})" if changed else ""))
+        if changed:
+            calculate_indicators(conn, indicators=changed, workers=workers)
+            calculate_indicator_changes(conn, indicators=changed)
+        if dirty:
+            calculate_indicators(conn, pairs=dirty, workers=workers)
+            calculate_indicator_changes(conn, pairs=dirty)
+    _store_formula_hashes(conn, formulas, hashes)
+    if dirty:
+        clear_dirty_pairs(conn, dirty)
@@ -11,26 +11,24 @@ try:
 except Exception:  # пакет может быть не установлен у всех
     GigaChat = None  # type: ignore
 from tqdm import tqdm
-from .db import load_config
+from .db import load_config, hot_query, read_sql, latest_period, period_loaded
+from .indicator_cube import get_series
+
+# Логи запросов/ответов и кэш LLM по периодам
+LLM_LOGS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "llm_logs")
 
 
 def _latest_period(conn: sqlite3.Connection) -> str:
-    r = conn.cursor().execute("SELECT MAX(period) FROM raw_values").fetchone()
-    return r[0] if r and r[0] else None
+    return latest_period(conn)
 
 
 def _resolve_period(conn: sqlite3.Connection, desired: Optional[str]) -> Optional[str]:
     """Возвращает ближайший доступный период ≤ desired. desired='latest' → последний."""
     if not desired or desired == "latest":
         return _latest_period(conn)
-    cur = conn.cursor()
-    row = cur.execute("SELECT 1 FROM raw_values WHERE period=? LIMIT 1", (desired,)).fetchone()
-    if row:
+    if period_loaded(conn, desired):
         return desired
-    row = cur.execute("SELECT MAX(period) FROM raw_values WHERE period<=?", (desired,)).fetchone()
-    if row and row[0]:
-        return row[0]
-    return _latest_period(conn)
+    return latest_period(conn, upto=desired) or _latest_period(conn)
 
 METRICS_BASE = [
     "A1", "QN9", "O1", "O2", "QN11", "QN15", "QN18", "QN19", "QN13",
@@ -41,38 +39,29 @@ METRICS_SINGLE = []
 
 
 def _collect_series(conn: sqlite3.Connection, bank_id: str, periods: List[str]) -> Dict[str, Dict]:
-    cur = conn.cursor()
+    metrics = METRICS_BASE + METRICS_PCT + METRICS_SINGLE
+    # Ряды всех банков окна читаются одним запросом при первом вызове и берутся из кэша get_series
+    by_metric: Dict[str, Dict] = {}
+    if periods:
+        by_metric = get_series(conn, None, metrics, (min(periods), max(periods))).cells(bank_id, metrics, periods)
     res: Dict[str, Dict] = {}
     for m in METRICS_BASE:
-        rows = cur.execute(
-            "SELECT period, value FROM indicator_values WHERE bank_id=? AND indicator_id=? AND period IN (%s)"
-            % (",".join(["?"] * len(periods))),
-            (bank_id, m, *periods),
-        ).fetchall()
-        value_by_period = {p: v for p, v in rows}
+        value_by_period = by_metric.get(m, {})
         # Явно заполняем все запрошенные периоды; отсутствие записи -> null
         series = [{"p": p, "v": value_by_period.get(p)} for p in sorted(periods)]
         res[m] = {"series": series }
     for m in METRICS_PCT + METRICS_SINGLE:
-        rows = cur.execute(
-            "SELECT period, value FROM indicator_values WHERE bank_id=? AND indicator_id=? AND period IN (%s)"
-            % (",".join(["?"] * len(periods))),
-            (bank_id, m, *periods),
-        ).fetchall()
-        latest = None
-        if rows:
-            rows.sort(key=lambda x: x[0])
-            latest = rows[-1][1]
+        value_by_period = by_metric.get(m)
+        latest = value_by_period[max(value_by_period)] if value_by_period else None
         res[m] = {"latest": latest}
     return res
 
 
 def _collect_peer_percentiles(conn: sqlite3.Connection, period: str) -> Dict[str, float]:
-    df = pd.read_sql_query(
-        "SELECT indicator_id, value FROM indicator_values WHERE period=? AND indicator_id IN (%s)"
-        % (",".join(["?"] * len(METRICS_BASE + ["QN11"]))),
+    df = read_sql(
         conn,
-        params=(period, *METRICS_BASE, "QN11"),
+        hot_query(conn, "peer_values").format(ids=",".join(["?"] * len(METRICS_BASE + ["QN11"]))),
+        (period, *METRICS_BASE, "QN11"),
     )
     out = {}
     if df.empty:
@@ -583,7 +572,7 @@ def llm_analyze_all(conn: sqlite3.Connection, months: int = 6, model: Optional[s
 
     # Периоды для среза
     periods = [r[0] for r in conn.cursor().execute(
-        "SELECT DISTINCT period FROM raw_values WHERE period<=? ORDER BY period DESC LIMIT ?",
+        hot_query(conn, "recent_periods"),
         (target_period, months),
     ).fetchall()]
     periods = sorted(periods)
@@ -668,7 +657,7 @@ def llm_analyze_all(conn: sqlite3.Connection, months: int = 6, model: Optional[s
     banks = select_banks(cur, target_period, only_errors, bank_limit, max_banks)
 
     print(f"LLM-анализ: период {target_period}, банков: {len(banks)}, модель: {model}, режим: responses")
-    logs_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "llm_logs", target_period)
+    logs_dir = os.path.join(LLM_LOGS_DIR, target_period)
     os.makedirs(logs_dir, exist_ok=True)
     # Сохраняем описание параметров один раз на период
     try:
@@ -1,8 +1,9 @@
 import sqlite3, pandas as pd
 from datetime import datetime
+from .db import hot_query, is_duckdb, read_sql, latest_period, earliest_period, period_loaded
+from .indicator_cube import get_series
 def _latest_period(conn):
-    cur=conn.cursor(); cur.execute("SELECT MAX(period) FROM raw_values")
-    r=cur.fetchone(); return r[0] if r and r[0] else None
+    return latest_period(conn)
 
 def _resolve_period(conn: sqlite3.Connection, desired: str) -> str:
     """Возвращает ближайший доступный период ≤ desired. Если desired=='latest' — последний.
@@ -10,18 +11,41 @@ def _resolve_period(conn: sqlite3.Connection, desired: str) -> str:
     """
     if desired == "latest" or not desired:
         return _latest_period(conn)
-    cur = conn.cursor()
     # Прямое совпадение
-    row = cur.execute("SELECT 1 FROM raw_values WHERE period=? LIMIT 1", (desired,)).fetchone()
-    if row:
+    if period_loaded(conn, desired):
         return desired
     # Ближайший ≤ desired
-    row = cur.execute("SELECT MAX(period) FROM raw_values WHERE period<=?", (desired,)).fetchone()
-    if row and row[0]:
-        return row[0]
+    found = latest_period(conn, upto=desired)
+    if found:
+        return found
     # Фолбэк: если нет периодов ≤ desired, вернуть самый ранний доступный
-    row = cur.execute("SELECT MIN(period) FROM raw_values").fetchone()
-    return row[0] if row and row[0] else None
+    return earliest_period(conn)
+def _summary_pandas(conn, period, ind):
+    """Лист Summary: широкая таблица индикаторов за период (pivot_table) с наименованиями и классификациями."""
+    banks=read_sql(conn, "SELECT bank_id, COALESCE(bank_name, bank_id) as bank_name FROM banks")
+    ind_w=ind.pivot_table(index="bank_id", columns="indicator_id", values="value", aggfunc="first").reset_index()
+    algo=read_sql(conn, "SELECT bank_id, status, details FROM algo_classifications WHERE period=?", (period,))
+    llm=read_sql(conn, "SELECT bank_id, status, reasoning, model FROM llm_classifications WHERE period=?", (period,))
+    return (banks.merge(ind_w,on="bank_id",how="right")
+                 .merge(algo.rename(columns={"status":"algo_status","details":"algo_details"}),on="bank_id",how="left")
+                 .merge(llm.rename(columns={"status":"llm_status","reasoning":"llm_reasoning","model":"llm_model"}),on="bank_id",how="left"))
+
+def _summary_sql(conn, period):
+    """Тот же лист Summary одним запросом в базе (DuckDB): столбец на индикатор — условная
+    агрегация по indicator_values за период. Пустые значения отбрасываются, как в pivot_table."""
+    ids=sorted(r[0] for r in conn.execute("SELECT DISTINCT indicator_id FROM indicator_values "
+                                          "WHERE period=? AND value IS NOT NULL", (period,)).fetchall())
+    cols="".join(", first(value) FILTER (WHERE indicator_id=?) AS \"%s\"" % i.replace('"', '""') for i in ids)
+    sql=("SELECT w.bank_id, COALESCE(b.bank_name, b.bank_id) AS bank_name, w.* EXCLUDE (bank_id), "
+         "a.status AS algo_status, a.details AS algo_details, "
+         "l.status AS llm_status, l.reasoning AS llm_reasoning, l.model AS llm_model "
+         f"FROM (SELECT bank_id{cols} FROM indicator_values WHERE period=? AND value IS NOT NULL GROUP BY bank_id) w "
+         "LEFT JOIN banks b ON b.bank_id=w.bank_id "
+         "LEFT JOIN algo_classifications a ON a.bank_id=w.bank_id AND a.period=? "
+         "LEFT JOIN llm_classifications l ON l.bank_id=w.bank_id AND l.period=? "
+         "ORDER BY w.bank_id")
+    return read_sql(conn, sql, (*ids, period, period, period))
+
 def make_report(conn: sqlite3.Connection, period="latest", outfile="report.xlsx"):
     # Разрешаем произвольную дату: выбираем ближайший доступный период ≤ указанной дате
     period = _resolve_period(conn, period or "latest")
@@ -39,22 +63,16 @@ def make_report(conn: sqlite3.Connection, period="latest", outfile="report.xlsx"
             os.makedirs(d, exist_ok=True)
     except Exception:
         pass
-    banks=pd.read_sql_query("SELECT bank_id, COALESCE(bank_name, bank_id) as bank_name FROM banks", conn)
-    ind=pd.read_sql_query("SELECT bank_id, indicator_id, value FROM indicator_values WHERE period=?", conn, params=(period,))
+    ind=get_series(conn, None, None, (period, period)).frame()[["bank_id","indicator_id","value"]]
     if ind.empty: print("Нет индикаторов на указанный период."); return
-    ind_w=ind.pivot_table(index="bank_id", columns="indicator_id", values="value", aggfunc="first").reset_index()
-    algo=pd.read_sql_query("SELECT bank_id, status, details FROM algo_classifications WHERE period=?", conn, params=(period,))
-    llm=pd.read_sql_query("SELECT bank_id, status, reasoning, model FROM llm_classifications WHERE period=?", conn, params=(period,))
-    summary=(banks.merge(ind_w,on="bank_id",how="right")
-                  .merge(algo.rename(columns={"status":"algo_status","details":"algo_details"}),on="bank_id",how="left")
-                  .merge(llm.rename(columns={"status":"llm_status","reasoning":"llm_reasoning","model":"llm_model"}),on="bank_id",how="left"))
+    summary=_summary_sql(conn, period) if is_duckdb(conn) else _summary_pandas(conn, period, ind)
     with pd.ExcelWriter(outfile, engine="xlsxwriter") as w:
         summary.to_excel(w, sheet_name="Summary", index=False)
         ind.to_excel(w, sheet_name="Indicators_long", index=False)
-        raw=pd.read_sql_query("SELECT * FROM raw_values WHERE period=?", conn, params=(period,))
+        raw=read_sql(conn, hot_query(conn, "raw_by_period"), (period,))
         raw.to_excel(w, sheet_name="Raw_values", index=False)
         # Лист LLM: если есть классификации LLM за период, добавим и извлечём рекомендацию
-        llm_df=pd.read_sql_query("SELECT bank_id, status, reasoning, model FROM llm_classifications WHERE period=?", conn, params=(period,))
+        llm_df=read_sql(conn, "SELECT bank_id, status, reasoning, model FROM llm_classifications WHERE period=?", (period,))
         if not llm_df.empty:
             def _extract_reco(x):
                 try:
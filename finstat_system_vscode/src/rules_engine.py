@@ -1,4 +1,6 @@
-import os, sqlite3, yaml, re, pandas as pd
+import os, sqlite3, yaml, re, numpy as np, pandas as pd
+from .db import load_cached, fill_temp_keys, read_sql
+from .indicator_cube import open_cube
 
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 CFG_DIR = os.path.join(BASE_DIR, "configs")
@@ -17,74 +19,111 @@ def _parse_condition(cond: str):
         return ("between", min(a,b), max(a,b))
     raise ValueError(cond)
 
-def _check(value, rule):
-    if value is None: return False
-    if rule[0]=="cmp":
-        op,thr=rule[1],rule[2]
-        return (value<thr) if op=="<" else (value<=thr) if op=="<=" else (value>thr) if op==">" else (value>=thr)
-    a,b=rule[1],rule[2]
-    return a<=value<=b
+_OPS = {"<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal}
+# Порядок проверки наборов: Red важнее Yellow, если ничего не сработало — Green
+_LEVELS = (("red_sets", "Red"), ("yellow_sets", "Yellow"))
 
-def classify_all(conn: sqlite3.Connection):
-    rules = _load_yaml(os.path.join(CFG_DIR, "rules.yaml")) or {}
-    df = pd.read_sql_query("SELECT bank_id, indicator_id, period, value FROM indicator_values", conn)
-    if df.empty:
-        print("Нет индикаторов для классификации."); return
+def _compile_rules(path):
+    """{"red_sets"/"yellow_sets": [(индикаторы, условия), ...]} из rules.yaml: AND внутри
+    набора, OR между наборами; одиночные пороги и прочие ключи игнорируются."""
+    rules = _load_yaml(path) or {}
+    compiled = {}
+    for key, _ in _LEVELS:
+        if isinstance(rules.get(key), list):
+            compiled[key] = [(list(s), [_parse_condition(str(v)) for v in s.values()])
+                             for s in rules[key] if isinstance(s, dict)]
+    return compiled
+
+def _condition_mask(column, rule):
+    """Условие по столбцу значений; NaN (нет значения) условие не выполняет."""
+    if rule[0]=="cmp": return _OPS[rule[1]](column, rule[2])
+    return (column>=rule[1]) & (column<=rule[2])
 
-    # Разбор только наборов (AND внутри, OR между наборами)
-    yellow_sets = None
-    red_sets = None
-    for ind, rs in rules.items():
-        if ind == 'yellow_sets' and isinstance(rs, list):
-            ys = []
-            for s in rs:
-                if isinstance(s, dict):
-                    ys.append({k: _parse_condition(str(v)) for k, v in s.items()})
-            yellow_sets = ys
-            continue
-        if ind == 'red_sets' and isinstance(rs, list):
-            rs_list = []
-            for s in rs:
-                if isinstance(s, dict):
-                    rs_list.append({k: _parse_condition(str(v)) for k, v in s.items()})
-            red_sets = rs_list
-            continue
-        # игнорируем одиночные пороги и любые другие ключи
+def _condition_text(ind, rule):
+    """Условие набора в виде текста для details: "QN9_PCT_M1 < -2", "O1_PCT_M1 between -5, 5"."""
+    if rule[0]=="cmp": return f"{ind} {rule[1]} {rule[2]:g}"
+    return f"{ind} between {rule[1]:g}, {rule[2]:g}"
 
-    cur = conn.cursor()
-    results = {}; details = {}
-    for (bank_id, period), grp in df.groupby(["bank_id","period"]):
-        st="Green"; fired=[]; vals={r["indicator_id"]:r["value"] for _,r in grp.iterrows()}
-        # 1) Сначала проверяем Red-наборы (OR между наборами, AND внутри набора)
-        if st == "Green" and red_sets:
-            any_red_ok = False
-            for s in red_sets:
-                ok = True
-                for ind_key, cond in s.items():
-                    v = vals.get(ind_key)
-                    if v is None or not _check(v, cond):
-                        ok = False; break
-                if ok:
-                    any_red_ok = True; break
-            if any_red_ok:
-                st = "Red"; fired.append("Red SET: выполнен один из наборов")
+def _first_set(sets, matrix, columns):
+    """Проверка наборов над matrix: номер первого выполненного набора для каждой строки
+    (-1 — ни одного), а также по каждому набору число невыполненных условий и номер
+    первого невыполненного условия (-1 — набор выполнен) — массивы наборы × строки."""
+    first = np.full(len(matrix), -1)
+    failed = np.zeros((len(sets), len(matrix)), dtype=np.intp)
+    first_fail = np.full((len(sets), len(matrix)), -1)
+    missing = np.full(len(matrix), np.nan)
+    for n, (indicators, conditions) in enumerate(sets):
+        for c, (ind, rule) in enumerate(zip(indicators, conditions)):
+            j = columns.get(ind)
+            miss = ~_condition_mask(missing if j is None else matrix[:, j], rule)
+            first_fail[n][miss & (failed[n] == 0)] = c
+            failed[n] += miss
+        first[(failed[n] == 0) & (first < 0)] = n
+    return first, failed, first_fail
 
-        # 2) Наборы для Yellow (OR между наборами, AND внутри набора)
-        if st == "Green" and yellow_sets:
-            any_set_ok = False
-            for s in yellow_sets:
-                ok = True
-                for ind_key, cond in s.items():
-                    v = vals.get(ind_key)
-                    if v is None or not _check(v, cond):
-                        ok = False; break
-                if ok:
-                    any_set_ok = True; break
-            if any_set_ok:
-                st = "Yellow"; fired.append("Yellow SET: выполнен один из наборов")
-        # 3) Никаких одиночных правил — если ничего не сработало, остаётся Green
-        results[(bank_id,period)]=st; details[(bank_id,period)]="; ".join(fired)
-    for (bank_id,period),st in results.items():
-        cur.execute("INSERT OR REPLACE INTO algo_classifications(bank_id,period,status,details) VALUES(?,?,?,?)",
-                    (bank_id,period,st,details[(bank_id,period)]))
-    conn.commit(); print(f"Классификация завершена для {len(results)} банк×период.")
+def _rule_matrix(conn, pairs, indicators):
+    """Пары (bank_id, period) с индикаторами (по возрастанию) и матрица пары × indicators
+    (NaN — нет значения): из актуального куба или одной выборкой indicator_values."""
+    cube = open_cube(conn)
+    if cube is not None:
+        present = cube.present.any(axis=1)
+        if pairs is not None:
+            scope = np.zeros_like(present)
+            for bank_id, period in pairs:
+                b = cube.bank_index.get(bank_id); p = cube.period_index.get(period)
+                if b is not None and p is not None: scope[b, p] = True
+            present &= scope
+        b, p = np.nonzero(present)
+        keys = list(zip(np.asarray(cube.banks, dtype=object)[b], np.asarray(cube.periods, dtype=object)[p]))
+        matrix = np.full((len(keys), len(indicators)), np.nan)
+        for j, ind in enumerate(indicators):
+            d = cube.indicator_index.get(ind)
+            if d is not None: matrix[:, j] = cube.values[b, d, p]
+        return keys, matrix
+    if pairs is None:
+        df = read_sql(conn, "SELECT bank_id, indicator_id, period, value FROM indicator_values")
+    else:
+        scope = fill_temp_keys(conn, "scope_pairs", ["bank_id", "period"], pairs)
+        df = read_sql(conn, "SELECT iv.bank_id, iv.indicator_id, iv.period, iv.value FROM indicator_values iv "
+                            f"JOIN {scope} s ON s.bank_id=iv.bank_id AND s.period=iv.period")
+    rows, keys = pd.MultiIndex.from_frame(df[["bank_id", "period"]]).factorize(sort=True)
+    cols = df["indicator_id"].map({ind: j for j, ind in enumerate(indicators)}).to_numpy(dtype=float)
+    hit = ~np.isnan(cols)
+    matrix = np.full((len(keys), len(indicators)), np.nan)
+    matrix[rows[hit], cols[hit].astype(np.intp)] = pd.to_numeric(df["value"], errors="coerce").to_numpy(dtype=float)[hit]
+    return list(keys), matrix
+
+def classify_all(conn: sqlite3.Connection, pairs=None):
+    """Классифицирует пары банк×период; pairs — только эти пары (bank_id, period).
+    Наборы rules.yaml разбираются один раз и проверяются сразу для всех пар над
+    матрицей пары × индикаторы."""
+    compiled = load_cached(os.path.join(CFG_DIR, "rules.yaml"), _compile_rules)
+    indicators = sorted({ind for sets in compiled.values() for inds, _ in sets for ind in inds}, key=str)
+    keys, matrix = _rule_matrix(conn, pairs, indicators)
+    if not keys:
+        print("Нет индикаторов для классификации."); return
+    columns = {ind: j for j, ind in enumerate(indicators)}
+    status = np.full(len(keys), "Green", dtype=object); details = np.full(len(keys), "", dtype=object)
+    # Для Green — ближайший набор (меньше всего невыполненных условий, при равенстве первый
+    # в порядке _LEVELS) и его первое невыполненное условие
+    closest_failed = np.full(len(keys), np.iinfo(np.intp).max); closest = np.full(len(keys), "", dtype=object)
+    for key, level in _LEVELS:
+        if not compiled.get(key): continue
+        first, failed, first_fail = _first_set(compiled[key], matrix, columns)
+        for n, (inds, conditions) in enumerate(compiled[key]):
+            fired = (first == n) & (status == "Green")
+            status[fired] = level; details[fired] = f"{level} SET #{n + 1}: выполнен один из наборов"
+            nearer = failed[n] < closest_failed
+            if not nearer.any(): continue
+            closest_failed[nearer] = failed[n][nearer]
+            for c, (ind, rule) in enumerate(zip(inds, conditions)):
+                j = columns.get(ind)
+                at = nearer & (first_fail[n] == c)
+                gap = np.isnan(matrix[:, j]) if j is not None else np.ones(len(keys), dtype=bool)
+                text = f"Green: ближе всего {level} SET #{n + 1}, не выполнено {_condition_text(ind, rule)}"
+                closest[at & ~gap] = text; closest[at & gap] = text + " (нет значения)"
+    green = (status == "Green") & (closest != "")
+    details[green] = closest[green]
+    conn.cursor().executemany("INSERT OR REPLACE INTO algo_classifications(bank_id,period,status,details) VALUES(?,?,?,?)",
+                              [(bank_id, period, st, det) for (bank_id, period), st, det in zip(keys, status, details)])
+    conn.commit(); print(f"Классификация завершена для {len(keys)} банк×период.")
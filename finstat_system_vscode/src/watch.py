@@ -0,0 +1,155 @@
+"""
+Режим наблюдения за папкой input/ (python run.py watch).
+
+Постоянный процесс: конфигурация и соединение с БД открываются один раз,
+новые файлы обнаруживаются опросом папки по «отпечаткам» stat (размер, mtime)
+без внешних сервисов. Файл берётся в работу, когда его отпечаток не меняется
+settle_polls опросов подряд (копирование завершено). После импорта пакета
+индикаторы, изменения и классификация пересчитываются только для затронутых
+пар банк×период (dirty_pairs).
+"""
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .db import get_dirty_pairs, clear_dirty_pairs, fill_temp_keys, init_db
+from .import_dbf import import_all_dbf, BASE_DIR, CFG
+from .indicators import calculate_indicators, calculate_indicator_changes
+from .rules_engine import classify_all
+
+WATCH_CFG = CFG.get("watch") or {}
+EXTENSIONS = (".dbf", ".rar", ".zip")
+
+
+def _fingerprints(folder: str) -> Dict[str, Tuple[int, int]]:
+    prints = {}
+    with os.scandir(folder) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.lower().endswith(EXTENSIONS):
+                st = entry.stat()
+                prints[entry.name] = (st.st_size, st.st_mtime_ns)
+    return prints
+
+
+class FolderWatcher:
+    """Опрос папки: отслеживает новые/изменённые файлы и время их появления."""
+
+    def __init__(self, folder: str, settle_polls: int = 2):
+        self.folder = folder
+        self.settle_polls = max(1, int(settle_polls))
+        self._seen = {}   # имя -> [отпечаток, число одинаковых опросов подряд, время появления]
+        self._done = {}   # имя -> отпечаток: обработан, но остался в папке (например, ошибка чтения)
+
+    def poll(self) -> Dict[str, float]:
+        """Возвращает {имя файла: время появления} для файлов, готовых к импорту."""
+        now = time.time()
+        current = _fingerprints(self.folder)
+        for name in list(self._seen):
+            if name not in current:
+                del self._seen[name]
+        for name in list(self._done):
+            if current.get(name) != self._done[name]:
+                del self._done[name]
+        ready = {}
+        for name, fp in current.items():
+            if name in self._done:
+                continue
+            entry = self._seen.get(name)
+            if entry is None:
+                entry = self._seen[name] = [fp, 1, now]
+            elif entry[0] != fp:
+                entry[0], entry[1] = fp, 1
+            else:
+                entry[1] += 1
+            if entry[1] >= self.settle_polls:
+                ready[name] = entry[2]
+        return ready
+
+    def mark_done(self, names: List[str]):
+        current = _fingerprints(self.folder)
+        for name in names:
+            self._seen.pop(name, None)
+            if name in current:
+                self._done[name] = current[name]
+
+
+def refresh_dirty(conn) -> Tuple[int, Dict[str, float]]:
+    """Пересчитывает индикаторы, изменения и классификацию только для затронутых пар.
+
+    Изменения за 1–6 месяцев зависят от соседних периодов, поэтому они считаются
+    для периодов, окно которых касается затронутых пар, а классификация — по
+    периодам банка, начиная с самого раннего затронутого. Возвращает (число пар, тайминги в с).
+    """
+    dirty = get_dirty_pairs(conn)
+    if not dirty:
+        return 0, {}
+    timings = {}
+    t0 = time.perf_counter()
+    calculate_indicators(conn, pairs=dirty)
+    t1 = time.perf_counter()
+    banks = sorted({b for b, _ in dirty})
+    calculate_indicator_changes(conn, pairs=dirty)
+    t2 = time.perf_counter()
+    first = {}
+    for bank_id, period in dirty:
+        if bank_id not in first or period < first[bank_id]:
+            first[bank_id] = period
+    scope = fill_temp_keys(conn, "scope_banks", ["bank_id"], banks)
+    rows = conn.execute(f"SELECT DISTINCT bank_id, period FROM indicator_values "
+                        f"WHERE bank_id IN (SELECT bank_id FROM {scope})").fetchall()
+    classify_all(conn, pairs=[(b, p) for b, p in rows if p >= first[b]])
+    t3 = time.perf_counter()
+    clear_dirty_pairs(conn, dirty)
+    timings["indicators"] = t1 - t0
+    timings["changes"] = t2 - t1
+    timings["classify"] = t3 - t2
+    return len(dirty), timings
+
+
+def _run_batch(conn, watcher: FolderWatcher, ready: Dict[str, float], workers: Optional[int], log_path: Optional[str]):
+    names = sorted(ready)
+    arrived = min(ready.values())
+    t0 = time.perf_counter()
+    import_all_dbf(conn, workers=workers, files=set(names))
+    t_import = time.perf_counter() - t0
+    pairs, timings = refresh_dirty(conn)
+    watcher.mark_done(names)
+    latency = time.time() - arrived
+    print(f"Пакет: файлов {len(names)}, пар банк×период {pairs}; импорт {t_import:.2f} с, "
+          f"индикаторы {timings.get('indicators', 0.0):.2f} с, изменения {timings.get('changes', 0.0):.2f} с, "
+          f"классификация {timings.get('classify', 0.0):.2f} с; "
+          f"от поступления до классификации {latency:.2f} с")
+    if log_path:
+        record = {"finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "files": names, "pairs": pairs,
+                  "import_s": round(t_import, 3), **{f"{k}_s": round(v, 3) for k, v in timings.items()},
+                  "latency_s": round(latency, 3)}
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def watch(conn, interval: Optional[float] = None, settle_polls: Optional[int] = None,
+          workers: Optional[int] = None, once: bool = False):
+    """Бесконечный цикл наблюдения за input_folder (Ctrl+C — выход).
+    once=True — завершиться после первого обработанного пакета."""
+    input_folder = os.path.join(BASE_DIR, CFG.get("input_folder", "input"))
+    os.makedirs(input_folder, exist_ok=True)
+    interval = float(interval if interval is not None else WATCH_CFG.get("interval", 5))
+    settle_polls = int(settle_polls if settle_polls is not None else WATCH_CFG.get("settle_polls", 2))
+    log_file = WATCH_CFG.get("log_file", os.path.join("data", "watch_batches.jsonl"))
+    log_path = os.path.join(BASE_DIR, log_file) if log_file else None
+
+    init_db(conn)
+    watcher = FolderWatcher(input_folder, settle_polls)
+    print(f"Наблюдение за {input_folder} (опрос каждые {interval:g} с). Ctrl+C — выход.")
+    try:
+        while True:
+            ready = watcher.poll()
+            if ready:
+                _run_batch(conn, watcher, ready, workers, log_path)
+                if once:
+                    break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Наблюдение остановлено.")
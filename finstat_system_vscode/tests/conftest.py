@@ -0,0 +1,97 @@
+"""
+Общие фикстуры тестов.
+
+Данные — небольшой синтетический набор ЦБ (benchmarks/synth_dataset.py): архивы
+<форма>-<YYYYMM01>.zip с META и NAMES.DBF. БД создаётся во временном каталоге на
+обоих бэкендах (фикстура backend: sqlite и duckdb), input/ и archive/ импорта
+подменяются в import_dbf.CFG, дисковый кэш формул — на временный каталог.
+
+Запуск из каталога проекта: python -m pytest -q
+"""
+import os
+import shutil
+import sys
+
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from benchmarks.synth_dataset import generate_dataset  # noqa: E402
+from src import import_dbf, indicators  # noqa: E402
+from src.db import connect, init_db  # noqa: E402
+
+BACKENDS = ("sqlite", "duckdb")
+# Восемь месяцев: хватает на изменения M1, M3 и M6
+SYNTH = {"banks": 6, "periods": 8, "items": 20, "start": "2023-01", "seed": 42}
+
+
+def open_db(backend: str, folder) -> object:
+    """Соединение с новой (или существующей) БД бэкенда в каталоге folder; схема создаётся."""
+    name = "finstat.duckdb" if backend == "duckdb" else "finstat.db"
+    conn = connect(f"{backend}:///{os.path.join(str(folder), name)}")
+    init_db(conn)
+    return conn
+
+
+def synth_periods(folder) -> list:
+    """Периоды YYYYMM01 архивов набора по возрастанию."""
+    return sorted({name.rsplit("-", 1)[1][:8] for name in os.listdir(folder) if name.endswith(".zip")})
+
+
+def import_files(conn, source, workdir, workers=1, periods=None):
+    """Копирует архивы набора source (только периодов periods, если заданы) в workdir/input
+    и импортирует их; обработанные файлы остаются в workdir/archive."""
+    input_dir = os.path.join(str(workdir), "input")
+    archive_dir = os.path.join(str(workdir), "archive")
+    os.makedirs(input_dir, exist_ok=True)
+    os.makedirs(archive_dir, exist_ok=True)
+    for name in sorted(os.listdir(source)):
+        if periods is None or name.rsplit("-", 1)[1][:8] in periods:
+            shutil.copy(os.path.join(str(source), name), os.path.join(input_dir, name))
+    saved = {k: import_dbf.CFG.get(k) for k in ("input_folder", "archive_folder")}
+    # Пути абсолютные: os.path.join(BASE_DIR, ...) в import_dbf их не меняет
+    import_dbf.CFG["input_folder"], import_dbf.CFG["archive_folder"] = input_dir, archive_dir
+    try:
+        import_dbf.import_all_dbf(conn, workers=workers)
+    finally:
+        import_dbf.CFG.update(saved)
+
+
+def table_rows(conn, sql: str) -> list:
+    """Строки выборки кортежами в порядке ORDER BY запроса."""
+    return [tuple(r) for r in conn.execute(sql).fetchall()]
+
+
+RAW_SQL = "SELECT bank_id, form_code, period, item_code, value FROM raw_values ORDER BY 1, 2, 3, 4"
+INDICATOR_SQL = "SELECT bank_id, indicator_id, period, value FROM indicator_values ORDER BY 1, 2, 3"
+CLASSIFICATION_SQL = "SELECT bank_id, period, status, details FROM algo_classifications ORDER BY 1, 2"
+
+
+@pytest.fixture(scope="session")
+def synth(tmp_path_factory):
+    """Каталог с архивами синтетического набора (генерируется один раз за сессию)."""
+    folder = tmp_path_factory.mktemp("synth")
+    generate_dataset(str(folder), **SYNTH)
+    return folder
+
+
+@pytest.fixture(autouse=True)
+def formula_cache(tmp_path_factory, monkeypatch):
+    """Кэш скомпилированных формул — во временном каталоге, а не в data/ проекта."""
+    monkeypatch.setattr(indicators, "FORMULA_CACHE_DIR", str(tmp_path_factory.getbasetemp() / "formula_cache"))
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    if request.param == "duckdb":
+        pytest.importorskip("duckdb")
+    return request.param
+
+
+@pytest.fixture
+def conn(backend, tmp_path):
+    """Пустая БД бэкенда backend со схемой."""
+    conn = open_db(backend, tmp_path)
+    yield conn
+    conn.close()
@@ -0,0 +1,149 @@
+"""
+Один и тот же API поверх SQLite и DuckDB: схема, запись фактов, upsert'ы через
+курсор (эмуляция sqlite3 в duckdb_backend) и конвейер импорт → индикаторы →
+классификация на синтетическом наборе. Каждый тест с фикстурой conn/backend
+выполняется на обоих бэкендах; test_backends_agree сравнивает их результаты.
+"""
+import pandas as pd
+import pytest
+
+from conftest import (BACKENDS, CLASSIFICATION_SQL, INDICATOR_SQL, RAW_SQL, import_files, open_db,
+                      table_rows)
+from src.db import (clear_dirty_pairs, data_version, get_dirty_pairs, init_db, write_indicator_values,
+                    write_raw_values)
+from src import report_xls
+from src.indicator_cube import get_series
+from src.indicators import update_indicators
+from src.rules_engine import classify_all
+
+TABLES = ("raw_values", "indicator_values", "algo_classifications", "llm_classifications", "ingestion_log",
+          "ingestion_manifest", "projected_pairs", "dirty_pairs", "data_dictionary", "config_sync",
+          "data_versions", "schema_version")
+
+
+def test_init_db_creates_schema(conn):
+    for table in TABLES:
+        assert conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone() is not None
+    # Повторная инициализация ничего не ломает
+    init_db(conn)
+    assert conn.execute("SELECT COUNT(*) FROM raw_values").fetchone()[0] == 0
+
+
+def test_write_raw_values_upsert(conn):
+    write_raw_values(conn, [("1", "0409101", "2023-01-01", "10207A", 1.5),
+                            ("1", "0409101", "2023-01-01", "20202A", 2.0),
+                            ("2", "0409101", "2023-01-01", "10207A", None)])
+    # Повтор ключа заменяет значение; внутри пакета побеждает последняя строка
+    write_raw_values(conn, [("1", "0409101", "2023-01-01", "10207A", 3.0),
+                            ("2", "0409101", "2023-01-01", "10207A", 4.0),
+                            ("2", "0409101", "2023-01-01", "10207A", 5.0)])
+    conn.commit()
+    assert table_rows(conn, RAW_SQL) == [
+        ("1", "0409101", "2023-01-01", "10207A", 3.0),
+        ("1", "0409101", "2023-01-01", "20202A", 2.0),
+        ("2", "0409101", "2023-01-01", "10207A", 5.0),
+    ]
+
+
+def test_write_indicator_values_upsert_bumps_version(conn):
+    before = data_version(conn, "indicator_values")
+    write_indicator_values(conn, [("1", "QN9", "2023-01-01", 10.0), ("1", "QN9", "2023-02-01", None)])
+    write_indicator_values(conn, [("1", "QN9", "2023-02-01", 12.5)])
+    conn.commit()
+    assert data_version(conn, "indicator_values") == before + 2
+    assert table_rows(conn, INDICATOR_SQL) == [("1", "QN9", "2023-01-01", 10.0), ("1", "QN9", "2023-02-01", 12.5)]
+
+
+def test_cursor_upserts(conn):
+    cur = conn.cursor()
+    sql = ("INSERT OR REPLACE INTO ingestion_manifest(archive, member, sha256, size, form_code, period, rows_loaded) "
+           "VALUES(?,?,?,?,?,?,?)")
+    cur.execute(sql, ("a.zip", "m.dbf", "old", 1, "0409101", "2023-01-01", 5))
+    cur.execute(sql, ("a.zip", "m.dbf", "new", 2, "0409101", "2023-01-01", 7))
+    cur.executemany("INSERT OR IGNORE INTO dirty_pairs(bank_id, period) VALUES(?,?)",
+                    [("1", "2023-01-01"), ("2", "2023-01-01"), ("1", "2023-01-01")])
+    cur.executemany("INSERT OR IGNORE INTO banks(bank_id, bank_name) VALUES(?,?)", [("1", None), ("2", None)])
+    cur.executemany("UPDATE banks SET bank_name=? WHERE bank_id=?", [("Банк 1", "1"), ("Банк 2", "2")])
+    conn.commit()
+    # IS ? (сравнение с NULL) работает на обоих бэкендах
+    cur.execute("SELECT sha256, rows_loaded FROM ingestion_manifest WHERE archive=? AND form_code IS ? AND period IS ?",
+                ("a.zip", "0409101", "2023-01-01"))
+    assert cur.fetchall() == [("new", 7)]
+    assert [tuple(p) for p in get_dirty_pairs(conn)] == [("1", "2023-01-01"), ("2", "2023-01-01")]
+    clear_dirty_pairs(conn, [("1", "2023-01-01")])
+    assert [tuple(p) for p in get_dirty_pairs(conn)] == [("2", "2023-01-01")]
+    assert table_rows(conn, "SELECT bank_id, bank_name FROM banks ORDER BY 1") == [("1", "Банк 1"), ("2", "Банк 2")]
+
+
+_PIPELINES = {}
+
+
+@pytest.fixture
+def pipeline(synth, tmp_path_factory):
+    """pipeline(backend) -> {имя: строки} raw_values, indicator_values и algo_classifications
+    после import → calc-indicators → classify (считается один раз на бэкенд)."""
+    def run(backend):
+        if backend not in _PIPELINES:
+            workdir = tmp_path_factory.mktemp(f"pipeline_{backend}")
+            conn = open_db(backend, workdir)
+            try:
+                import_files(conn, synth, workdir)
+                update_indicators(conn)
+                classify_all(conn)
+                _PIPELINES[backend] = {"raw": table_rows(conn, RAW_SQL),
+                                       "indicators": table_rows(conn, INDICATOR_SQL),
+                                       "classifications": table_rows(conn, CLASSIFICATION_SQL),
+                                       "dirty": get_dirty_pairs(conn)}
+            finally:
+                conn.close()
+        return _PIPELINES[backend]
+    return run
+
+
+def test_pipeline(backend, pipeline):
+    result = pipeline(backend)
+    pairs = {(b, p) for b, _, p, _, _ in result["raw"]}
+    assert len(pairs) == 6 * 8
+    # Индикаторы и их изменения рассчитаны для каждой пары, dirty_pairs очищены
+    ids = {i for _, i, _, _ in result["indicators"]}
+    assert {"QN9", "QN9_PCT_M1", "QN9_PCT_M6"} <= ids
+    assert {(b, p) for b, _, p, _ in result["indicators"]} == pairs
+    assert result["dirty"] == []
+    assert {(b, p) for b, p, _, _ in result["classifications"]} == pairs
+    assert {s for _, _, s, _ in result["classifications"]} <= {"Green", "Yellow", "Red"}
+
+
+def test_backends_agree(pipeline):
+    for backend in BACKENDS:
+        if backend == "duckdb":
+            pytest.importorskip("duckdb")
+    sqlite, duck = (pipeline(b) for b in BACKENDS)
+    assert sqlite["raw"] == duck["raw"]
+    assert sqlite["classifications"] == duck["classifications"]
+    assert [r[:3] for r in sqlite["indicators"]] == [r[:3] for r in duck["indicators"]]
+    # Суммы по словарю DuckDB складывает в своём порядке — значения равны с точностью до округления
+    assert [r[3] for r in duck["indicators"]] == pytest.approx([r[3] for r in sqlite["indicators"]], rel=1e-9,
+                                                                nan_ok=True)
+
+
+def test_report_summary_pivot_in_duckdb(tmp_path):
+    pytest.importorskip("duckdb")
+    conn = open_db("duckdb", tmp_path)
+    try:
+        write_indicator_values(conn, [
+            ("2", "QN9", "2023-01-01", 1.5), ("1", "QN9", "2023-01-01", 2.0), ("1", "A1", "2023-01-01", -3.0),
+            ("3", "QN9", "2023-01-01", None), ("1", 'X"Y', "2023-01-01", 4.0), ("1", "QN9", "2023-02-01", 9.0),
+            ("2", "NULLS", "2023-01-01", None), ("4", "A1", "2023-01-01", 0.0)])
+        conn.executemany("INSERT INTO banks(bank_id, bank_name) VALUES(?,?)", [("1", "Банк 1"), ("2", None)])
+        conn.execute("INSERT INTO algo_classifications(bank_id, period, status, details) VALUES(?,?,?,?)",
+                     ("1", "2023-01-01", "Red", "Red SET #1: выполнен один из наборов"))
+        conn.execute("INSERT INTO llm_classifications(bank_id, period, status, reasoning, model) VALUES(?,?,?,?,?)",
+                     ("2", "2023-01-01", "Yellow", "{}", "m"))
+        conn.commit()
+        ind = get_series(conn, None, None, ("2023-01-01", "2023-01-01")).frame()[["bank_id", "indicator_id", "value"]]
+        # Широкая таблица строится в DuckDB и совпадает с pivot_table pandas
+        in_db = report_xls._summary_sql(conn, "2023-01-01")
+        pd.testing.assert_frame_equal(in_db, report_xls._summary_pandas(conn, "2023-01-01", ind), check_dtype=False)
+        assert list(in_db.columns[2:5]) == ["A1", "QN9", 'X"Y'] and list(in_db["bank_id"]) == ["1", "2", "4"]
+    finally:
+        conn.close()
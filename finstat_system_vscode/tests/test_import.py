@@ -0,0 +1,205 @@
+"""
+Импорт DBF/архивов: пакетная запись BulkLoader при последовательном и параллельном
+импорте даёт одно и то же содержимое БД.
+
+Однопроходный разбор членов архива (_scan_members) и план разбора формы
+(_RecordPlan) дают те же строки, наименования банков и карту A/P, что и
+построчный разбор через dbfread.
+"""
+import os
+import zipfile
+
+from dbfread import DBF
+
+from benchmarks.synth_dataset import generate_dataset, write_dbf
+from conftest import RAW_SQL, SYNTH, import_files, open_db, table_rows
+from src import import_dbf
+from src.db import get_dirty_pairs
+from src.dbf_reader import RelaxedFieldParser
+from src.import_dbf import (_RowBatch, _close_tables, _decode_dbf_file, _detect_form_period, _guess_field,
+                            _scan_members, _to_float)
+
+IMPORT_SQL = {
+    "raw": RAW_SQL,
+    "banks": "SELECT bank_id, bank_name FROM banks ORDER BY 1",
+    "log": "SELECT file_name, form_code, period, rows_loaded FROM ingestion_log ORDER BY 1",
+    "manifest": "SELECT archive, member, sha256, form_code, period, rows_loaded FROM ingestion_manifest ORDER BY 1, 2",
+}
+
+
+def _import_state(backend, synth, workdir, workers):
+    conn = open_db(backend, workdir)
+    try:
+        import_files(conn, synth, workdir, workers=workers)
+        state = {name: table_rows(conn, sql) for name, sql in IMPORT_SQL.items()}
+        state["dirty"] = [tuple(p) for p in get_dirty_pairs(conn)]
+        return state
+    finally:
+        conn.close()
+
+
+def test_serial_and_parallel_import_match(backend, synth, tmp_path):
+    serial = _import_state(backend, synth, tmp_path / "serial", workers=1)
+    parallel = _import_state(backend, synth, tmp_path / "parallel", workers=2)
+    assert serial["raw"]
+    # Наименования из NAMES.DBF применены ко всем банкам набора
+    assert all(name for bank_id, name in serial["banks"] if bank_id != "UNKNOWN")
+    for name in serial:
+        assert serial[name] == parallel[name], name
+
+
+
+def _reference_rows(path, form_code, conf, encoding, meta, default_item_fields, default_value_fields):
+    """Построчный разбор через dbfread (как до плана разбора _RecordPlan):
+    [(bank_id, item_code, value)] для непустых значений."""
+    table = DBF(path, encoding=encoding, char_decode_errors="ignore", parserclass=RelaxedFieldParser)
+    records = list(table)
+    sample = records[0] if records else {}
+    item_field = conf.get("item_field") or _guess_field(sample, default_item_fields) or "ITEM"
+    value_field = conf.get("value_field") or _guess_field(sample, default_value_fields) or "VALUE"
+    bank_field, ap_field, ap_map = conf.get("bank_field"), conf.get("ap_field"), conf.get("ap_map") or {}
+    out = []
+    for rec in records:
+        bank_id = str(rec.get(bank_field)) if bank_field and bank_field in rec else "UNKNOWN"
+        v = _to_float(rec.get(value_field), encoding)
+        if v is None:
+            continue
+        suffix = ""
+        if ap_field and ap_field in rec:
+            ap_raw = rec.get(ap_field)
+            ap = ap_map.get(str(ap_raw).strip() if ap_raw is not None else None)
+            suffix = ap if ap in ("A", "P") else ""
+        item_code = rec.get(item_field)
+        if form_code in ("0409802", "0409803") and not suffix:
+            guess = meta.get((form_code, str(item_code)))
+            suffix = guess if guess in ("A", "P") else ""
+        out.append((bank_id or "UNKNOWN", str(item_code) + suffix, v))
+    return out
+
+
+def _reference_meta(paths):
+    meta = {}
+    for path in paths:
+        name = os.path.basename(path).upper()
+        if not name.startswith(("F802META", "F803META")):
+            continue
+        form_code = "0409802" if name.startswith("F802META") else "0409803"
+        for r in DBF(path, encoding="cp866", char_decode_errors="ignore"):
+            sec, fstr = str(r.get("FSECTION") or "").strip().upper(), str(r.get("FSTR") or "").strip()
+            ap = "A" if "АКТИВ" in sec else "P" if "ПАССИВ" in sec else None
+            if fstr and ap:
+                meta[(form_code, fstr)] = ap
+    return meta
+
+
+def _planned_rows(members, forms_cfg):
+    """Строки всех DBF форм набора members через _scan_members и _RecordPlan."""
+    tables, bank_names, meta = _scan_members(members, forms_cfg, import_dbf.CFG.get("filename_regex"))
+    rows = {}
+    try:
+        for name, table in tables:
+            batch = _RowBatch()
+            _decode_dbf_file(table, name, forms_cfg, import_dbf.CFG.get("filename_regex"), DEFAULT_ITEM_FIELDS,
+                             DEFAULT_VALUE_FIELDS, batch, meta)
+            rows[name] = list(zip(batch.bank_ids, batch.item_codes, batch.values))
+    finally:
+        _close_tables(tables)
+    return rows, bank_names, meta
+
+
+DEFAULT_ITEM_FIELDS = import_dbf.CFG.get("default_item_fields", ["ITEM", "ROW_CODE", "CODE", "ACODE", "STR", "C1"])
+DEFAULT_VALUE_FIELDS = import_dbf.CFG.get("default_value_fields", ["VALUE", "AMOUNT", "SUM", "VAL", "VSEGO", "C3", "IITG"])
+
+
+def test_record_plan_matches_per_record_parsing(synth, tmp_path):
+    forms_cfg = import_dbf.CFG.get("forms", {})
+    with_meta = 0
+    for archive in sorted(os.listdir(synth)):
+        folder = tmp_path / archive
+        with zipfile.ZipFile(os.path.join(str(synth), archive)) as zf:
+            zf.extractall(folder)
+        paths = sorted(str(folder / name) for name in os.listdir(folder))
+        rows, bank_names, meta = _planned_rows([(os.path.basename(p), p) for p in paths], forms_cfg)
+        assert meta == _reference_meta(paths), archive
+        with_meta += bool(meta)
+        for path in paths:
+            name = os.path.basename(path)
+            if name.upper() == "NAMES.DBF":
+                expected = {str(r["REGN"]): str(r["NAME_B"]).strip()
+                            for r in DBF(path, encoding="cp866", parserclass=RelaxedFieldParser)}
+                assert bank_names == expected
+                continue
+            form_code = _detect_form_period(name, forms_cfg, import_dbf.CFG.get("filename_regex"))[1]
+            if not form_code:
+                continue
+            conf = forms_cfg[form_code]
+            assert rows[name] == _reference_rows(path, form_code, conf, conf.get("encoding", "utf-8"), meta,
+                                                 DEFAULT_ITEM_FIELDS, DEFAULT_VALUE_FIELDS), name
+    # Суффиксы A/P из F802META/F803META действительно проверены
+    assert with_meta
+
+
+def test_record_plan_edge_values(tmp_path):
+    # NUL-паддинг, пустые и нечисловые значения, запятая в дробной части, неизвестный признак A/P
+    fields = [("REGN", "N", 6, 0), ("NUM_SC", "C", 8, 0), ("A_P", "C", 1, 0), ("IITG", "C", 12, 0)]
+    records = [(1, "10207", "1", "1 234,5"), (1, "10207", "2", "7\x00\x00"), (2, "20202", "3", "-3.25"),
+               (2, "30102", "9", "0"), (3, "40101", "1", ""), (3, "40102", "2", "abc"), (4, "50101", "1", "8")]
+    path = tmp_path / "012023B1.DBF"
+    path.write_bytes(write_dbf(fields, records))
+    forms_cfg = import_dbf.CFG.get("forms", {})
+    conf = forms_cfg["0409101"]
+    rows, _, _ = _planned_rows([(path.name, str(path))], forms_cfg)
+    expected = _reference_rows(str(path), "0409101", conf, "cp866", {}, DEFAULT_ITEM_FIELDS, DEFAULT_VALUE_FIELDS)
+    assert rows[path.name] == expected
+    assert expected == [("1", "10207A", 1234.5), ("1", "10207P", 7.0), ("2", "20202", -3.25),
+                        ("2", "30102", 0.0), ("4", "50101A", 8.0)]
+
+
+def test_reimport_is_idempotent(backend, synth, tmp_path):
+    conn = open_db(backend, tmp_path)
+    try:
+        import_files(conn, synth, tmp_path)
+        before = table_rows(conn, RAW_SQL)
+        conn.execute("DELETE FROM dirty_pairs")
+        conn.commit()
+        # Те же архивы под прежними именами: манифест их пропускает, пары не отмечаются
+        import_files(conn, synth, tmp_path)
+        assert table_rows(conn, RAW_SQL) == before
+        assert get_dirty_pairs(conn) == []
+    finally:
+        conn.close()
+
+
+def test_changed_member_replaces_previous_rows(backend, synth, tmp_path):
+    conn = open_db(backend, tmp_path)
+    try:
+        import_files(conn, synth, tmp_path)
+        conn.execute("DELETE FROM dirty_pairs")
+        conn.commit()
+        # Исправленный архив 0409101 за февраль под тем же именем: в нём 3 банка из 6
+        fixed = tmp_path / "fixed"
+        generate_dataset(str(fixed), **dict(SYNTH, banks=3, seed=7))
+        archive = "0409101-20230201.zip"
+        for name in os.listdir(fixed):
+            if name != archive:
+                os.remove(fixed / name)
+        with zipfile.ZipFile(fixed / archive) as zf:
+            members = [(name, zf.read(name)) for name in zf.namelist()]
+        rows, _, _ = _planned_rows(members, import_dbf.CFG.get("forms", {}))
+        expected = sorted(set().union(*map(set, rows.values())))
+
+        in_slice = "form_code='0409101' AND period='2023-02-01'"
+        slice_sql = f"SELECT bank_id, item_code, value FROM raw_values WHERE {in_slice} ORDER BY 1, 2"
+        rest_sql = RAW_SQL.replace("ORDER BY", f"WHERE NOT ({in_slice}) ORDER BY")
+        old_banks = {b for b, _, _ in table_rows(conn, slice_sql)}
+        rest = table_rows(conn, rest_sql)
+        import_files(conn, fixed, tmp_path)
+
+        # Срез формы за период — ровно строки нового файла, остальное не тронуто
+        assert table_rows(conn, slice_sql) == expected
+        assert len({b for b, _, _ in expected}) == 3 < len(old_banks)
+        assert table_rows(conn, rest_sql) == rest
+        # Банки прежней версии (в том числе выпавшие из файла) отмечены для пересчёта
+        assert {b for b, _ in get_dirty_pairs(conn)} == old_banks
+    finally:
+        conn.close()
@@ -0,0 +1,85 @@
+"""
+Расчёт индикаторов: шарды пула процессов (workers > 1) и инкрементальный пересчёт
+по dirty_pairs дают те же indicator_values, что последовательный полный расчёт.
+Дисковый кэш формул печатает недопустимые формулы при каждой загрузке.
+"""
+import os
+import shutil
+
+import pytest
+
+from conftest import INDICATOR_SQL, import_files, open_db, synth_periods, table_rows
+from src import indicators
+from src.indicators import calculate_indicators, update_indicators
+
+
+@pytest.fixture
+def loaded(synth, tmp_path):
+    """SQLite-БД с импортированным набором (пул процессов работает только с файлом SQLite)."""
+    conn = open_db("sqlite", tmp_path)
+    import_files(conn, synth, tmp_path)
+    yield conn
+    conn.close()
+
+
+def test_workers_match_serial(loaded):
+    calculate_indicators(loaded, workers=1)
+    serial = table_rows(loaded, INDICATOR_SQL)
+    loaded.execute("DELETE FROM indicator_facts")
+    loaded.commit()
+    calculate_indicators(loaded, workers=2)
+    assert serial
+    assert table_rows(loaded, INDICATOR_SQL) == serial
+
+
+def test_workers_match_serial_for_pairs_and_indicators(loaded):
+    pairs = [(b, p) for b, p in loaded.execute("SELECT DISTINCT bank_id, period FROM raw_values").fetchall()][::2]
+    calculate_indicators(loaded, pairs=pairs, indicators=["QN9", "QN13", "QN17"], workers=1)
+    serial = table_rows(loaded, INDICATOR_SQL)
+    loaded.execute("DELETE FROM indicator_facts")
+    loaded.commit()
+    calculate_indicators(loaded, pairs=pairs, indicators=["QN9", "QN13", "QN17"], workers=2)
+    assert {i for _, i, _, _ in serial} == {"QN9", "QN13", "QN17"}
+    assert table_rows(loaded, INDICATOR_SQL) == serial
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_incremental_update_matches_full(backend, synth, tmp_path, workers):
+    periods = synth_periods(synth)
+    # Сначала без одного месяца в середине и двух последних, затем остальное
+    late = {periods[2]} | set(periods[-2:])
+    incremental = open_db(backend, tmp_path / "incremental")
+    full = open_db(backend, tmp_path / "full")
+    try:
+        import_files(incremental, synth, tmp_path / "incremental", periods=set(periods) - late)
+        update_indicators(incremental, workers=workers)
+        import_files(incremental, synth, tmp_path / "incremental", periods=late)
+        update_indicators(incremental, workers=workers)
+
+        import_files(full, synth, tmp_path / "full")
+        update_indicators(full, full=True)
+        assert table_rows(incremental, INDICATOR_SQL) == table_rows(full, INDICATOR_SQL)
+    finally:
+        incremental.close()
+        full.close()
+
+
+
+def test_formula_cache_prints_invalid_on_every_load(tmp_path, capsys, monkeypatch):
+    path = tmp_path / "indicators.yaml"
+    path.write_text('A: "s1 + s2"\nB: "s1 + s2 + s3"\nC: "D + 1"\nD: "C * 2"\nE: "s1 +"\n', encoding="utf-8")
+    monkeypatch.setattr(indicators, "FORMULA_CACHE_DIR", str(tmp_path / "cache"))
+    loads = []
+    # Компиляция в процессе пула, затем в основном процессе (кэш сброшен) и загрузка из кэша
+    for worker, cached in ((True, False), (False, False), (False, True)):
+        monkeypatch.setattr(indicators.multiprocessing, "parent_process", lambda: object() if worker else None)
+        if not cached:
+            shutil.rmtree(tmp_path / "cache", ignore_errors=True)
+        codes = indicators._load_formula_codes(str(path))
+        loads.append(capsys.readouterr().out)
+    assert codes["C"][0] is None and codes["E"][0] is None and codes["A"][0] is not None
+    assert os.listdir(tmp_path / "cache")
+    # Недопустимые формулы и циклы — при каждой загрузке, в том числе из кэша и в процессе пула
+    assert all("Недопустимые формулы" in out and "циклическая ссылка" in out and "E (" in out for out in loads)
+    # Сводка оптимизатора — только при компиляции в основном процессе
+    assert ["Слагаемых в линейных формулах" in out for out in loads] == [False, True, False]
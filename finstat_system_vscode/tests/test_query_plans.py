@@ -0,0 +1,75 @@
+"""
+Регрессия планов HOT_QUERIES (check_query_plans, команда check-plans): ни одна
+типовая выборка не должна читать таблицу фактов полным сканированием. Снятый
+индекс по периоду или переписанный запрос роняют тест, а не только ручную проверку.
+"""
+import sqlite3
+
+import pytest
+
+from conftest import import_files, open_db
+from src.db import check_query_plans, finalize_bulk_load, init_db, schema_version, MIGRATIONS, SCHEMA_SQL
+from src.indicators import update_indicators
+
+
+def test_fresh_schema_has_no_fact_scans():
+    assert check_query_plans() == {}
+
+
+def test_migrated_file_db_has_no_fact_scans(tmp_path):
+    conn = open_db("sqlite", tmp_path)
+    try:
+        assert schema_version(conn) == max(v for v, _, _ in MIGRATIONS)
+        assert check_query_plans(conn) == {}
+    finally:
+        conn.close()
+
+
+def test_plans_after_analyze_on_loaded_db(synth, tmp_path):
+    # Со статистикой ANALYZE планировщик выбирает планы по данным — сканирований быть не должно
+    conn = open_db("sqlite", tmp_path)
+    try:
+        import_files(conn, synth, tmp_path)
+        update_indicators(conn)
+        finalize_bulk_load(conn)
+        assert check_query_plans(conn) == {}
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("index, queries", [
+    ("ix_raw_facts_period", {"latest_period", "raw_by_period"}),
+    ("ix_indicator_facts_period", {"peer_values", "indicator_window"}),
+])
+def test_dropped_period_index_is_reported(index, queries):
+    conn = sqlite3.connect(":memory:")
+    init_db(conn)
+    conn.execute(f"DROP INDEX {index}")
+    assert queries <= set(check_query_plans(conn))
+    conn.close()
+
+
+def test_v1_covering_raw_index_is_replaced(tmp_path):
+    # БД, где применены миграции до 4: ix_raw_facts_period со всеми столбцами raw_facts
+    path = str(tmp_path / "v4.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA_SQL)
+    for version, description, sql in MIGRATIONS[:4]:
+        conn.executescript(sql)
+        conn.execute("INSERT INTO schema_version(version, description) VALUES(?,?)", (version, description))
+    conn.commit()
+    init_db(conn)
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE name='ix_raw_facts_period'").fetchone()[0]
+    assert sql.endswith("raw_facts(period_key)")
+    assert check_query_plans(conn) == {}
+    conn.close()
+
+
+def test_duckdb_is_rejected(tmp_path):
+    pytest.importorskip("duckdb")
+    conn = open_db("duckdb", tmp_path)
+    try:
+        with pytest.raises(ValueError):
+            check_query_plans(conn)
+    finally:
+        conn.close()
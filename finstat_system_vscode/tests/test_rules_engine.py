@@ -0,0 +1,152 @@
+"""
+Классификация по наборам rules.yaml: матричная проверка classify_all на кубе и на
+выборке indicator_values совпадает с построчной проверкой каждой пары банк×период.
+"""
+import pytest
+
+from conftest import CLASSIFICATION_SQL, import_files, open_db, table_rows
+from src import rules_engine
+from src.indicator_cube import open_cube, refresh_cube
+from src.db import write_indicator_values
+from src.indicators import update_indicators
+
+# Наборы, которые на синтетическом наборе дают все три статуса; NOPE_X — индикатора нет
+RULES_YAML = """
+yellow_sets:
+  - QN9_PCT_M1: "< 0"
+    O1_PCT_M1: "between 5, -5"
+  - QN13_PCT_M1: ">= 0"
+  - QN11_PCT_M6: "<= 3"
+    NOPE_X: "> 0"
+red_sets:
+  - QN9_PCT_M1: "< -2"
+    QN15_PCT_M1: "> 0"
+  - A1_PCT_M6: "> 1"
+"""
+
+
+@pytest.fixture
+def classified(synth, tmp_path):
+    """SQLite-БД с импортом и рассчитанными индикаторами."""
+    conn = open_db("sqlite", tmp_path)
+    import_files(conn, synth, tmp_path)
+    update_indicators(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(params=["configs", "synthetic"])
+def rules(request, tmp_path, monkeypatch):
+    """rules.yaml проекта или синтетические наборы (подменяется CFG_DIR rules_engine)."""
+    if request.param == "synthetic":
+        (tmp_path / "rules.yaml").write_text(RULES_YAML, encoding="utf-8")
+        monkeypatch.setattr(rules_engine, "CFG_DIR", str(tmp_path))
+    return request.param
+
+
+def _reference(conn, pairs=None):
+    """Построчная проверка наборов для каждой пары (как до матричной классификации)."""
+    compiled = rules_engine._compile_rules(rules_engine.os.path.join(rules_engine.CFG_DIR, "rules.yaml"))
+    values = {}
+    for bank_id, indicator_id, period, value in conn.execute(
+            "SELECT bank_id, indicator_id, period, value FROM indicator_values").fetchall():
+        values.setdefault((bank_id, period), {})[indicator_id] = value
+    out = []
+    for pair in sorted(values):
+        if pairs is not None and pair not in pairs:
+            continue
+        status, details, closest = "Green", "", None
+        for key, level in (("red_sets", "Red"), ("yellow_sets", "Yellow")):
+            for n, (indicators, conditions) in enumerate(compiled.get(key, [])):
+                failing = [(ind, cond) for ind, cond in zip(indicators, conditions)
+                           if not _holds(values[pair].get(ind), cond)]
+                if not failing and status == "Green":
+                    status, details = level, f"{level} SET #{n + 1}: выполнен один из наборов"
+                # Ближайший набор — меньше всего невыполненных условий, при равенстве — первый
+                if failing and (closest is None or len(failing) < closest[0]):
+                    closest = (len(failing), level, n, *failing[0])
+        if status == "Green" and closest is not None:
+            _, level, n, ind, cond = closest
+            details = f"Green: ближе всего {level} SET #{n + 1}, не выполнено {ind} {_text(cond)}"
+            if values[pair].get(ind) is None:
+                details += " (нет значения)"
+        out.append(pair + (status, details))
+    return out
+
+
+def _text(cond):
+    if cond[0] == "cmp":
+        return f"{cond[1]} {cond[2]:g}"
+    return f"between {cond[1]:g}, {cond[2]:g}"
+
+
+def _holds(value, cond):
+    if value is None:
+        return False
+    if cond[0] == "cmp":
+        op, thr = cond[1], cond[2]
+        return {"<": value < thr, "<=": value <= thr, ">": value > thr, ">=": value >= thr}[op]
+    return cond[1] <= value <= cond[2]
+
+
+def _classify(conn, pairs=None):
+    conn.execute("DELETE FROM algo_classifications")
+    conn.commit()
+    rules_engine.classify_all(conn, pairs)
+    return table_rows(conn, CLASSIFICATION_SQL)
+
+
+def test_cube_and_sql_paths_match_reference(classified, rules, monkeypatch):
+    assert refresh_cube(classified) and open_cube(classified) is not None
+    on_cube = _classify(classified)
+    monkeypatch.setattr(rules_engine, "open_cube", lambda conn: None)
+    on_sql = _classify(classified)
+    assert on_cube == on_sql == _reference(classified)
+    if rules == "synthetic":
+        assert {s for _, _, s, _ in on_cube} == {"Green", "Yellow", "Red"}
+
+
+def test_pairs_scope_matches_reference(classified, rules, monkeypatch):
+    pairs = [(b, p) for b, p, _, _ in _reference(classified)][1::3] + [("nobank", "2023-01-01")]
+    refresh_cube(classified)
+    on_cube = _classify(classified, pairs)
+    monkeypatch.setattr(rules_engine, "open_cube", lambda conn: None)
+    assert on_cube == _classify(classified, pairs) == _reference(classified, set(pairs))
+
+
+def test_duckdb_matches_reference(synth, tmp_path, rules):
+    pytest.importorskip("duckdb")
+    conn = open_db("duckdb", tmp_path)
+    try:
+        import_files(conn, synth, tmp_path)
+        update_indicators(conn)
+        assert _classify(conn) == _reference(conn)
+    finally:
+        conn.close()
+
+
+def test_no_indicators(conn):
+    rules_engine.classify_all(conn)
+    assert table_rows(conn, CLASSIFICATION_SQL) == []
+
+
+def test_boundaries_and_missing_values(conn, tmp_path, monkeypatch):
+    (tmp_path / "rules.yaml").write_text(
+        'yellow_sets:\n  - X: "between 5, -5"\n    Y: "<= 0"\nred_sets:\n  - X: "< -5"\n  - Z: ">= 1"\n',
+        encoding="utf-8")
+    monkeypatch.setattr(rules_engine, "CFG_DIR", str(tmp_path))
+    write_indicator_values(conn, [
+        ("1", "X", "2023-01-01", -5.0), ("1", "Y", "2023-01-01", 0.0),    # границы включаются -> Yellow
+        ("2", "X", "2023-01-01", 5.0), ("2", "Y", "2023-01-01", None),    # пустое значение не выполняет условие
+        ("3", "X", "2023-01-01", -5.5), ("3", "Y", "2023-01-01", 0.0),    # Red важнее Yellow
+        ("4", "Z", "2023-01-01", 1.0),                                    # >= на границе -> Red
+        ("5", "W", "2023-01-01", 1.0),                                    # нет индикаторов правил -> Green
+    ])
+    conn.commit()
+    assert _classify(conn) == _reference(conn) == [
+        ("1", "2023-01-01", "Yellow", "Yellow SET #1: выполнен один из наборов"),
+        ("2", "2023-01-01", "Green", "Green: ближе всего Red SET #1, не выполнено X < -5"),
+        ("3", "2023-01-01", "Red", "Red SET #1: выполнен один из наборов"),
+        ("4", "2023-01-01", "Red", "Red SET #2: выполнен один из наборов"),
+        ("5", "2023-01-01", "Green", "Green: ближе всего Red SET #1, не выполнено X < -5 (нет значения)"),
+    ]